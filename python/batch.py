@@ -0,0 +1,315 @@
+import gflags
+import json
+import resource
+import sys
+import time
+import traceback
+
+from functools import partial
+from itertools import imap
+from multiprocessing import Pool
+
+from stnu import NamedStnu, network_files
+from fast_dc import DcTester, ENGINES
+from instrumentation import Instrumentation
+from result_cache import ResultCache, file_fingerprint
+
+gflags.DEFINE_integer('processes', 1, 'Number of worker processes checking networks')
+gflags.DEFINE_enum('engine', 'incremental', ENGINES.keys(), 'DC checking engine')
+gflags.DEFINE_string('output', '-', 'File to write JSONL results to (- for stdout)')
+gflags.DEFINE_boolean('cache', False, 'Cache XML networks in binary format next to them')
+gflags.DEFINE_boolean('instrument', False, 'Add summary of solver phases to results')
+gflags.DEFINE_integer('result_cache_size', 0,
+                      'Number of results every process keeps in memory to answer '
+                      'repeated networks (0 for no result cache)')
+gflags.DEFINE_string('result_cache_dir', None,
+                     'Directory with results of earlier checks, shared between runs')
+gflags.DEFINE_boolean('decompose', False,
+                      'Check independent components of networks separately')
+gflags.DEFINE_boolean('simplify', False,
+                      'Collapse rigid components and drop implied bounds before checking')
+gflags.DEFINE_boolean('precheck', False,
+                      'Try cheap tests which decide some networks before solving '
+                      '(the one which decided is in decided_by of results)')
+gflags.DEFINE_integer('memory_budget', None,
+                      'Megabytes of arrays the compact engine keeps in memory, the rest '
+                      'is spilled to memory-mapped files (results of the compact engine '
+                      'have peak_memory_kb of the process). Needs --engine=compact')
+gflags.DEFINE_integer('batch_size', 0,
+                      'Check networks in batches of this many at once, with numpy '
+                      '(see batched_dc; networks too large for it are checked by '
+                      '--engine). 0 to check them one by one. Cannot be combined with '
+                      '--decompose, --simplify or --precheck')
+
+FLAGS = gflags.FLAGS
+
+USAGE = '''Usage: %s [flags] input...
+
+Checks dynamic controllability of many networks in one process. Every input
+is a directory (all .xml, .in and .stnu files in it), a glob pattern, a network
+file (.xml, .in or .stnu) or a manifest (any other file) listing one input per
+line, relative to the manifest. One JSON result per network is written
+as soon as it is checked.'''
+
+# fields of result which are stored in result cache for a file
+CACHED_FIELDS = ['verdict', 'nodes', 'edges', 'controllable_edges', 'uncontrollable_edges']
+
+# (result_cache_size, result_cache_dir) -> ResultCache of this process
+_result_caches = {}
+
+def get_result_cache(size, directory=None):
+    """Returns ResultCache of this process with given parameters, or None
+    if both size is 0 and directory is None."""
+    if not size and directory is None:
+        return None
+    key = (size, directory)
+    if key not in _result_caches:
+        _result_caches[key] = ResultCache(max(size, 1), directory=directory)
+    return _result_caches[key]
+
+def check_file(filename, engine='incremental', cache=False, instrument=False,
+               result_cache=None, decompose=False, simplify=False, precheck=False,
+               memory_budget=None):
+    """Returns result for a single network as a dict. Any failure is
+    reported in the result, so that it does not stop the batch. If
+    instrument is set, summary of the solver's phases is in 'stats'. If
+    precheck is set, what decided the verdict is in 'decided_by' (see
+    DcTester.decided_by). Results of the compact engine have peak resident
+    size of the process so far in 'peak_memory_kb'; memory_budget is its
+    budget in bytes (see compact_dc.CompactDc).
+
+    If result_cache (a ResultCache) is given, results are looked up by
+    contents of the file, without parsing it, and then by fingerprint of
+    the network, without solving it. Such results have 'cached' set to
+    'file' or 'network'."""
+    result = {'file': filename}
+    try:
+        file_key = None
+        if result_cache is not None:
+            file_key = file_fingerprint(filename)
+            cached = result_cache.get(file_key)
+            if cached is not None:
+                result.update(cached)
+                result['cached'] = 'file'
+                return result
+
+        start = time.time()
+        network = NamedStnu()
+        network.read_from_file(filename, cache)
+        result['parse_time'] = time.time() - start
+        result['nodes'] = network.num_nodes
+        result['edges'] = network.num_edges
+        result['controllable_edges'] = len(network.controllable_edges)
+        result['uncontrollable_edges'] = len(network.uncontrollable_edges)
+
+        start = time.time()
+        dc_tester = DcTester(network, engine=engine,
+                             instrumentation=Instrumentation() if instrument else None,
+                             result_cache=result_cache,
+                             decompose=decompose,
+                             simplify=simplify,
+                             precheck=precheck,
+                             memory_budget=memory_budget)
+        result['verdict'] = 'dc' if dc_tester.is_dynamically_controllable() else 'notdc'
+        result['check_time'] = time.time() - start
+        if engine == 'compact':
+            result['peak_memory_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if precheck:
+            result['decided_by'] = dc_tester.decided_by
+        if dc_tester.from_cache:
+            result['cached'] = 'network'
+        if instrument:
+            result['stats'] = dc_tester.summary()
+        if file_key is not None:
+            result_cache.put(file_key, dict((field, result[field]) for field in CACHED_FIELDS))
+    except Exception as e:
+        result['verdict'] = 'error'
+        result['error'] = traceback.format_exception_only(type(e), e)[-1].strip()
+    return result
+
+def check_batch(filenames, cache=False, instrument=False, result_cache=None,
+                engine='incremental', memory_budget=None):
+    """Returns results for filenames, like check_file, checking all the
+    networks at once with BatchedDc. Networks too large for it are
+    checked by engine (with memory_budget, see DcTester). check_time
+    of every result is its share of the time of the whole batch, and
+    stats (if instrument is set) are of the whole batch. If checking the
+    batch fails, its networks are checked one at a time, so that only the
+    ones which fail get an error. Networks are only looked up in
+    result_cache by contents of the file."""
+    from batched_dc import BatchedDc
+
+    if memory_budget is not None and engine != 'compact':
+        raise ValueError('only the compact engine has a memory budget')
+
+    results = []
+    networks = []
+    # results of networks, in order of networks
+    pending = []
+    for filename in filenames:
+        result = {'file': filename}
+        results.append(result)
+        try:
+            file_key = None
+            if result_cache is not None:
+                file_key = file_fingerprint(filename)
+                cached = result_cache.get(file_key)
+                if cached is not None:
+                    result.update(cached)
+                    result['cached'] = 'file'
+                    continue
+
+            start = time.time()
+            network = NamedStnu()
+            network.read_from_file(filename, cache)
+            result['parse_time'] = time.time() - start
+            result['nodes'] = network.num_nodes
+            result['edges'] = network.num_edges
+            result['controllable_edges'] = len(network.controllable_edges)
+            result['uncontrollable_edges'] = len(network.uncontrollable_edges)
+            networks.append(network)
+            pending.append((result, file_key))
+        except Exception as e:
+            result['verdict'] = 'error'
+            result['error'] = traceback.format_exception_only(type(e), e)[-1].strip()
+    if not networks:
+        return results
+
+    fallback = ENGINES[engine]
+    if memory_budget is not None:
+        fallback = partial(fallback, memory_budget=memory_budget)
+    solver = BatchedDc(fallback=fallback)
+    if instrument:
+        solver.stats = Instrumentation()
+    start = time.time()
+    try:
+        verdicts = solver.solve_many(networks)
+    except Exception:
+        verdicts = []
+        for network in networks:
+            try:
+                verdicts.append(solver.solve(network))
+            except Exception as e:
+                verdicts.append(e)
+    check_time = (time.time() - start) / len(networks)
+    for (result, file_key), verdict in zip(pending, verdicts):
+        if isinstance(verdict, Exception):
+            result['verdict'] = 'error'
+            result['error'] = traceback.format_exception_only(type(verdict), verdict)[-1].strip()
+            continue
+        result['verdict'] = 'dc' if verdict else 'notdc'
+        result['check_time'] = check_time
+        if instrument:
+            result['stats'] = solver.stats.summary()
+        if file_key is not None:
+            result_cache.put(file_key, dict((field, result[field]) for field in CACHED_FIELDS))
+    return results
+
+def _check_file_worker(task):
+    (filename, engine, cache, instrument, result_cache_size, result_cache_dir,
+     decompose, simplify, precheck, memory_budget) = task
+    return check_file(filename, engine, cache, instrument,
+                      get_result_cache(result_cache_size, result_cache_dir),
+                      decompose, simplify, precheck, memory_budget)
+
+def _check_batch_worker(task):
+    (filenames, cache, instrument, result_cache_size, result_cache_dir,
+     engine, memory_budget) = task
+    return check_batch(filenames, cache, instrument,
+                       get_result_cache(result_cache_size, result_cache_dir),
+                       engine, memory_budget)
+
+def _batches(filenames, batch_size):
+    batch = []
+    for filename in filenames:
+        batch.append(filename)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def check_files(filenames, engine='incremental', processes=1, cache=False,
+                instrument=False, result_cache_size=0, result_cache_dir=None,
+                batch_size=0, decompose=False, simplify=False, precheck=False,
+                memory_budget=None):
+    """Yields results for filenames as they are checked, by a pool of
+    processes if there is more than one. Every process has its own result
+    cache of result_cache_size entries, and they share result_cache_dir
+    if it is given (see ResultCache). If batch_size is set, files are
+    checked batch_size at a time by check_batch, which does not support
+    decompose, simplify or precheck (ValueError). Only the compact engine
+    takes memory_budget (ValueError)."""
+    if memory_budget is not None and engine != 'compact':
+        raise ValueError('only the compact engine has a memory budget')
+    if batch_size > 0:
+        if decompose or simplify or precheck:
+            raise ValueError('batches cannot be decomposed, simplified or prechecked')
+        worker = _check_batch_worker
+        tasks = ((batch, cache, instrument, result_cache_size, result_cache_dir,
+                  engine, memory_budget)
+                 for batch in _batches(filenames, batch_size))
+    else:
+        worker = _check_file_worker
+        tasks = ((filename, engine, cache, instrument, result_cache_size, result_cache_dir,
+                  decompose, simplify, precheck, memory_budget)
+                 for filename in filenames)
+    pool = None
+    if processes <= 1:
+        outputs = imap(worker, tasks)
+    else:
+        pool = Pool(processes)
+        outputs = pool.imap_unordered(worker, tasks)
+    try:
+        for output in outputs:
+            # batches give lists of results
+            for result in (output if batch_size > 0 else [output]):
+                yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+def main():
+    # flags can be given after the inputs
+    FLAGS.UseGnuGetOpt()
+    try:
+        argv = FLAGS(sys.argv)
+    except gflags.FlagsError as e:
+        print >> sys.stderr, '%s\n%s\n%s' % (e, USAGE % sys.argv[0], FLAGS)
+        sys.exit(1)
+    if len(argv) < 2:
+        print >> sys.stderr, '%s\n%s' % (USAGE % argv[0], FLAGS)
+        sys.exit(1)
+    if FLAGS.batch_size > 0 and (FLAGS.decompose or FLAGS.simplify or FLAGS.precheck):
+        print >> sys.stderr, ('--batch_size cannot be combined with --decompose, '
+                              '--simplify or --precheck\n%s\n%s' % (USAGE % argv[0], FLAGS))
+        sys.exit(1)
+    if FLAGS.memory_budget is not None and FLAGS.engine != 'compact':
+        print >> sys.stderr, ('--memory_budget needs --engine=compact\n%s\n%s'
+                              % (USAGE % argv[0], FLAGS))
+        sys.exit(1)
+
+    output = sys.stdout if FLAGS.output == '-' else open(FLAGS.output, 'w')
+    try:
+        for result in check_files(network_files(argv[1:]),
+                                  FLAGS.engine,
+                                  FLAGS.processes,
+                                  FLAGS.cache,
+                                  FLAGS.instrument,
+                                  FLAGS.result_cache_size,
+                                  FLAGS.result_cache_dir,
+                                  FLAGS.batch_size,
+                                  FLAGS.decompose,
+                                  FLAGS.simplify,
+                                  FLAGS.precheck,
+                                  FLAGS.memory_budget << 20
+                                  if FLAGS.memory_budget is not None else None):
+            output.write(json.dumps(result, sort_keys=True) + '\n')
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == '__main__':
+    main()
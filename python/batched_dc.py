@@ -0,0 +1,200 @@
+import numpy as np
+
+from time import time
+
+from fast_dc import FastDc
+
+# Distances are sums of floats, computed in different orders, so they
+# only count as tightened if they drop by more than this and cycles only
+# count as negative if they are shorter than minus this, relative to the
+# largest bound of the network.
+EPSILON = 1e-9
+
+class BatchedDc(object):
+    """Checks dynamic controllability of many small networks at once,
+    with numpy.
+
+    Networks of a batch are padded to the same number of nodes and
+    contingent links and the labeled distance graph of all of them is
+    kept in arrays:
+        distance - (batch, node, node) ordinary edges, closed under
+                   shortest paths by vectorized Floyd-Warshall
+        upper_case - (batch, node, link) upper case edges, from node to
+                   the activation timepoint of the link, labeled with its
+                   contingent timepoint
+    and tightened by the reductions of "Temporal Dynamic Controllability
+    Revisited" by Paul Morris and Nicola Muscettola (upper case, lower
+    case, cross case and label removal), for the whole batch at a time,
+    until nothing changes (the network is DC) or the AllMax projection
+    gets a negative cycle (it is not). Every round takes O(N^3) for
+    every network, but all of it is done by numpy, which for networks of
+    tens of nodes is much faster than FastDc's loops in Python.
+
+    Networks with more than max_nodes nodes, and ones which are not
+    settled within max_rounds rounds, are checked one by one instead, by
+    solvers made by fallback (FastDc by default, or e.g. one of
+    fast_dc.ENGINES). fallbacks counts them.
+    """
+
+    def __init__(self, batch_size=256, max_nodes=64, max_rounds=None, fallback=FastDc):
+        self.batch_size = batch_size
+        self.max_nodes = max_nodes
+        # by default rounds are limited to the number of nodes
+        self.max_rounds = max_rounds
+        self.fallback = fallback
+        self.fallbacks = 0
+        # Instrumentation recording phases of checks, if any
+        self.stats = None
+
+    def solve(self, network):
+        return self.solve_many([network])[0]
+
+    def solve_many(self, networks):
+        """Returns list of verdicts (True if DC) for networks."""
+        verdicts = [None] * len(networks)
+        small = [i for i, network in enumerate(networks)
+                 if network.num_nodes <= self.max_nodes]
+        # networks of similar size go to the same batch, to limit padding
+        small.sort(key=lambda i: (networks[i].num_nodes,
+                                  len(networks[i].uncontrollable_edges)))
+        for begin in xrange(0, len(small), self.batch_size):
+            batch = small[begin: begin + self.batch_size]
+            for i, verdict in zip(batch, self._solve_batch([networks[i] for i in batch])):
+                verdicts[i] = verdict
+        for i, verdict in enumerate(verdicts):
+            if verdict is None:
+                self.fallbacks += 1
+                solver = self.fallback()
+                solver.stats = self.stats
+                try:
+                    verdicts[i] = solver.solve(networks[i])
+                finally:
+                    solver.close()
+        return verdicts
+
+    def _solve_batch(self, networks):
+        """Returns verdicts of networks, None for ones not settled in time."""
+        start = time()
+        distance, upper_case, activation, contingent, lower, scale = _pack(networks)
+        num_nodes = distance.shape[1]
+        max_rounds = self.max_rounds or num_nodes
+        verdicts = [None] * len(networks)
+        # positions in networks of the ones still in the arrays
+        pending = np.arange(len(networks))
+        rounds = 0
+        while len(pending) > 0 and rounds < max_rounds:
+            rounds += 1
+            _closure(distance)
+            consistent = _allmax_consistent(distance, upper_case, activation, scale)
+            old_distance = distance.copy()
+            old_upper_case = upper_case.copy()
+            _reduce(distance, upper_case, activation, contingent, lower)
+            changed = (_tightened(old_distance, distance, scale) |
+                       _tightened(old_upper_case, upper_case, scale))
+            for i in pending[~consistent]:
+                verdicts[i] = False
+            for i in pending[consistent & ~changed]:
+                verdicts[i] = True
+            keep = consistent & changed
+            if not keep.all():
+                pending = pending[keep]
+                distance = distance[keep]
+                upper_case = upper_case[keep]
+                activation = activation[keep]
+                contingent = contingent[keep]
+                lower = lower[keep]
+                scale = scale[keep]
+        if self.stats is not None:
+            self.stats.record('batch', time() - start, networks=len(networks),
+                              rounds=rounds, unsettled=len(pending))
+        return verdicts
+
+def _pack(networks):
+    """Returns arrays of labeled distance graphs of networks (see
+    BatchedDc), padded to the same size, and activation and contingent
+    timepoints and lower bounds of contingent links as (batch, link)
+    arrays and the largest finite bound of every network. Padding links have
+    infinite lower bounds and no edges, so they never take part in
+    reductions."""
+    inf = float('inf')
+    # node 0 is not used by networks, padding links start and end there
+    num_nodes = max(network.num_nodes for network in networks) + 1
+    num_links = max([len(network.uncontrollable_edges) for network in networks] + [1])
+    batch = len(networks)
+    distance = np.full((batch, num_nodes, num_nodes), inf)
+    distance[:, np.arange(num_nodes), np.arange(num_nodes)] = 0
+    upper_case = np.full((batch, num_nodes, num_links), inf)
+    activation = np.zeros((batch, num_links), dtype=int)
+    contingent = np.zeros((batch, num_links), dtype=int)
+    lower = np.full((batch, num_links), inf)
+    scale = np.ones(batch)
+    for b, network in enumerate(networks):
+        d = distance[b]
+        for e in network.controllable_edges + network.uncontrollable_edges:
+            d[e.fro, e.to] = min(d[e.fro, e.to], e.upper_bound)
+            d[e.to, e.fro] = min(d[e.to, e.fro], -e.lower_bound)
+            # infinite bounds are no constraints, and would make
+            # tolerances infinite
+            for bound in (e.lower_bound, e.upper_bound):
+                if np.isfinite(bound):
+                    scale[b] = max(scale[b], abs(bound))
+        for k, e in enumerate(network.uncontrollable_edges):
+            activation[b, k] = e.fro
+            contingent[b, k] = e.to
+            lower[b, k] = e.lower_bound
+            upper_case[b, e.to, k] = -e.upper_bound
+    return distance, upper_case, activation, contingent, lower, scale
+
+def _closure(distance):
+    """Floyd-Warshall on every matrix of the batch, in place."""
+    for k in xrange(distance.shape[1]):
+        np.minimum(distance, distance[:, :, k, None] + distance[:, None, k, :], out=distance)
+
+def _allmax_consistent(distance, upper_case, activation, scale):
+    """Returns for every network whether its AllMax projection (ordinary
+    and upper case edges, ignoring labels) has no negative cycle."""
+    batch = np.arange(distance.shape[0])
+    allmax = distance.copy()
+    for k in xrange(upper_case.shape[2]):
+        to = activation[:, k]
+        allmax[batch, :, to] = np.minimum(allmax[batch, :, to], upper_case[:, :, k])
+    _closure(allmax)
+    return (allmax.diagonal(axis1=1, axis2=2) >= -EPSILON * scale[:, None]).all(axis=1)
+
+def _reduce(distance, upper_case, activation, contingent, lower):
+    """Applies all the reductions once, in place."""
+    inf = float('inf')
+    batch = np.arange(distance.shape[0])
+    num_links = upper_case.shape[2]
+    for k in xrange(num_links):
+        # upper case: X -> Y ordinary, Y -> A labeled C gives X -> A labeled C
+        upper_case[:, :, k] = np.minimum(
+            upper_case[:, :, k], (distance + upper_case[:, None, :, k]).min(axis=2))
+    for k in xrange(num_links):
+        fro, to, x = activation[:, k], contingent[:, k], lower[:, k, None]
+        # lower case: A -> C lower case x, C -> Y ordinary y < 0 gives
+        # A -> Y ordinary x + y
+        after = distance[batch, to, :]
+        distance[batch, fro, :] = np.minimum(
+            distance[batch, fro, :], x + np.where(after < 0, after, inf))
+        # cross case: A -> C lower case x, C -> B labeled D != C, y < 0
+        # gives A -> B labeled D x + y
+        after = upper_case[batch, to, :]
+        after[:, k] = inf
+        upper_case[batch, fro, :] = np.minimum(
+            upper_case[batch, fro, :], x + np.where(after < 0, after, inf))
+    for k in xrange(num_links):
+        # label removal: X -> A labeled C, value at least -x where x is
+        # the lower bound of the link, holds as an ordinary edge
+        to, x = activation[:, k], lower[:, k, None]
+        values = upper_case[:, :, k]
+        distance[batch, :, to] = np.minimum(
+            distance[batch, :, to], np.where(values >= -x, values, inf))
+
+def _tightened(old, new, scale):
+    """Returns for every network whether any value of new is tighter than
+    in old (by more than EPSILON)."""
+    # old - new is nan where both are infinite
+    with np.errstate(invalid='ignore'):
+        tighter = old - new > EPSILON * scale[:, None, None]
+    return tighter.any(axis=(1, 2))
@@ -0,0 +1,180 @@
+import gflags
+import json
+import os
+import resource
+import sys
+import time
+
+from multiprocessing import Pool
+
+from stnu import NamedStnu, StnuEdge, network_files
+from fast_dc import FastDc, ENGINES
+
+DIR = os.path.dirname(os.path.abspath(__file__))
+CORPORA = [os.path.join(DIR, '..', 'tests', corpus)
+           for corpus in ['hand-crafted', 'raw_xml', 'J10', 'new_xml']]
+
+BENCHMARK_ENGINES = dict(ENGINES, fast=FastDc)
+
+gflags.DEFINE_list('engines', ['fast', 'incremental', 'cubic'],
+                   'Engines to benchmark, out of %s' % ', '.join(sorted(BENCHMARK_ENGINES)))
+gflags.DEFINE_list('scales', ['1'],
+                   'Numbers of copies of every network chained one after another')
+gflags.DEFINE_string('save_baseline', None, 'File to save results to, as a baseline for later runs')
+gflags.DEFINE_string('baseline', None, 'Results of an earlier run to compare against')
+gflags.DEFINE_float('tolerance', 0.25,
+                    'Relative increase of time or memory over baseline which is a regression')
+gflags.DEFINE_float('min_time', 0.05,
+                    'Differences in time below this many seconds are never regressions')
+
+FLAGS = gflags.FLAGS
+
+USAGE = '''Usage: %s [flags] [input...]
+
+Runs DC checking engines over networks (inputs as for batch.py, by default
+all of tests/), each in a fresh process, and reports wall time, peak
+memory, outer iterations and derived edges for every instance.'''
+
+# (metric, is it checked for regressions)
+METRICS = [('wall_time', True),
+           ('peak_memory_kb', True),
+           ('iterations', False),
+           ('derived_edges', False)]
+
+def scale_network(network, copies):
+    """Returns network made of copies of network, every one starting after
+    the previous one ends."""
+    if copies == 1:
+        return network
+    starts = set(e.fro for e in network.controllable_edges + network.uncontrollable_edges)
+    ends = set(e.to for e in network.controllable_edges + network.uncontrollable_edges)
+    first = min(starts - ends or [1])
+    last = max(ends - starts or [network.num_nodes])
+    result = NamedStnu()
+    def copy_node(node, copy):
+        return result.add_node('%s#%d' % (network._inverse_renaming[node], copy))
+    for copy in xrange(copies):
+        for edges, copied_edges in [(network.controllable_edges, result.controllable_edges),
+                                    (network.uncontrollable_edges, result.uncontrollable_edges)]:
+            for e in edges:
+                copied_edges.append(StnuEdge(copy_node(e.fro, copy), copy_node(e.to, copy),
+                                             e.lower_bound, e.upper_bound))
+        if copy > 0:
+            result.controllable_edges.append(StnuEdge(copy_node(last, copy - 1),
+                                                      copy_node(first, copy),
+                                                      0, float('inf')))
+    result.verify_contraints()
+    return result
+
+def run_instance(task):
+    """Checks one network with one engine. Meant to run in a fresh
+    process, so that peak memory is the instance's own."""
+    filename, engine, copies = task
+    result = {'file': os.path.relpath(filename, os.path.join(DIR, '..')),
+              'engine': engine,
+              'scale': copies}
+    try:
+        network = NamedStnu()
+        network.read_from_file(filename)
+        network = scale_network(network, copies)
+        result['nodes'] = network.num_nodes
+        result['edges'] = network.num_edges
+        solver = BENCHMARK_ENGINES[engine]()
+        start = time.time()
+        result['verdict'] = 'dc' if solver.solve(network) else 'notdc'
+        result['wall_time'] = time.time() - start
+        result['peak_memory_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['iterations'] = solver.iterations
+        result['derived_edges'] = solver.derived_edges
+    except Exception as e:
+        result['verdict'] = 'error'
+        result['error'] = '%s: %s' % (type(e).__name__, e)
+    return result
+
+def instance_key(result):
+    return '%s %s x%d' % (result['engine'], result['file'], result['scale'])
+
+def compare(results, baseline, tolerance, min_time):
+    """Returns list of descriptions of regressions of results against
+    baseline (both dicts from instance_key to result)."""
+    regressions = []
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        new, old = results[key], baseline[key]
+        if new['verdict'] != old['verdict']:
+            regressions.append('%s: verdict %s, was %s' % (key, new['verdict'], old['verdict']))
+            continue
+        for metric, checked in METRICS:
+            if not checked or metric not in new or metric not in old:
+                continue
+            if metric == 'wall_time' and new[metric] - old[metric] < min_time:
+                continue
+            if new[metric] > old[metric] * (1 + tolerance):
+                regressions.append('%s: %s %.3f, was %.3f' % (key, metric, new[metric], old[metric]))
+    return regressions
+
+def summarize(results):
+    """Prints total of every metric for every engine and scale."""
+    totals = {}
+    for result in results.values():
+        total = totals.setdefault((result['engine'], result['scale']),
+                                  dict((metric, 0) for metric, _ in METRICS))
+        for metric, _ in METRICS:
+            if metric == 'peak_memory_kb':
+                total[metric] = max(total[metric], result.get(metric, 0))
+            else:
+                total[metric] += result.get(metric, 0)
+    print '%-12s %6s %10s %12s %12s %14s' % ('engine', 'scale', 'time [s]',
+                                            'max mem [kB]', 'iterations', 'derived edges')
+    for (engine, scale), total in sorted(totals.items()):
+        print '%-12s %6d %10.3f %12d %12d %14d' % (engine, scale, total['wall_time'],
+                                                  total['peak_memory_kb'],
+                                                  total['iterations'],
+                                                  total['derived_edges'])
+
+def main():
+    FLAGS.UseGnuGetOpt()
+    try:
+        argv = FLAGS(sys.argv)
+    except gflags.FlagsError as e:
+        print >> sys.stderr, '%s\n%s\n%s' % (e, USAGE % sys.argv[0], FLAGS)
+        sys.exit(1)
+    for engine in FLAGS.engines:
+        if engine not in BENCHMARK_ENGINES:
+            print >> sys.stderr, 'unknown engine %s' % engine
+            sys.exit(1)
+
+    filenames = list(network_files(argv[1:] or CORPORA))
+    tasks = [(filename, engine, int(copies))
+             for copies in FLAGS.scales
+             for engine in FLAGS.engines
+             for filename in filenames]
+    # every instance gets a new process
+    pool = Pool(1, maxtasksperchild=1)
+    try:
+        results = {}
+        for result in pool.imap(run_instance, tasks):
+            results[instance_key(result)] = result
+            if result['verdict'] == 'error':
+                print >> sys.stderr, '%s: %s' % (instance_key(result), result['error'])
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+    summarize(results)
+    if FLAGS.save_baseline is not None:
+        with open(FLAGS.save_baseline, 'w') as output:
+            json.dump(results, output, indent=1, sort_keys=True)
+    if FLAGS.baseline is not None:
+        with open(FLAGS.baseline, 'r') as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  FLAGS.tolerance, FLAGS.min_time)
+        for regression in regressions:
+            print 'REGRESSION %s' % regression
+        if regressions:
+            sys.exit(2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,403 @@
+import numpy as np
+import os
+import resource
+import tempfile
+import weakref
+
+from heapq import heappush, heappop
+from time import time
+
+from fast_dc import FastDc, Edge, EdgeType, EPSILON
+
+
+# Edge of the distance graph as a row; letters and contingent links are
+# numbers of their nodes (nodes are numbered from 1, so 0 is none).
+EDGE_DTYPE = np.dtype([('fro', np.int32), ('to', np.int32), ('value', np.float64),
+                       ('type', np.int8), ('letter', np.int32),
+                       ('contingent', np.int32), ('derived', np.bool_)])
+# outgoing edge in adjacency, which is all that searches look at
+ADJACENCY_DTYPE = np.dtype([('to', np.int32), ('value', np.float64),
+                            ('type', np.int8), ('letter', np.int32)])
+DEFAULT_MEMORY_BUDGET = 256 << 20
+# rows of derived edges added to EdgeTable at a time
+ADD_CHUNK = 1 << 18
+
+class ArrayPool(object):
+    """Allocates arrays in memory while their total size stays within
+    budget (bytes) and in memory-mapped files in directory (the system's
+    temporary one by default) once it would not. Files are removed right
+    away, so they disappear with the arrays."""
+
+    def __init__(self, budget, directory=None):
+        self.budget = budget
+        self.directory = directory
+        # bytes of live arrays in memory and ever spilled to files
+        self.resident = 0
+        self.spilled = 0
+        # id -> weak reference of arrays in memory, which keep track of it
+        self._refs = {}
+
+    def empty(self, size, dtype):
+        dtype = np.dtype(dtype)
+        nbytes = size * dtype.itemsize
+        if nbytes == 0 or self.resident + nbytes <= self.budget:
+            array = np.empty(size, dtype)
+            self.resident += nbytes
+            def release(ref):
+                self.resident -= nbytes
+                del self._refs[id(ref)]
+            ref = weakref.ref(array, release)
+            self._refs[id(ref)] = ref
+            return array
+        fd, path = tempfile.mkstemp(suffix='.edges', dir=self.directory)
+        try:
+            os.close(fd)
+            array = np.memmap(path, dtype, 'w+', shape=(size,))
+        finally:
+            os.remove(path)
+        self.spilled += nbytes
+        return array
+
+class RowBuffer(object):
+    """Growing array of rows of dtype, allocated by pool. Rows added so far
+    are rows[:size]."""
+
+    def __init__(self, pool, dtype=EDGE_DTYPE):
+        self._pool = pool
+        self.rows = pool.empty(1024, dtype)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def clear(self):
+        self.size = 0
+
+    def view(self):
+        return self.rows[:self.size]
+
+    def append(self, rows):
+        if self.size + len(rows) > len(self.rows):
+            grown = self._pool.empty(max(2 * len(self.rows), self.size + len(rows)),
+                                     self.rows.dtype)
+            grown[:self.size] = self.rows[:self.size]
+            self.rows = grown
+        self.rows[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+class EdgeTable(RowBuffer):
+    """Edges of the distance graph as rows of EDGE_DTYPE, keeping only the
+    tightest edge for every key like EdgeStore (of two equally tight ones,
+    the first added). Rows and their keys, in sorted order, are arrays of
+    pool, so they take tens of bytes per edge instead of hundreds."""
+
+    def __init__(self, num_nodes, pool):
+        super(EdgeTable, self).__init__(pool)
+        self._base = num_nodes + 1
+        if 4 * self._base ** 3 >= 2 ** 63:
+            raise ValueError('too many nodes for EdgeTable: %d' % num_nodes)
+        # keys of rows in sorted order and positions of their rows
+        self._keys = pool.empty(0, np.int64)
+        self._positions = pool.empty(0, np.int64)
+
+    def _key(self, rows):
+        base = self._base
+        return (((rows['fro'].astype(np.int64) * base + rows['to']) * 4 +
+                 rows['type']) * base + rows['letter'])
+
+    def add(self, candidates):
+        """Adds rows of candidates (array of EDGE_DTYPE) which are not
+        dominated by edges already in the table or earlier in candidates,
+        and returns the ones which changed it."""
+        if len(candidates) == 0:
+            return candidates
+        keys = self._key(candidates)
+        # tightest candidate for every key (lexsort is stable)
+        order = np.lexsort((candidates['value'], keys))
+        keys = keys[order]
+        first = np.ones(len(order), np.bool_)
+        first[1:] = keys[1:] != keys[:-1]
+        keys = keys[first]
+        best = candidates[order[first]]
+
+        where = np.searchsorted(self._keys, keys)
+        found = where < len(self._keys)
+        found[found] = self._keys[where[found]] == keys[found]
+        positions = self._positions[where[found]]
+        tighter = best['value'][found] < self.rows['value'][positions]
+        replaced = best[found][tighter]
+        self.rows[positions[tighter]] = replaced
+
+        added = best[~found]
+        self.append(added)
+        self._insert_keys(keys[~found], np.arange(self.size - len(added), self.size))
+        return np.concatenate((replaced, added))
+
+    def _insert_keys(self, keys, positions):
+        """Merges sorted keys (none of which is there yet) into the index."""
+        if len(keys) == 0:
+            return
+        size = len(self._keys) + len(keys)
+        destination = np.searchsorted(self._keys, keys) + np.arange(len(keys))
+        old = np.ones(size, np.bool_)
+        old[destination] = False
+        merged_keys = self._pool.empty(size, np.int64)
+        merged_positions = self._pool.empty(size, np.int64)
+        merged_keys[old] = self._keys
+        merged_keys[destination] = keys
+        merged_positions[old] = self._positions
+        merged_positions[destination] = positions
+        self._keys, self._positions = merged_keys, merged_positions
+
+    def lower_case_edges(self):
+        rows = self.view()
+        return rows[rows['type'] == EdgeType.LOWER_CASE]
+
+    def edge(self, position):
+        """Edge object of row at position."""
+        row = self.rows[position]
+        return Edge(int(row['fro']), int(row['to']), float(row['value']), int(row['type']),
+                    int(row['letter']) or None, int(row['contingent']) or None,
+                    bool(row['derived']))
+
+class _Rows(object):
+    """Outgoing edges of every node as lists of one field of adjacency,
+    sliced out when they are asked for."""
+
+    def __init__(self, starts, column):
+        self._starts = starts
+        self._column = column
+
+    def __getitem__(self, node):
+        return self._column[self._starts[node]:self._starts[node + 1]].tolist()
+
+class _PairEdges(object):
+    """(fro, to) -> tightest edge of adjacency between them, as Edge."""
+
+    def __init__(self, adjacency):
+        self._adjacency = adjacency
+
+    def __getitem__(self, pair):
+        adjacency = self._adjacency
+        fro, to = pair
+        begin, end = adjacency.starts[fro], adjacency.starts[fro + 1]
+        candidates = np.flatnonzero(adjacency.rows['to'][begin:end] == to)
+        if len(candidates) == 0:
+            raise KeyError(pair)
+        values = adjacency.rows['value'][begin:end][candidates]
+        return adjacency.table.edge(adjacency.positions[begin + candidates[np.argmin(values)]])
+
+class Adjacency(object):
+    """Outgoing edges of every node (all but lower case edges), built once
+    per iteration from EdgeTable and shared by allmax and searches of all
+    the lower case edges. Outgoing edges of node are rows[starts[node]:
+    starts[node + 1]], which come from rows positions[...] of table.
+    Works as an AllmaxGraph for FastDc.spfa: parallel edges do no harm
+    there, negative cycles are made of the tightest ones."""
+
+    def __init__(self, table, num_nodes, pool):
+        self.table = table
+        self.num_nodes = num_nodes
+        edges = table.view()
+        selected = np.flatnonzero(edges['type'] != EdgeType.LOWER_CASE)
+        froms = edges['fro'][selected]
+        order = np.argsort(froms, kind='mergesort')
+        self.positions = pool.empty(len(selected), np.int64)
+        self.positions[:] = selected[order]
+        self.rows = pool.empty(len(selected), ADJACENCY_DTYPE)
+        for field in ADJACENCY_DTYPE.names:
+            self.rows[field] = edges[field][self.positions]
+        self.starts = np.searchsorted(froms[order], np.arange(num_nodes + 2)).tolist()
+        self.neighbors = _Rows(self.starts, self.rows['to'])
+        self.weights = _Rows(self.starts, self.rows['value'])
+        self.edges = _PairEdges(self)
+
+def _reduce(type1, letter1, type2, letter2, value2, new_value):
+    """(type, letter) of reduction of edge of type1 and letter1 followed by
+    one of type2, letter2 and value2, adding up to new_value, or None
+    (like FastDc.reduce_edge)."""
+    if type1 == EdgeType.SIMPLE and type2 == EdgeType.UPPER_CASE:
+        result = (EdgeType.UPPER_CASE, letter2)
+    elif type1 == EdgeType.LOWER_CASE and type2 == EdgeType.SIMPLE and value2 < 0:
+        result = (EdgeType.SIMPLE, 0)
+    elif (type1 == EdgeType.LOWER_CASE and type2 == EdgeType.UPPER_CASE and
+            value2 < 0 and letter1 != letter2):
+        result = (EdgeType.UPPER_CASE, letter2)
+    elif type1 == EdgeType.SIMPLE and type2 == EdgeType.SIMPLE:
+        result = (EdgeType.SIMPLE, 0)
+    else:
+        return None
+    if result[0] == EdgeType.UPPER_CASE and new_value >= 0:
+        # label removal
+        result = (EdgeType.SIMPLE, 0)
+    return result
+
+class CompactDc(FastDc):
+    """FastDc for networks whose graph does not fit in memory as Edge
+    objects. Edges are rows of an EdgeTable and every iteration builds
+    one Adjacency of them, which allmax and searches of all the lower
+    case edges share. Arrays within memory_budget (bytes) are kept in
+    memory, the rest is spilled to memory-mapped files in spill_dir
+    (see ArrayPool), whose pages the system can take back when it runs
+    short. What has to stay in memory is the per-node lists of the
+    searches.
+
+    Unlike FastDc, every lower case edge is searched in every iteration
+    (keeping the regions of semi-naive evaluation would take memory per
+    lower case edge and node) and searches run in this process. Derived
+    edges are not kept (edges is always None). peak_memory_kb is the peak
+    resident size of the process after the last check, which is recorded
+    in stats as well, together with spilled_bytes.
+
+    Has the same interface as IncrementalDc, but checks from scratch."""
+
+    def __init__(self, processes=1, memory_budget=DEFAULT_MEMORY_BUDGET, spill_dir=None):
+        super(CompactDc, self).__init__(processes)
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.network = None
+        self.peak_memory_kb = None
+        self._is_dc = None
+
+    def solve(self, network):
+        self.network = network
+        return self.rebuild()
+
+    def rebuild(self):
+        pool = ArrayPool(self.memory_budget, self.spill_dir)
+        try:
+            self._is_dc = self._solve_compact(pool)
+        finally:
+            self.peak_memory_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if self.stats is not None:
+                self.stats.set('peak_memory_kb', self.peak_memory_kb)
+                self.stats.set('spilled_bytes', pool.spilled)
+        return self._is_dc
+
+    def tighten(self, stnu_edges):
+        if not self._is_dc:
+            # adding constraints never makes network DC
+            return False
+        return self.rebuild()
+
+    def _solve_compact(self, pool):
+        network = self.network
+        K = len(network.uncontrollable_edges)
+        num_nodes, base_edges = self.generate_graph(network)
+        self.negative_cycle = None
+        self.iterations = self.derived_edges = 0
+        if self.stats is not None:
+            self.stats.set('K', K)
+        table = EdgeTable(num_nodes, pool)
+        rows = np.array([(e.fro, e.to, e.value, e.type, e.maybe_letter or 0,
+                          e.contingent or 0, e.derived) for e in base_edges],
+                        EDGE_DTYPE)
+        del base_edges
+        new_edges = table.add(rows)
+        del rows
+        lc_edges = table.lower_case_edges().tolist()
+        potentials = None
+        completed_iterations = 0
+        while len(new_edges) > 0 and completed_iterations <= K:
+            start = time()
+            adjacency = Adjacency(table, num_nodes, pool)
+            changed = new_edges[new_edges['type'] != EdgeType.LOWER_CASE]
+            consistent, potentials = self.allmax(adjacency, potentials,
+                                                 np.unique(changed['fro']).tolist())
+            if not consistent:
+                return False
+            by_potential = sorted(xrange(1, num_nodes + 1), key=potentials.__getitem__)
+            # Derived edges go to the table a chunk at a time, which bounds
+            # the temporary arrays of EdgeTable.add; the adjacency searched
+            # is a copy, so it does not change.
+            reduced = RowBuffer(pool)
+            num_reduced = 0
+            added = []
+            for i, lc_edge in enumerate(lc_edges):
+                reduced.append(np.array(self._reduce_lower_case(adjacency, potentials,
+                                                                by_potential, lc_edge),
+                                        EDGE_DTYPE))
+                if len(reduced) >= ADD_CHUNK or i == len(lc_edges) - 1:
+                    added.append(table.add(reduced.view()))
+                    num_reduced += len(reduced)
+                    reduced.clear()
+            del adjacency, reduced
+            new_edges = np.concatenate(added) if added else np.empty(0, EDGE_DTYPE)
+            completed_iterations += 1
+            self.iterations += 1
+            self.derived_edges += len(new_edges)
+            self._record_iteration(start, num_reduced, len(new_edges), len(lc_edges))
+        assert completed_iterations <= K+1
+        return True
+
+    def _reduce_lower_case(self, adjacency, potentials, by_potential, lc_edge):
+        """FastDc.reduce_lower_case over adjacency, for lc_edge given as
+        a row of EDGE_DTYPE (as a tuple). Returns tuples of derived edges,
+        the tightest for every key."""
+        start = time()
+        lc_fro, source, lc_value, _, letter, _, _ = lc_edge
+        num_nodes = adjacency.num_nodes
+        rows = adjacency.rows
+        starts = adjacency.starts
+        # path from source to node, as (type, letter, value)
+        path = [None] * (num_nodes + 1)
+        distance = [None] * (num_nodes + 1)
+        visited = [False] * (num_nodes + 1)
+        # (to, type, letter) -> value of the tightest edge derived
+        new_edges = {}
+
+        distance[source] = 0
+        source_potential = potentials[source]
+        lowest = 0
+        cutoff = source_potential + EPSILON * (1 + abs(source_potential))
+
+        q = [(0, source)]
+        pops = moats = 0
+
+        while q:
+            node_distance, node = heappop(q)
+            if visited[node]:
+                continue
+            while visited[by_potential[lowest]]:
+                lowest += 1
+            if node_distance + potentials[by_potential[lowest]] > cutoff:
+                break
+            pops += 1
+            visited[node] = True
+            node_path = path[node]
+            node_potential = potentials[node]
+            for to, value, type, edge_letter in rows[starts[node]:starts[node + 1]].tolist():
+                if type == EdgeType.UPPER_CASE and edge_letter == letter:
+                    # the contingent link of lc_edge cannot be waited for
+                    continue
+                new_distance = distance[node] + (value + node_potential - potentials[to])
+                if distance[to] is None or distance[to] > new_distance:
+                    if node_path is None:
+                        new_path = (type, edge_letter, value)
+                    else:
+                        path_value = node_path[2] + value
+                        reduction = _reduce(node_path[0], node_path[1], type, edge_letter,
+                                            value, path_value)
+                        if reduction is None:
+                            continue
+                        new_path = reduction + (path_value,)
+                    path[to] = new_path
+                    distance[to] = new_distance
+                    heappush(q, (new_distance, to))
+                    if new_distance + potentials[to] - source_potential < 0:
+                        # moat
+                        new_value = lc_value + new_path[2]
+                        reduction = _reduce(EdgeType.LOWER_CASE, letter, new_path[0],
+                                            new_path[1], new_path[2], new_value)
+                        if reduction is not None:
+                            moats += 1
+                            key = (to,) + reduction
+                            if key not in new_edges or new_value < new_edges[key]:
+                                new_edges[key] = new_value
+
+        if self.stats is not None:
+            self.stats.record('reduce_lower_case', time() - start,
+                              dijkstra_pops=pops, moats=moats,
+                              moat_edges=len(new_edges))
+        return [(lc_fro, to, value, type, edge_letter, letter, True)
+                for (to, type, edge_letter), value in new_edges.iteritems()]
@@ -0,0 +1,26 @@
+import sys
+
+from stnu import NamedStnu
+
+USAGE = '''Usage: %s input output
+
+Converts network between parsable (.in or anything else), XML (.xml) and
+binary (.stnu) formats, chosen by file extensions.'''
+
+def main():
+    if len(sys.argv) != 3:
+        print >> sys.stderr, USAGE % sys.argv[0]
+        sys.exit(1)
+    input_file, output_file = sys.argv[1:]
+    network = NamedStnu()
+    network.read_from_file(input_file)
+    with open(output_file, 'wb') as output:
+        if output_file.endswith('.stnu'):
+            network.write_binary(output)
+        elif output_file.endswith('.xml'):
+            network.write_xml(output)
+        else:
+            network.write_parsable(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+from multiprocessing import Pool
+
+from stnu import NamedStnu, StnuEdge
+
+
+def components(stnu):
+    """Splits stnu into networks which are DC all together if and only if
+    stnu is, as a list of NamedStnu with the names of nodes of stnu.
+
+    Network is not DC iff its distance graph has a semi-reducible
+    negative cycle ("A Structural Characterization of Temporal Dynamic
+    Controllability" by Paul Morris), which is a cycle of edges of the
+    graph, so it lies within one strongly connected component of it.
+    Every component with edges becomes a network of the edges of stnu
+    between its nodes; edges between components (with infinite bounds on
+    one side or joining disjoint plans) are on no cycle and are left out.
+    A contingent link has a lower case edge from its start to its end,
+    whatever its upper bound, and one back for its lower bound, so its
+    ends are in the same component.
+    """
+    num_nodes = stnu.num_nodes
+    names = getattr(stnu, '_inverse_renaming', {})
+    inf = float('inf')
+    outgoing = [[] for _ in xrange(num_nodes + 1)]
+    for e in stnu.controllable_edges:
+        if e.upper_bound != inf:
+            outgoing[e.fro].append(e.to)
+        if e.lower_bound != -inf:
+            outgoing[e.to].append(e.fro)
+    for e in stnu.uncontrollable_edges:
+        outgoing[e.fro].append(e.to)
+        outgoing[e.to].append(e.fro)
+    component = _strongly_connected(num_nodes, outgoing)
+
+    networks = {}
+    def network_of(e):
+        if component[e.fro] != component[e.to]:
+            return None
+        if component[e.fro] not in networks:
+            networks[component[e.fro]] = NamedStnu()
+        network = networks[component[e.fro]]
+        fro = network.add_node(names.get(e.fro, str(e.fro)))
+        to = network.add_node(names.get(e.to, str(e.to)))
+        return network, StnuEdge(fro, to, e.lower_bound, e.upper_bound)
+
+    for e in stnu.controllable_edges:
+        edge = network_of(e)
+        if edge is not None:
+            edge[0].controllable_edges.append(edge[1])
+    for e in stnu.uncontrollable_edges:
+        edge = network_of(e)
+        edge[0].uncontrollable_edges.append(edge[1])
+    return [networks[c] for c in sorted(networks)]
+
+def _strongly_connected(num_nodes, outgoing):
+    """Returns component number of every node (Tarjan, without recursion)."""
+    index = [None] * (num_nodes + 1)
+    low = [0] * (num_nodes + 1)
+    component = [None] * (num_nodes + 1)
+    on_stack = [False] * (num_nodes + 1)
+    stack = []
+    counter = 0
+    num_components = 0
+    for root in xrange(1, num_nodes + 1):
+        if index[root] is not None:
+            continue
+        # (node, position in its outgoing list)
+        path = [(root, 0)]
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack[root] = True
+        while path:
+            node, position = path[-1]
+            if position < len(outgoing[node]):
+                path[-1] = (node, position + 1)
+                neighbor = outgoing[node][position]
+                if index[neighbor] is None:
+                    index[neighbor] = low[neighbor] = counter
+                    counter += 1
+                    stack.append(neighbor)
+                    on_stack[neighbor] = True
+                    path.append((neighbor, 0))
+                elif on_stack[neighbor]:
+                    low[node] = min(low[node], index[neighbor])
+                continue
+            path.pop()
+            if path:
+                parent = path[-1][0]
+                low[parent] = min(low[parent], low[node])
+            if low[node] == index[node]:
+                while True:
+                    member = stack.pop()
+                    on_stack[member] = False
+                    component[member] = num_components
+                    if member == node:
+                        break
+                num_components += 1
+    return component
+
+def _solve_component(task):
+    network, solver_class = task
+    return solver_class().solve(network)
+
+def solve_components(networks, solver_class, processes=1, stats=None, pool=None):
+    """Returns whether all the networks are DC, checking them with
+    solver_class (FastDc or its subclass, or a function making one), the
+    largest ones first, and stopping at the first one which is not. If
+    processes is greater than one they are checked in parallel by a pool
+    of that many processes (then stats, an Instrumentation, does not get
+    phases of the solvers). If pool (a multiprocessing Pool) is given, it
+    is used instead of a new one and left running, still checking the
+    other networks if one was not DC; terminating it is the only way to
+    stop them."""
+    networks = sorted(networks, key=lambda network: -network.num_edges)
+    if processes <= 1 or len(networks) <= 1:
+        for network in networks:
+            solver = solver_class()
+            solver.stats = stats
+            if not solver.solve(network):
+                return False
+        return True
+    tasks = [(network, solver_class) for network in networks]
+    if pool is not None:
+        return all(pool.imap_unordered(_solve_component, tasks))
+    pool = Pool(min(processes, len(networks)))
+    try:
+        return all(pool.imap_unordered(_solve_component, tasks))
+    finally:
+        pool.terminate()
+        pool.join()
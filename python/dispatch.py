@@ -0,0 +1,307 @@
+from collections import defaultdict, deque
+from heapq import heappush, heappop
+
+# Distances are sums of floats, computed in different orders, so they are
+# compared with this tolerance.
+EPSILON = 1e-9
+
+class DispatchableNetwork(object):
+    """Dispatchable form of a DC network: constraints between timepoints
+    such that propagating times of executed timepoints to their neighbors
+    only is enough to execute the network, as in "Dynamic Control of
+    Plans with Temporal Uncertainty" by Morris, Muscettola and Vidal.
+
+    Built by compile from the final distance graph of FastDc or
+    IncrementalDc:
+        edges - fro -> list of (to, value), meaning to - fro <= value,
+                for shortest distances between timepoints which are not
+                dominated by others (Muscettola et al.: a non-negative
+                edge A -> C is dominated by non-negative B -> C and
+                a negative one by negative A -> B, if B is on a shortest
+                path from A to C)
+        waits - (node, activation, contingent, value): unless contingent
+                is observed node must not be executed before activation
+                - value; waits of the graph regressed through
+                shortest distances
+        contingent - contingent timepoint -> (activation, lower, upper)
+        normalization - node -> (activation, offset) for nodes added by
+                normalization of contingent links, executed
+                automatically offset after activation
+    Nodes are numbered as in the solver (names in self.names).
+    """
+
+    def __init__(self, num_nodes, edges, waits, contingent, normalization, names):
+        self.num_nodes = num_nodes
+        self.edges = edges
+        self.waits = waits
+        self.contingent = contingent
+        self.normalization = normalization
+        self.names = names
+
+    @property
+    def num_edges(self):
+        return sum(len(neighbors) for neighbors in self.edges.itervalues())
+
+    @staticmethod
+    def compile(num_nodes, edges, contingent_links, normalization, names):
+        """Returns DispatchableNetwork of a DC network.
+
+        edges - (fro, to, value, letter) of all the edges of the final
+                distance graph except lower case ones, with letter set
+                for upper case ones
+        contingent_links - (activation, contingent, lower, upper) for
+                every contingent link of the network
+        normalization, names - as in FastDc
+
+        Takes O(N^3) time and O(N^2) memory, like any all pairs shortest
+        paths.
+        """
+        outgoing = [[] for _ in xrange(num_nodes + 1)]
+        incoming = [[] for _ in xrange(num_nodes + 1)]
+        # (fro, contingent) -> [(activation, value)] of upper case edges
+        upper_case = defaultdict(list)
+        for fro, to, value, letter in edges:
+            if letter is None:
+                outgoing[fro].append((to, value))
+                incoming[to].append((fro, value))
+            else:
+                upper_case[(fro, letter)].append((to, value))
+
+        # Waits are regressed through shortest paths which do not pass
+        # through the contingent timepoint (after it the wait is gone).
+        # Regressed waits which are non-negative hold whether the
+        # contingent timepoint comes first or not (label removal), so they
+        # are added as ordinary edges until nothing changes.
+        while True:
+            potential = potentials(num_nodes, outgoing)
+            distance = [None] + [shortest_paths(source, outgoing, potential)
+                                 for source in xrange(1, num_nodes + 1)]
+            reverse_potential = [-p for p in potential]
+            tightest = {}
+            added = False
+            for (fro, letter), targets in sorted(upper_case.iteritems()):
+                to_fro = shortest_paths(fro, incoming, reverse_potential, avoid=letter)
+                for node in xrange(1, num_nodes + 1):
+                    if node == letter or to_fro[node] == float('inf'):
+                        continue
+                    for activation, value in targets:
+                        wait = to_fro[node] + value
+                        if node == activation or distance[node][activation] <= wait + EPSILON:
+                            # implied by the edges
+                            continue
+                        if wait >= 0:
+                            outgoing[node].append((activation, wait))
+                            incoming[activation].append((node, wait))
+                            added = True
+                            continue
+                        # tightest wait of every (node, activation, contingent)
+                        key = (node, activation, letter)
+                        if tightest.get(key, 0) > wait:
+                            tightest[key] = wait
+            if not added:
+                break
+        waits = [key + (value,) for key, value in sorted(tightest.iteritems())]
+
+        dispatchable_edges = {}
+        for a in xrange(1, num_nodes + 1):
+            kept = _undominated(a, distance)
+            if kept:
+                dispatchable_edges[a] = kept
+
+        contingent = dict((c, (a, lower, upper)) for a, c, lower, upper in contingent_links)
+        return DispatchableNetwork(num_nodes, dispatchable_edges, waits,
+                                   contingent, dict(normalization), dict(names))
+
+def potentials(num_nodes, outgoing):
+    """Distances from virtual node connected to every node by an edge of
+    weight 0, for Dijkstra on graphs with negative edges (Johnson)."""
+    potential = [0] * (num_nodes + 1)
+    q = deque(xrange(1, num_nodes + 1))
+    in_queue = [True] * (num_nodes + 1)
+    pushes = [1] * (num_nodes + 1)
+    while q:
+        node = q.popleft()
+        in_queue[node] = False
+        for neighbor, value in outgoing[node]:
+            if potential[neighbor] > potential[node] + value:
+                potential[neighbor] = potential[node] + value
+                if not in_queue[neighbor]:
+                    pushes[neighbor] += 1
+                    if pushes[neighbor] > num_nodes + 1:
+                        raise ValueError('negative cycle')
+                    in_queue[neighbor] = True
+                    q.append(neighbor)
+    return potential
+
+def shortest_paths(source, adjacency, potential, avoid=None):
+    """Dijkstra: lengths of the shortest paths from source (inf if there
+    is none) in graph given as adjacency lists, with Johnson's potentials.
+    Paths do not pass through node avoid. For reversed graph negated
+    potentials of the graph can be used."""
+    inf = float('inf')
+    reduced = [inf] * len(adjacency)
+    reduced[source] = 0
+    done = [False] * len(adjacency)
+    q = [(0, source)]
+    while q:
+        node_distance, node = heappop(q)
+        if done[node]:
+            continue
+        done[node] = True
+        if node == avoid and node != source:
+            continue
+        for neighbor, value in adjacency[node]:
+            new_distance = node_distance + value + potential[node] - potential[neighbor]
+            if new_distance < reduced[neighbor]:
+                reduced[neighbor] = new_distance
+                heappush(q, (new_distance, neighbor))
+    return [d - potential[source] + potential[node] if d != inf else inf
+            for node, d in enumerate(reduced)]
+
+def _undominated(a, distance):
+    """Edges from a which are not dominated, as list of (to, value).
+    Nodes rigidly connected to a or to the end of the edge never dominate
+    it, so that two edges cannot dominate each other."""
+    num_nodes = len(distance) - 1
+    from_a = distance[a]
+    inf = float('inf')
+    dominated = [False] * (num_nodes + 1)
+    for b in xrange(1, num_nodes + 1):
+        a_b = from_a[b]
+        if b == a or a_b == inf or a_b + distance[b][a] <= EPSILON:
+            continue
+        from_b = distance[b]
+        for c in xrange(1, num_nodes + 1):
+            if dominated[c] or c == a or c == b:
+                continue
+            b_c = from_b[c]
+            if b_c == inf or abs(a_b + b_c - from_a[c]) > EPSILON or b_c + distance[c][b] <= EPSILON:
+                continue
+            if (b_c >= 0 and from_a[c] >= 0) or (a_b < 0 and from_a[c] < 0):
+                dominated[c] = True
+    return [(c, from_a[c]) for c in xrange(1, num_nodes + 1)
+            if c != a and from_a[c] != inf and not dominated[c]]
+
+
+class Dispatcher(object):
+    """Executes DispatchableNetwork in real time. Events are reported by
+    execute (for controllable timepoints) and observe (for contingent
+    ones); each takes time proportional to the number of constraints of
+    the timepoint only.
+
+    Timepoint is enabled when all timepoints which must precede it
+    (negative edges and waits) are executed. It can be executed at any
+    time within its window, give or take TOLERANCE, which absorbs
+    rounding errors of windows of rigidly connected timepoints.
+    """
+
+    TOLERANCE = 1e-9
+
+    def __init__(self, network):
+        self.network = network
+        num_nodes = network.num_nodes
+        inf = float('inf')
+        self.time = [None] * (num_nodes + 1)
+        self._lower = [-inf] * (num_nodes + 1)
+        self._upper = [inf] * (num_nodes + 1)
+        # reversed edges, for propagating lower bounds
+        self._incoming = defaultdict(list)
+        # node -> timepoints which must precede it
+        predecessors = defaultdict(set)
+        for fro, neighbors in network.edges.iteritems():
+            for to, value in neighbors:
+                self._incoming[to].append((fro, value))
+                if value < 0:
+                    predecessors[fro].add(to)
+        # activation -> [(node, contingent, value)] and
+        # contingent -> nodes waiting for it
+        self._waits_on = defaultdict(list)
+        self._waiting_for = defaultdict(list)
+        for node, activation, letter, value in network.waits:
+            self._waits_on[activation].append((node, letter, value))
+            self._waiting_for[letter].append(node)
+            predecessors[node].add(activation)
+        # node -> {contingent: time before which node must not execute}
+        self._active_waits = defaultdict(dict)
+        self._successors = defaultdict(list)
+        self._pending = [0] * (num_nodes + 1)
+        for node, before in predecessors.iteritems():
+            self._pending[node] = len(before)
+            for predecessor in before:
+                self._successors[predecessor].append(node)
+        self._normalized = defaultdict(list)
+        for node, (activation, offset) in network.normalization.iteritems():
+            self._normalized[activation].append((node, offset))
+        self.enabled = set(node for node in xrange(1, num_nodes + 1)
+                           if self._pending[node] == 0 and self._controllable(node))
+
+    def _controllable(self, node):
+        return node not in self.network.contingent and node not in self.network.normalization
+
+    def window(self, node):
+        """Returns (earliest, latest) time node can be executed at."""
+        lower = self._lower[node]
+        waits = self._active_waits.get(node)
+        if waits:
+            lower = max(lower, max(waits.itervalues()))
+        return lower, self._upper[node]
+
+    def executable(self, time):
+        """Returns enabled timepoints which can be executed at time."""
+        result = []
+        for node in self.enabled:
+            lower, upper = self.window(node)
+            if lower - Dispatcher.TOLERANCE <= time <= upper + Dispatcher.TOLERANCE:
+                result.append(node)
+        return result
+
+    @property
+    def finished(self):
+        return all(t is not None for t in self.time[1:])
+
+    def execute(self, node, time):
+        """Reports that controllable node was executed at time."""
+        if node not in self.enabled:
+            raise ValueError('%s is not enabled' % (self.network.names.get(node, node),))
+        lower, upper = self.window(node)
+        if not lower - Dispatcher.TOLERANCE <= time <= upper + Dispatcher.TOLERANCE:
+            raise ValueError('%s executed at %r outside of its window [%r, %r]' %
+                             (self.network.names.get(node, node), time, lower, upper))
+        self._executed(node, time)
+
+    def observe(self, node, time):
+        """Reports that contingent node was observed at time."""
+        if node not in self.network.contingent or self.time[node] is not None:
+            raise ValueError('%s is not a pending contingent timepoint' %
+                             (self.network.names.get(node, node),))
+        activation, lower, upper = self.network.contingent[node]
+        start = self.time[activation]
+        if start is None or not (start + lower - Dispatcher.TOLERANCE <= time <=
+                                 start + upper + Dispatcher.TOLERANCE):
+            raise ValueError('%s observed at %r outside of its contingent link' %
+                             (self.network.names.get(node, node), time))
+        self._executed(node, time)
+
+    def _executed(self, node, time):
+        self.time[node] = time
+        self.enabled.discard(node)
+        upper, lower = self._upper, self._lower
+        for neighbor, value in self.network.edges.get(node, ()):
+            if upper[neighbor] > time + value:
+                upper[neighbor] = time + value
+        for neighbor, value in self._incoming.get(node, ()):
+            if lower[neighbor] < time - value:
+                lower[neighbor] = time - value
+        for waiting, letter, value in self._waits_on.get(node, ()):
+            if self.time[letter] is None:
+                waits = self._active_waits[waiting]
+                waits[letter] = max(waits.get(letter, time - value), time - value)
+        for waiting in self._waiting_for.get(node, ()):
+            self._active_waits[waiting].pop(node, None)
+        for successor in self._successors.get(node, ()):
+            self._pending[successor] -= 1
+            if (self._pending[successor] == 0 and self.time[successor] is None and
+                    self._controllable(successor)):
+                self.enabled.add(successor)
+        for normalized, offset in self._normalized.get(node, ()):
+            self._executed(normalized, time + offset)
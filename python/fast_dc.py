@@ -1,27 +1,98 @@
-from collections import namedtuple, defaultdict
-from Queue import Queue, PriorityQueue
+import hashlib
 
+from array import array
+from collections import namedtuple, defaultdict, deque
+from copy import copy
+from functools import partial
+from heapq import heappush, heappop
+from itertools import izip
+from math import fsum
+from multiprocessing import Pool
+from time import time
+
+from decompose import components, solve_components
+from dispatch import DispatchableNetwork
+from precheck import precheck
+from simplify import simplify
+from instrumentation import Instrumentation
+from result_cache import fingerprint
 from stnu import StnuEdge
 
 
+# Distances found by searches with different potentials differ by
+# rounding errors, so they are compared with this tolerance (relative).
+EPSILON = 1e-9
+
+# lower case edges times edges of the graph an iteration of FastDc must
+# have for its reductions to be sent to worker processes
+PARALLEL_MIN_WORK = 1 << 17
+
 class EdgeType(object):
     SIMPLE = 1
     LOWER_CASE = 2
     UPPER_CASE = 3
 
+NegativeCycleEdge = namedtuple('NegativeCycleEdge',
+                               ['fro', 'to', 'value', 'type', 'contingent', 'derived'])
+
 class Edge(object):
-    def __init__(self, fro, to, value, type, maybe_letter=None,renaming=None):
+    """Edge of the distance graph. contingent is the letter (end node) of
+    the contingent link the edge comes from or, for derived edges, of the
+    lower case edge whose reduction produced it."""
+    __slots__ = ('fro', 'to', 'value', 'type', 'maybe_letter', 'contingent', 'derived')
+
+    def __init__(self, fro, to, value, type, maybe_letter=None,
+                 contingent=None, derived=False):
         self.fro = fro
         self.to = to
         self.value = value
         self.type = type
         self.maybe_letter = maybe_letter
-        self.renaming = renaming
+        self.contingent = contingent
+        self.derived = derived
+
+    def key(self):
+        """Edges with the same key differ only by value, so the one with
+        smaller value dominates the other. A missing letter is 0 rather
+        than None, whose hash (an address) differs between processes and
+        would make the order of dicts of edges, and so the edges derived,
+        differ as well."""
+        return (self.fro, self.to, self.type, self.maybe_letter or 0)
+
+    def pack(self):
+        """Compact form of the edge, for sending it to other processes."""
+        return (self.fro, self.to, self.value, self.type, self.maybe_letter,
+                self.contingent, self.derived)
+
+    def __eq__(self, other):
+        return (isinstance(other, Edge) and self.key() == other.key() and
+                self.value == other.value)
+
+    def __ne__(self, other):
+        return not self == other
 
-    def hash(self):
-        return hash((fro,to,value,type,maybe_letter))    
+    def __hash__(self):
+        return hash((self.key(), self.value))
 
-    def _printit(self, fro, to, maybe_letter):
+    def certificate(self, renaming):
+        """Edge as a part of negative cycle certificate, i.e. with nodes
+        and contingent link named."""
+        return NegativeCycleEdge(renaming[self.fro],
+                                 renaming[self.to],
+                                 self.value,
+                                 self.type,
+                                 renaming[self.contingent]
+                                 if self.contingent is not None else None,
+                                 self.derived)
+
+    def describe(self, renaming=None):
+        """Human readable form of the edge, with node numbers translated
+        to names if renaming is given."""
+        fro, to, maybe_letter = self.fro, self.to, self.maybe_letter
+        if renaming is not None:
+            fro, to = renaming[fro], renaming[to]
+            if maybe_letter is not None:
+                maybe_letter = renaming[maybe_letter]
         type_str = ''
         if self.type == EdgeType.UPPER_CASE:
             type_str = 'UC(%s):' % maybe_letter
@@ -32,64 +103,641 @@ class Edge(object):
                                     self.value,
                                     to)
 
-    def __unicode__(self):
-        if self.renaming is None:
-            return self._printit(self.fro, self.to, self.maybe_letter)
-        else:
-            return self._printit(self.renaming[self.fro],
-                          self.renaming[self.to],
-                          self.renaming[self.maybe_letter] 
-                          if self.maybe_letter is not None else None)
+    def __str__(self):
+        return self.describe()
 
+class EdgeStore(object):
+    """Edges of the distance graph. Only the tightest edge is kept for
+    every (fro, to, type, letter), so edges which are derived again or
+    dominated by ones already there do not pile up."""
 
-    def __str__(self):
-        return self.__unicode__()
+    def __init__(self, edges=()):
+        self._edges = {}
+        for edge in edges:
+            self.add(edge)
+
+    def add(self, edge):
+        """Returns true if the store changed, i.e. edge is not dominated
+        by an edge which is already there."""
+        key = edge.key()
+        old = self._edges.get(key)
+        if old is not None and old.value <= edge.value:
+            return False
+        self._edges[key] = edge
+        return True
+
+    def lower_case_edges(self):
+        return [e for e in self._edges.itervalues() if e.type == EdgeType.LOWER_CASE]
+
+    def copy(self):
+        store = EdgeStore()
+        store._edges = dict(self._edges)
+        return store
+
+    def __iter__(self):
+        return self._edges.itervalues()
+
+    def __len__(self):
+        return len(self._edges)
+
+class AllmaxGraph(object):
+    """Allmax projection of the distance graph, i.e. all the edges except
+    lower case ones, keeping only the tightest edge between any pair of
+    nodes. For every node, ends and weights of outgoing edges are kept in
+    arrays which are extended in place as new edges are derived."""
+
+    def __init__(self, num_nodes):
+        self.num_nodes = num_nodes
+        self.neighbors = [array('l') for _ in xrange(num_nodes + 1)]
+        self.weights = [array('d') for _ in xrange(num_nodes + 1)]
+        # (fro, to) -> index of the edge in neighbors[fro] and weights[fro]
+        self._position = {}
+        # (fro, to) -> the tightest edge, to tell what a cycle is made of
+        self.edges = {}
+
+    def add_edge(self, edge):
+        """Returns true if graph changed, i.e. edge is not dominated by an
+        edge which is already there."""
+        if edge.type == EdgeType.LOWER_CASE:
+            return False
+        pair = (edge.fro, edge.to)
+        position = self._position.get(pair)
+        if position is None:
+            self._position[pair] = len(self.neighbors[edge.fro])
+            self.neighbors[edge.fro].append(edge.to)
+            self.weights[edge.fro].append(edge.value)
+            self.edges[pair] = edge
+            return True
+        if self.weights[edge.fro][position] > edge.value:
+            self.weights[edge.fro][position] = edge.value
+            self.edges[pair] = edge
+            return True
+        return False
+
+    def copy(self):
+        graph = AllmaxGraph(0)
+        graph.num_nodes = self.num_nodes
+        graph.neighbors = [array('l', a) for a in self.neighbors]
+        graph.weights = [array('d', a) for a in self.weights]
+        graph._position = dict(self._position)
+        graph.edges = dict(self.edges)
+        return graph
+
+class ReducedGraph(object):
+    """Graph searched by reduce_lower_case: all the edges except lower
+    case ones, as (to, weight reduced by potentials, edge) by fro, built
+    once for all the lower case edges of an iteration. Upper case edges
+    of the letter of the lower case edge being propagated must be left
+    out (paper terminology: breach), so lists of nodes which have some
+    are filtered once for every letter."""
+
+    def __init__(self, num_nodes, edge_list, potentials):
+        self.potentials = potentials
+        self.outgoing = [[] for _ in xrange(num_nodes + 1)]
+        # letter -> nodes with upper case edges of that letter
+        self._upper_case = defaultdict(set)
+        for edge in edge_list:
+            if edge.type == EdgeType.LOWER_CASE:
+                continue
+            if edge.type == EdgeType.UPPER_CASE:
+                self._upper_case[edge.maybe_letter].add(edge.fro)
+            self.outgoing[edge.fro].append(
+                    (edge.to, edge.value + potentials[edge.fro] - potentials[edge.to], edge))
+        self._by_letter = {}
+        # nodes in order of potentials, for bounding searches
+        self.by_potential = sorted(xrange(1, num_nodes + 1), key=lambda node: potentials[node])
+
+    def outgoing_without(self, letter):
+        """Returns outgoing lists without upper case edges of letter."""
+        if letter not in self._by_letter:
+            outgoing = list(self.outgoing)
+            for node in self._upper_case.get(letter, ()):
+                outgoing[node] = [(to, weight, edge) for to, weight, edge in outgoing[node]
+                                  if not (edge.type == EdgeType.UPPER_CASE and
+                                          edge.maybe_letter == letter)]
+            self._by_letter[letter] = outgoing
+        return self._by_letter[letter]
 
 class DcTester(object):
-    def __init__(self, stnu):
+    """Checks dynamic controllability of stnu, keeping the result until the
+    network is edited. engine is one of the keys of ENGINES: 'incremental'
+    reuses work between edits, 'cubic' has better worst case when there
+    are many contingent links, 'compact' (compact_dc.CompactDc) keeps
+    the graph in arrays, of which at most memory_budget bytes (if given)
+    are in memory. Other engines take no memory_budget (ValueError).
+
+    If instrumentation (an Instrumentation) is given, the solver records
+    its phases there (see summary).
+
+    If result_cache (a ResultCache) is given, verdicts are looked up there
+    by fingerprint of the network before solving, and stored there
+    after.
+
+    If decompose is set, checks from scratch split the network into
+    independent components (see decompose.components), which are
+    checked separately, by a pool of processes if there is more than
+    one. If simplify is set, they check the network simplified by
+    simplify.simplify (before splitting it). The solver then only sees
+    the whole network when it is needed (for incremental checks after
+    edits, negative cycles etc.).
+
+    If precheck is set, checks from scratch first try the cheap tests of
+    precheck.precheck, which settle networks without contingent links,
+    ones inconsistent even before any reduction and the obviously
+    (not) controllable ones. decided_by tells what decided the last
+    verdict."""
+
+    def __init__(self, stnu, processes=1, engine='incremental', instrumentation=None,
+                 result_cache=None, decompose=False, simplify=False, precheck=False,
+                 memory_budget=None):
         self.stnu = stnu
         self._is_dc = None
         self._update_dc = True
         self._first_time = True
+        self.result_cache = result_cache
+        self.decompose = decompose
+        self.simplify = simplify
+        self.precheck = precheck
+        self._decided_by = None
+        self._processes = processes
+        # whether the verdict was taken from result_cache without solving
+        self._from_cache = False
+        # whether the verdict was found without the solver (from cache or
+        # by components), so the solver has not seen the network
+        self._solver_behind = False
+        solver_class = ENGINES[engine]
+        if memory_budget is not None:
+            if engine != 'compact':
+                raise ValueError('only the compact engine has a memory budget')
+            solver_class = partial(solver_class, memory_budget=memory_budget)
+        self._solver_class = solver_class
+        self._solver = solver_class(processes)
+        self._solver.stats = instrumentation
+        # checks components when decompose is set, kept between checks
+        self._pool = None
+        self.instrumentation = instrumentation
+        # edits since last check: edges that were added or tightened and
+        # whether anything was loosened or removed
+        self._tightened = []
+        self._loosened = False
+
+    def close(self):
+        """Stops worker processes of the solver and of components, if
+        there are any."""
+        self._solver.close()
+        self._close_pool()
+
+    def _close_pool(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _find_edge(self, edge_list, fro, to):
+        for i, edge in enumerate(edge_list):
+            if edge.fro == fro and edge.to == to:
+                return i
+        raise KeyError('no edge %s -> %s' % (fro, to))
+
+    def _edit(self, controllable_edges, uncontrollable_edges):
+        """Gives the network these edges. They are checked (see
+        Stnu.verify_contraints) before, so an edit which fails leaves the
+        network as it was."""
+        network = copy(self.stnu)
+        network.controllable_edges = controllable_edges
+        network.uncontrollable_edges = uncontrollable_edges
+        network.num_nodes = max([network.num_nodes] +
+                                [max(e.fro, e.to) for e in controllable_edges] +
+                                [max(e.fro, e.to) for e in uncontrollable_edges])
+        network.verify_contraints()
+        self.stnu.controllable_edges = controllable_edges
+        self.stnu.uncontrollable_edges = uncontrollable_edges
+        self.stnu.num_nodes = network.num_nodes
+        self._update_dc = True
+
+    def add_controllable_edge(self, fro, to, lower_bound, upper_bound):
+        edge = StnuEdge(fro, to, lower_bound, upper_bound)
+        self._edit(self.stnu.controllable_edges + [edge], self.stnu.uncontrollable_edges)
+        self._tightened.append(edge)
+
+    def add_uncontrollable_edge(self, fro, to, lower_bound, upper_bound):
+        self._edit(self.stnu.controllable_edges,
+                   self.stnu.uncontrollable_edges + [StnuEdge(fro, to, lower_bound, upper_bound)])
+        self._loosened = True
+
+    def update_controllable_edge(self, fro, to, lower_bound, upper_bound):
+        """Changes bounds of a requirement edge. Tightening (new interval
+        inside of the old one) is handled incrementally."""
+        edges = list(self.stnu.controllable_edges)
+        i = self._find_edge(edges, fro, to)
+        old = edges[i]
+        edge = edges[i] = StnuEdge(fro, to, lower_bound, upper_bound)
+        self._edit(edges, self.stnu.uncontrollable_edges)
+        if old.lower_bound <= lower_bound and upper_bound <= old.upper_bound:
+            self._tightened.append(edge)
+        else:
+            self._loosened = True
+
+    def update_uncontrollable_edge(self, fro, to, lower_bound, upper_bound):
+        edges = list(self.stnu.uncontrollable_edges)
+        edges[self._find_edge(edges, fro, to)] = StnuEdge(fro, to, lower_bound, upper_bound)
+        self._edit(self.stnu.controllable_edges, edges)
+        self._loosened = True
+
+    def remove_controllable_edge(self, fro, to):
+        edges = list(self.stnu.controllable_edges)
+        del edges[self._find_edge(edges, fro, to)]
+        self._edit(edges, self.stnu.uncontrollable_edges)
+        self._loosened = True
+
+    def remove_uncontrollable_edge(self, fro, to):
+        edges = list(self.stnu.uncontrollable_edges)
+        del edges[self._find_edge(edges, fro, to)]
+        self._edit(self.stnu.controllable_edges, edges)
+        self._loosened = True
+
+    def negative_cycle(self):
+        """Certificate that the network is not DC: negative cycle in the
+        distance graph, possibly using edges derived by reductions, as
+        a list of NegativeCycleEdge with the names of nodes. contingent is
+        the name of the end of contingent link whose edge it is (or whose
+        lower case edge it was derived from). Returns None if network is
+        DC."""
+        if self.is_dynamically_controllable():
+            return None
+        self._solve_if_behind()
+        return [e.certificate(self._solver.renaming)
+                for e in self._solver.negative_cycle]
+
+    def dispatchable(self):
+        """Returns dispatchable form of the network (a DispatchableNetwork,
+        to be executed by dispatch.Dispatcher) or None if network is not
+        DC. Solvers which do not keep the graph they derive are replaced
+        by IncrementalDc for that."""
+        if not self.is_dynamically_controllable():
+            return None
+        self._solve_if_behind()
+        solver = self._solver
+        if solver.edges is None:
+            solver = IncrementalDc()
+            solver.solve(self.stnu)
+        return DispatchableNetwork.compile(
+                len(solver.renaming),
+                [(e.fro, e.to, e.value,
+                  e.maybe_letter if e.type == EdgeType.UPPER_CASE else None)
+                 for e in solver.edges if e.type != EdgeType.LOWER_CASE],
+                [(e.fro, e.to, e.lower_bound, e.upper_bound)
+                 for e in self.stnu.uncontrollable_edges],
+                solver.normalization,
+                solver.renaming)
+
+    def dc_preserving_bounds(self, edges, precision=1e-3):
+        """How far bounds of edges, given as (fro, to) of requirement edges
+        or contingent links, can be moved before the network stops being
+        DC, each bound on its own with the rest of the network as it is.
+        Returns list of (lower_bound, upper_bound), one for every edge:
+            requirement edge - the largest lower bound and the smallest
+                    upper bound it can be tightened to (inf or -inf if a
+                    bound can be moved past every finite bound of the
+                    network, as then no path of constraints limits it)
+            contingent link - the smallest lower bound and the largest
+                    upper bound it can be widened to (inf if it can be
+                    widened past every finite bound, as above)
+        or None if network is not DC. ValueError is raised if both a
+        requirement edge and a contingent link go from fro to to.
+
+        Limits are found by bisection, to within precision, and are always
+        values the network was found DC with. Probes of requirement edges
+        are tightenings of the graph of the last DC probe (see
+        IncrementalDc.tighten); probes of contingent links rebuild it
+        with potentials of the last DC probe. All the edges start from
+        the graph of the network, which is derived once."""
+        if not self.is_dynamically_controllable():
+            return None
+        self._solve_if_behind()
+        start = time()
+        base = self._solver
+        if not isinstance(base, IncrementalDc):
+            base = IncrementalDc()
+            base.solve(self.stnu)
+        inf = float('inf')
+        # more than any path of finite bounds adds up to, so that limits
+        # of the network are short of it
+        horizon = 1 + sum(abs(bound) for e in self.stnu.controllable_edges + self.stnu.uncontrollable_edges
+                          for bound in (e.lower_bound, e.upper_bound) if abs(bound) != inf)
+        probes = [0]
+
+        def tightened(state, edge):
+            probes[0] += 1
+            solver = state.copy()
+            solver.stats = None
+            return solver.tighten([edge]), solver
+
+        def rebuilt(state, links):
+            probes[0] += 1
+            network = copy(self.stnu)
+            network.uncontrollable_edges = links
+            solver = IncrementalDc()
+            solver.network = network
+            solver.potentials = state.potentials
+            return solver.rebuild(), solver
+
+        result = []
+        for fro, to in edges:
+            requirements = [e for e in self.stnu.controllable_edges if (e.fro, e.to) == (fro, to)]
+            if requirements and any((e.fro, e.to) == (fro, to)
+                                    for e in self.stnu.uncontrollable_edges):
+                raise ValueError('both a requirement edge and a contingent link go from %s to %s'
+                                 % (fro, to))
+            if requirements:
+                e = requirements[0]
+                lower, upper = e.lower_bound, e.upper_bound
+                # infinite bounds are first tightened to the horizon, where
+                # they cannot matter yet
+                top = upper if upper != inf else max(lower, 0) + horizon
+                bottom = lower if lower != -inf else min(upper, 0) - horizon
+                min_upper = lambda state, value: tightened(state, StnuEdge(fro, to, lower, value))
+                max_lower = lambda state, value: tightened(state, StnuEdge(fro, to, value, upper))
+                upper_limit, lower_limit = upper, lower
+                state = base
+                if upper == inf:
+                    is_dc, state = min_upper(base, top)
+                if upper != inf or is_dc:
+                    upper_limit = _bisect(state, min_upper, top, max(lower, bottom), precision)
+                state = base
+                if lower == -inf:
+                    is_dc, state = max_lower(base, bottom)
+                if lower != -inf or is_dc:
+                    lower_limit = _bisect(state, max_lower, bottom, min(upper, top), precision)
+                # limits which got to the horizon are not limits at all
+                if upper == inf:
+                    lower_limit = inf if lower_limit == top else lower_limit
+                    upper_limit = inf if upper_limit == top else upper_limit
+                if lower == -inf:
+                    lower_limit = -inf if lower_limit == bottom else lower_limit
+                    upper_limit = -inf if upper_limit == bottom else upper_limit
+                result.append((lower_limit, upper_limit))
+                continue
+            i = self._find_edge(self.stnu.uncontrollable_edges, fro, to)
+            links = self.stnu.uncontrollable_edges
+            e = links[i]
+            def replaced(lower, upper):
+                return links[:i] + [StnuEdge(fro, to, lower, upper)] + links[i + 1:]
+            min_lower = lambda state, value: rebuilt(state, replaced(value, e.upper_bound))
+            max_upper = lambda state, value: rebuilt(state, replaced(e.lower_bound, value))
+            lower_limit = _bisect(base, min_lower, e.lower_bound, 0, precision)
+            upper_limit = _bisect(base, max_upper, e.upper_bound,
+                                  e.upper_bound + horizon, precision)
+            if upper_limit == e.upper_bound + horizon:
+                upper_limit = inf
+            result.append((lower_limit, upper_limit))
+        if self.instrumentation is not None:
+            self.instrumentation.record('dc_preserving_bounds', time() - start,
+                                        probes=probes[0])
+        return result
+
+    def _solve_if_behind(self):
+        if self._solver_behind:
+            self._is_dc = self._solver.solve(self.stnu)
+            self._first_time = False
+            self._solver_behind = False
+
+    def _solve_preprocessed(self):
+        """Returns verdict found by checking the network simplified and
+        split into components (as far as they are enabled), or None if
+        that would not change anything."""
+        network = self.stnu
+        if self.simplify:
+            start = time()
+            simplification = simplify(network)
+            if self.instrumentation is not None:
+                self.instrumentation.record(
+                        'simplify', time() - start,
+                        removed_nodes=network.num_nodes - simplification.network.num_nodes,
+                        removed_edges=network.num_edges - simplification.network.num_edges,
+                        implied_bounds=simplification.implied_bounds)
+            if simplification.changed:
+                network = simplification.network
+        networks = [network]
+        if self.decompose:
+            start = time()
+            networks = components(network)
+            if self.instrumentation is not None:
+                self.instrumentation.record('decompose', time() - start,
+                                            components=len(networks))
+                self.instrumentation.set('largest_component',
+                                         max([n.num_nodes for n in networks] + [0]))
+            if len(networks) == 1 and networks[0].num_edges == network.num_edges:
+                networks = [network]
+        if networks == [self.stnu]:
+            return None
+        if self._processes > 1 and len(networks) > 1 and self._pool is None:
+            self._pool = Pool(self._processes)
+        is_dc = solve_components(networks, self._solver_class, self._processes,
+                                 self.instrumentation, self._pool)
+        if not is_dc:
+            # the pool may still be checking other components
+            self._close_pool()
+        return is_dc
+
+    @property
+    def from_cache(self):
+        """Whether the last verdict was taken from result_cache."""
+        return self._from_cache
+
+    @property
+    def decided_by(self):
+        """What decided the last verdict: 'cache', 'precheck:' and the tier
+        (see precheck.TIERS) or the check of the solver ('solve',
+        'solve_preprocessed', 'rebuild' or 'tighten'). None before the
+        first check."""
+        return self._decided_by
+
+    def summary(self):
+        """Totals of the phases of all the checks so far (see
+        Instrumentation.summary) or None if there is no instrumentation."""
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.summary()
 
     def is_dynamically_controllable(self):
         # if nothing changed return cached result
         if not self._update_dc:
             return self._is_dc
 
-        if self._first_time:
+        key = None
+        if self.result_cache is not None:
+            start = time()
+            key = fingerprint(self.stnu)
+            is_dc = self.result_cache.get(key)
+            if self.instrumentation is not None:
+                self.instrumentation.record('fingerprint', time() - start,
+                                            cache_hits=int(is_dc is not None),
+                                            cache_misses=int(is_dc is None))
+            if is_dc is not None:
+                self._is_dc = is_dc
+                self._from_cache = True
+                self._decided_by = 'cache'
+                # solver is behind, so the next check starts from scratch
+                self._solver_behind = True
+                self._first_time = True
+                self._tightened = []
+                self._loosened = False
+                self._update_dc = False
+                return self._is_dc
+
+        start = time()
+        check = is_dc = None
+        if self._first_time and self.precheck:
+            is_dc, tier = precheck(self.stnu)
+            if is_dc is not None:
+                check = 'precheck:' + tier
+            else:
+                # time of decisive prechecks is recorded as their check
+                if self.instrumentation is not None:
+                    self.instrumentation.record('precheck', time() - start)
+                start = time()
+        if is_dc is None and self._first_time and (self.decompose or self.simplify):
+            is_dc = self._solve_preprocessed()
+            check = 'solve_preprocessed'
+        if is_dc is not None:
+            self._is_dc = is_dc
+            # solver is behind, so the next check starts from scratch
+            self._solver_behind = True
+        elif self._first_time:
             # if we calculate DC from the first time use nonincremental
-            alg = FastDc()
-            self._is_dc = alg.solve(self.stnu)
+            check = 'solve'
+            self._is_dc = self._solver.solve(self.stnu)
+            self._solver_behind = False
             self._first_time = False
+        elif self._loosened:
+            check = 'rebuild'
+            self._is_dc = self._solver.rebuild()
         else:
-            # stub: use incremental algorithm here
-            self._is_dc = None 
+            check = 'tighten'
+            self._is_dc = self._solver.tighten(self._tightened)
+        if self.instrumentation is not None:
+            self.instrumentation.record(check, time() - start)
+            self.instrumentation.set('nodes', self.stnu.num_nodes)
+            self.instrumentation.set('edges', self.stnu.num_edges)
+        if key is not None:
+            self.result_cache.put(key, self._is_dc)
+        self._from_cache = False
+        self._decided_by = check
 
+        self._tightened = []
+        self._loosened = False
         self._update_dc = False
         return self._is_dc
 
 
+def network_key(network):
+    """Hash (hex string) of network with its numbering of nodes and order
+    of edges, which checkpoints of FastDc.solve are tied to. Unlike
+    result_cache.fingerprint, it tells renumbered networks apart."""
+    return hashlib.sha1(repr((
+            network.num_nodes,
+            [(e.fro, e.to, e.lower_bound, e.upper_bound) for e in network.controllable_edges],
+            [(e.fro, e.to, e.lower_bound, e.upper_bound) for e in network.uncontrollable_edges],
+    ))).hexdigest()
+
+def _bisect(state, probe, good, bad, precision):
+    """Returns the value closest to bad, to within precision, for which
+    probe(state, value) finds the network DC, given that it is DC for
+    good. probe returns the verdict and the solver, which becomes state
+    of later probes if the network is DC."""
+    is_dc, probed = probe(state, bad)
+    if is_dc:
+        return bad
+    while abs(bad - good) > precision:
+        middle = (good + bad) / 2.0
+        is_dc, probed = probe(state, middle)
+        if is_dc:
+            good, state = middle, probed
+        else:
+            bad = middle
+    return good
+
+def _reduce_lower_cases_worker(task):
+    """Runs reduce_lower_case in a worker process. Edges are packed."""
+    num_nodes, packed_edges, potentials, packed_lc_edges, instrumented = task
+    alg = FastDc()
+    if instrumented:
+        alg.stats = Instrumentation()
+    edge_list = [Edge(*e) for e in packed_edges]
+    graph = ReducedGraph(num_nodes, edge_list, potentials)
+    result = []
+    for lc_edge in packed_lc_edges:
+        region = {}
+        new_edges = alg.reduce_lower_case(num_nodes, edge_list, potentials,
+                                          Edge(*lc_edge), region, graph)
+        result.append(([e.pack() for e in new_edges], region))
+    return result, alg.stats.summary() if instrumented else None
+
 class FastDc(object):
     """Implementation based on paper "A Structural Characterization of Temporal
-    Dynamic Controllability" by Paul Morris"""
+    Dynamic Controllability" by Paul Morris
+
+    If processes is greater than one, lower case edges are reduced in
+    parallel by a pool of that many worker processes, which is started
+    by the first check that needs it and kept for the later ones until
+    close is called. If keep_edges is set, the final distance graph of
+    a DC network is left in self.edges (see dispatch.DispatchableNetwork)."""
+
+    def __init__(self, processes=1, keep_edges=False):
+        self.processes = processes
+        self.keep_edges = keep_edges
+        self._pool = None
+        self.renaming = None
+        # normalization node -> (start of its contingent link, lower bound)
+        self.normalization = {}
+        # all the edges, derived ones included, if the last check found
+        # the network DC and they are kept
+        self.edges = None
+        # edges of a negative cycle found by the last check, if any
+        self.negative_cycle = None
+        # work done by the last check: outer iterations (propagations
+        # from negative nodes for CubicDc) and edges it derived
+        self.iterations = 0
+        self.derived_edges = 0
+        # Instrumentation recording phases of checks, if any
+        self.stats = None
+        # state of the last check, if solve ran out of budget
+        self.checkpoint = None
+
+    def close(self):
+        """Stops worker processes, if there are any."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
 
     def generate_graph(self, network):
-        """Generates graph of edges as in section 2.2"""
+        """Generates graph of edges as in section 2.2. Names of the nodes,
+        including the ones added by normalization, are left in
+        self.renaming for printing edges."""
+        start = time()
         num_nodes = network.num_nodes
         edge_list = []
 
         renaming = { k:v for k,v in network._inverse_renaming.items() }
+        self.renaming = renaming
+        self.normalization = {}
 
-        def add_controllable(e):        
-            edge_list.append(Edge(e.fro, e.to, e.upper_bound, EdgeType.SIMPLE, renaming=renaming))
-            edge_list.append(Edge(e.to, e.fro, -e.lower_bound, EdgeType.SIMPLE, renaming=renaming))
+        def add_controllable(e, contingent=None):
+            # infinite bounds (like the ones dropped by simplify) are no
+            # constraints
+            if e.upper_bound != float('inf'):
+                edge_list.append(Edge(e.fro, e.to, e.upper_bound, EdgeType.SIMPLE,
+                                      contingent=contingent))
+            if e.lower_bound != float('-inf'):
+                edge_list.append(Edge(e.to, e.fro, -e.lower_bound, EdgeType.SIMPLE,
+                                      contingent=contingent))
 
         def add_uncontrollable(e):
-            edge_list.append(Edge(e.fro, e.to, e.upper_bound, EdgeType.SIMPLE, renaming=renaming))
-            edge_list.append(Edge(e.to, e.fro, -e.lower_bound, EdgeType.SIMPLE, renaming=renaming))
-            edge_list.append(Edge(e.to, e.fro, -e.upper_bound, EdgeType.UPPER_CASE, e.to, renaming=renaming))
-            edge_list.append(Edge(e.fro, e.to, e.lower_bound, EdgeType.LOWER_CASE, e.to, renaming=renaming))
+            add_controllable(e, e.to)
+            edge_list.append(Edge(e.to, e.fro, -e.upper_bound, EdgeType.UPPER_CASE, e.to, e.to))
+            edge_list.append(Edge(e.fro, e.to, e.lower_bound, EdgeType.LOWER_CASE, e.to, e.to))
 
         for e in network.controllable_edges:
             add_controllable(e)
@@ -103,85 +751,157 @@ class FastDc(object):
                 new_node = num_nodes + 1
                 num_nodes += 1
                 renaming[new_node] = renaming[e.fro] + "'"
-                add_controllable(StnuEdge(e.fro, new_node, e.lower_bound, e.lower_bound))
+                self.normalization[new_node] = (e.fro, e.lower_bound)
+                add_controllable(StnuEdge(e.fro, new_node, e.lower_bound, e.lower_bound), e.to)
                 add_uncontrollable(StnuEdge(new_node, e.to, 0, e.upper_bound - e.lower_bound))
 
-
-
+        if self.stats is not None:
+            self.stats.record('generate_graph', time() - start,
+                              graph_nodes=num_nodes, graph_edges=len(edge_list))
         return num_nodes, edge_list
 
-    def allmax(self, num_nodes, edge_list):
+    def allmax(self, graph, potentials=None, changed_nodes=None):
         """Calculates allmax projection of STNU (see section 2.2). 
 
+        graph is an AllmaxGraph. Potentials from a previous call stay valid
+        for all the edges that did not change since, so if they are given
+        only changed_nodes (starts of edges added or tightened since then)
+        are initially put in the queue.
+
         Returns two parameters:
             success - true if consistent
             potentials - potentials for use in Dijkstra algorithm
         """
-        weights = {}
-        neighbor_list = defaultdict(lambda: set())
-
-        for e in edge_list:
-            if e.type != EdgeType.LOWER_CASE:
-                pair = (e.fro, e.to)
-                neighbor_list[e.fro].add(e.to)
-                if not pair in weights or weights[pair] > e.value:
-                    weights[pair] = e.value
-        
-        # Like in Johnson's algorithm we add node 0 artificially 
-        for node in xrange(1, num_nodes + 1):
-            weights[(0,node)] = 0
-            neighbor_list[0].add(node)
+        start = time()
+        num_nodes = graph.num_nodes
+        # Like in Johnson's algorithm we add node 0 artificially. It is
+        # connected to every node with an edge of weight 0, so after the
+        # first step of SPFA every node is at distance 0 and in the queue.
+        if potentials is None:
+            distance = [0] * (num_nodes + 1)
+            changed_nodes = xrange(1, num_nodes + 1)
+        else:
+            # Old potentials are an upper bound on distances from node 0,
+            # just as if node 0 was connected to every node by an edge
+            # of that weight, so SPFA can carry on from there.
+            distance = list(potentials[:num_nodes + 1])
+            changed_nodes = set(changed_nodes)
+            for node in xrange(len(distance), num_nodes + 1):
+                distance.append(0)
+                changed_nodes.add(node)
 
-        source = 0
-        terminated, distances = self.spfa(source = 0,
-                                          num_nodes=num_nodes + 1,
-                                          weights=weights,
-                                          neighbor_list=neighbor_list)
+        result = self.spfa(graph, distance, changed_nodes)
+        if self.stats is not None:
+            self.stats.record('allmax', time() - start, changed_nodes=len(changed_nodes))
+        return result
 
-        return (terminated, distances)
-        
-    def spfa(self, source, num_nodes, weights, neighbor_list):
+    def spfa(self, graph, distance, initial_queue):
         """Shortest Paths Fastests Algorithm - think optimized Bellman-Ford,
         
-        Assumes nodes have numbers from 0 to num_nodes (inclusive).
+        Assumes nodes have numbers from 0 to graph.num_nodes (inclusive).
+        Starts from given (finite) distances with nodes from initial_queue
+        in the queue, which amounts to running it from a virtual source
+        connected to every node with an edge of weight distance[node].
+
+        Negative cycle is reported as soon as the shortest path tree would
+        contain one, and its edges are left in self.negative_cycle.
 
         Returns two variables:
             success - true if no negative cycle
             distances - shortest distance from the source to each node
                         or None if negative cycle
         """
-        # None is Infinity
-        distance = [None] * num_nodes
+        start = time()
+        self.negative_cycle = None
+        # virtual source is the root of the shortest path tree
+        root = graph.num_nodes + 1
+        num_nodes = root + 1
         currently_in_queue = [False] * num_nodes
-        times_in_queue = [0] * num_nodes
-        q = Queue()
+        neighbors = graph.neighbors
+        weights = graph.weights
+        q = deque()
 
-        distance[source] = 0
-        currently_in_queue[source] = True
-        times_in_queue[source] = 1
-        q.put(0)
+        # Subtree disassembly (Tarjan): shortest path tree is kept as
+        # a list of nodes in preorder, with depths. When distance of
+        # a node drops, its descendants are taken out of the tree (depth
+        # -1) and not scanned until they are relaxed again, as their
+        # distances are about to drop too. If the node relaxing it is one
+        # of them, the tree would get a cycle, which must be negative -
+        # unless the distance only dropped by rounding error around
+        # a cycle of weight zero, so weight of the cycle is checked.
+        parent = [root] * num_nodes
+        depth = [1] * num_nodes
+        depth[root] = 0
+        after = range(1, num_nodes) + [0]
+        before = [root] + range(0, root)
 
-        negative_cycle = False
+        for node in initial_queue:
+            currently_in_queue[node] = True
+            q.append(node)
+        pushes = len(q)
+        scans = relaxations = 0
 
-        while not q.empty() and not negative_cycle:
-            node = q.get()
+        while q:
+            node = q.popleft()
             currently_in_queue[node] = False
-            for neighbor in neighbor_list[node]:
-                if (distance[neighbor] is None or
-                        distance[neighbor] > distance[node] + weights[(node, neighbor)]):
-                    distance[neighbor] = distance[node] + weights[(node, neighbor)]
+            if depth[node] < 0:
+                continue
+            scans += 1
+            node_distance = distance[node]
+            for neighbor, weight in izip(neighbors[node], weights[node]):
+                if distance[neighbor] > node_distance + weight:
+                    if depth[neighbor] >= 0:
+                        # find the subtree of neighbor
+                        last = neighbor
+                        closes_cycle = neighbor == node
+                        while depth[after[last]] > depth[neighbor]:
+                            last = after[last]
+                            closes_cycle = closes_cycle or last == node
+                        if closes_cycle:
+                            cycle = self._tree_cycle(graph, parent, node, neighbor)
+                            if fsum(e.value for e in cycle) < 0:
+                                self.negative_cycle = cycle
+                                self._record_spfa(start, pushes, scans, relaxations)
+                                return (False, None)
+                            continue
+                        # take it out of the tree
+                        descendant = neighbor
+                        while descendant != last:
+                            descendant = after[descendant]
+                            depth[descendant] = -1
+                        after[before[neighbor]] = after[last]
+                        before[after[last]] = before[neighbor]
+                    distance[neighbor] = node_distance + weight
+                    relaxations += 1
+                    # put neighbor back as a child of node
+                    parent[neighbor] = node
+                    depth[neighbor] = depth[node] + 1
+                    after[neighbor] = after[node]
+                    before[after[node]] = neighbor
+                    after[node] = neighbor
+                    before[neighbor] = node
                     if not currently_in_queue[neighbor]:
                         currently_in_queue[neighbor] = True
-                        times_in_queue[neighbor] += 1
-                        if times_in_queue[neighbor] > num_nodes:
-                            negative_cycle = True
-                            break
-                        q.put(neighbor)
+                        q.append(neighbor)
+                        pushes += 1
 
-        if negative_cycle:
-            return (False, None)
-        else:
-            return (True, distance)
+        self._record_spfa(start, pushes, scans, relaxations)
+        return (True, distance)
+
+    def _record_spfa(self, start, pushes, scans, relaxations):
+        if self.stats is not None:
+            self.stats.record('spfa', time() - start, spfa_pushes=pushes,
+                              spfa_scans=scans, spfa_relaxations=relaxations)
+
+    def _tree_cycle(self, graph, parent, node, neighbor):
+        """Edges of the cycle closed by edge node -> neighbor and the path
+        from neighbor to node in the shortest path tree."""
+        cycle = [graph.edges[(node, neighbor)]]
+        while node != neighbor:
+            cycle.append(graph.edges[(parent[node], node)])
+            node = parent[node]
+        cycle.reverse()
+        return cycle
 
     def reduce_edge(self, edge1, edge2):
         # X ---edge1----> Y ----edge2----> Z
@@ -220,28 +940,30 @@ class FastDc(object):
                 new_type = EdgeType.SIMPLE
                 new_maybe_letter = None
 
-        new_edge = Edge(new_fro, new_to, new_value, new_type, new_maybe_letter, renaming=edge1.renaming)
+        new_edge = Edge(new_fro, new_to, new_value, new_type, new_maybe_letter)
         #print 'combine \t%s \twith \t%s \tto get \t%s' %(edge1, edge2, new_edge)
         return new_edge
 
 
-    def reduce_lower_case(self, num_nodes, edge_list, potentials, lc_edge):
-        new_edges = set()
+    def reduce_lower_case(self, num_nodes, edge_list, potentials, lc_edge,
+                          region=None, graph=None):
+        """Finds moats for a lower case edge (section 3). If region (a dict)
+        is given, distances from the end of lc_edge to all the nodes
+        visited by the search are stored in it; if the search is cut off
+        before visiting all the nodes it reaches, node 0 (which is not in
+        the graph) is put there as well. graph is ReducedGraph of edge_list,
+        which is built if it is not given."""
+        start = time()
+        new_edges = EdgeStore()
 
         # Notice that here we are going to be using Johnson's algorithm in
         # a nonintuitive way, we will remove some edges from the original
         # graph which we use to calculate potentials. If you look through
         # proof of Johnson's algorithms you will notice that removing edges
         # never invalidate the key properties of potentials
-        outgoing_edges = defaultdict(lambda: [])
-        for edge in edge_list:
-            # Ignore lower case edges and upper-case edges with the same letter as lc_edge
-            # (paper terminology: breach)
-            if (edge.type == EdgeType.LOWER_CASE or
-                    (edge.type == EdgeType.UPPER_CASE and
-                    edge.maybe_letter == lc_edge.maybe_letter)):
-                continue
-            outgoing_edges[edge.fro].append(edge)
+        if graph is None:
+            graph = ReducedGraph(num_nodes, edge_list, potentials)
+        outgoing = graph.outgoing_without(lc_edge.maybe_letter)
         # distance in shortest path's graph
         reduced_edge = [None] * (num_nodes + 1)
         distance = [None] * (num_nodes + 1)
@@ -249,78 +971,581 @@ class FastDc(object):
 
         source = lc_edge.to
         distance[source] = 0
+        source_potential = potentials[source]
+        # Reduced distance of a node relaxed later is at least the
+        # distance of the node popped now, so it can only be negative (a
+        # moat) for nodes of potential below source_potential minus that.
+        # Once no unvisited node has one, nothing more can be derived.
+        by_potential = graph.by_potential
+        lowest = 0
+        cutoff = source_potential + EPSILON * (1 + abs(source_potential))
 
-        q = PriorityQueue()
-        q.put((0, source))
-
-        #print 'processing LCE %s' % (lc_edge,)
+        q = [(0, source)]
+        pops = moats = 0
 
-        while not q.empty():
-            _, node = q.get()
+        while q:
+            node_distance, node = heappop(q)
             if visited[node]:
                 continue
-            #print 'visiting %d' % node
+            while visited[by_potential[lowest]]:
+                lowest += 1
+            if node_distance + potentials[by_potential[lowest]] > cutoff:
+                if region is not None:
+                    region[0] = None
+                break
+            pops += 1
             visited[node] = True
-            for edge in outgoing_edges[node]:
-                neighbor = edge.to
-                edge_value_potential = edge.value + potentials[edge.fro] - potentials[edge.to]
-                if (distance[neighbor] is None or
-                        distance[neighbor] > distance[node] + edge_value_potential):
+            if region is not None:
+                region[node] = distance[node] + potentials[node] - source_potential
+            node_reduced_edge = reduced_edge[node]
+            for neighbor, weight, edge in outgoing[node]:
+                new_distance = distance[node] + weight
+                if distance[neighbor] is None or distance[neighbor] > new_distance:
                     # add calculate reduced edge that lead us here
-                    if reduced_edge[node] is None:
+                    if node_reduced_edge is None:
                         new_reduced_edge = edge
                     else:
-                        new_reduced_edge = self.reduce_edge(reduced_edge[node], edge)
+                        new_reduced_edge = self.reduce_edge(node_reduced_edge, edge)
                     if new_reduced_edge is None:
                         # cannot make a reduction
                         continue
                     reduced_edge[neighbor] = new_reduced_edge
-                    distance[neighbor] = distance[node] + edge_value_potential
-                    q.put((distance[neighbor], neighbor))
+                    distance[neighbor] = new_distance
+                    heappush(q, (new_distance, neighbor))
                     # This the reduced distance as described in the book, excluding the effect of
                     # potentials
-                    real_reduced_distance = distance[neighbor] + potentials[neighbor] - potentials[source]
+                    real_reduced_distance = new_distance + potentials[neighbor] - source_potential
                     # check if we have a moat
                     if real_reduced_distance < 0:
-                        relevant_edge = self.reduce_edge(lc_edge, reduced_edge[neighbor])
-                        
+                        relevant_edge = self.reduce_edge(lc_edge, new_reduced_edge)
                         if relevant_edge is not None:
-                            #print '^^ moat ^^'
+                            relevant_edge.contingent = lc_edge.maybe_letter
+                            relevant_edge.derived = True
+                            moats += 1
                             new_edges.add(relevant_edge)
 
-        #for edge in list(new_edges):
-        #    print '   %s' % (edge,)
-
+        if self.stats is not None:
+            self.stats.record('reduce_lower_case', time() - start,
+                              dijkstra_pops=pops, moats=moats,
+                              moat_edges=len(new_edges))
         return list(new_edges)
 
-    def solve(self, network):
-        """Implementation of pseudocode from end of section 3"""
+    def reduce_lower_cases(self, num_nodes, edge_list, potentials, lc_edges,
+                           regions=None, deadline=None):
+        """Runs reduce_lower_case for every edge in lc_edges and returns all
+        the new edges, in order of lc_edges no matter whether it was done
+        in parallel or not. If regions is a list, distances to nodes visited for
+        each lower case edge is appended to it. If deadline (a time()) passes,
+        edges after the first are left out, unless they are done in
+        parallel; then regions tells how many were done. Iterations with
+        less than PARALLEL_MIN_WORK searches times edges are done here, as
+        sending them to workers would take longer."""
+        if (self.processes <= 1 or len(lc_edges) <= 1 or
+                len(lc_edges) * len(edge_list) < PARALLEL_MIN_WORK):
+            results = []
+            graph = ReducedGraph(num_nodes, edge_list, potentials) if lc_edges else None
+            for lc_edge in lc_edges:
+                if results and deadline is not None and time() >= deadline:
+                    break
+                region = {}
+                results.append((self.reduce_lower_case(num_nodes, edge_list,
+                                                       potentials, lc_edge,
+                                                       region, graph),
+                                region))
+        else:
+            if self._pool is None:
+                self._pool = Pool(self.processes)
+            # Graph is sent once to every worker, with contiguous chunks
+            # of lower case edges.
+            packed_edges = [e.pack() for e in edge_list]
+            chunk = (len(lc_edges) + self.processes - 1) // self.processes
+            tasks = [(num_nodes, packed_edges, potentials,
+                      [e.pack() for e in lc_edges[i:i + chunk]],
+                      self.stats is not None)
+                     for i in xrange(0, len(lc_edges), chunk)]
+            results = []
+            # Workers have their own instrumentation, so observers do not
+            # see their phases, but totals include them.
+            for chunk_result, summary in self._pool.map(_reduce_lower_cases_worker, tasks):
+                if summary is not None:
+                    self.stats.merge(summary)
+                for new_edges, region in chunk_result:
+                    results.append(([Edge(*e) for e in new_edges],
+                                    region))
+
+        new_edges = []
+        for reduced_edges, region in results:
+            new_edges.extend(reduced_edges)
+            if regions is not None:
+                regions.append(region)
+        return new_edges
+
+    def _affected_lower_cases(self, edges, changed, regions):
+        """Returns lower case edges of edges whose propagation may derive
+        something new now that changed edges were added, and how many
+        others there are (semi-naive evaluation).
+
+        Propagation of a lower case edge finds the same shortest paths as
+        last time (distances in regions by key) unless a changed edge
+        starts at a node it visited and makes a path which is at least as
+        short as the one found (ties count, as they may change the type
+        of derived edges). Otherwise it would only derive the edges it
+        derived last time, which are still in the graph. If the search
+        was cut off (node 0 in region), changes at nodes it did not get
+        to count as well. Lower case edges are never on the paths, so
+        only changes of their own are relevant to them."""
+        changed_keys = set(e.key() for e in changed)
+        changed = [e for e in changed if e.type != EdgeType.LOWER_CASE]
+        lc_edges = []
+        skipped = 0
+        for e in edges.lower_case_edges():
+            key = e.key()
+            region = regions.get(key)
+            if key not in changed_keys and region is not None:
+                for edge in changed:
+                    if edge.fro not in region:
+                        if 0 in region:
+                            break
+                        continue
+                    fro_distance = region[edge.fro]
+                    to_distance = region.get(edge.to)
+                    if (to_distance is None or
+                            fro_distance + edge.value <= to_distance + EPSILON * (1 + abs(to_distance))):
+                        break
+                else:
+                    skipped += 1
+                    continue
+            lc_edges.append(e)
+        return lc_edges, skipped
+
+    def _record_iteration(self, start, reduced_edges, new_edges, lc_edges=0,
+                          skipped_lc_edges=0):
+        """Records outer iteration: edges reduced from lower case edges,
+        how many of them were new (the rest are duplicates or dominated)
+        and how many lower case edges were processed and skipped."""
+        if self.stats is not None:
+            self.stats.record('iteration', time() - start,
+                              iterations=1,
+                              reduced_edges=reduced_edges,
+                              derived_edges=new_edges,
+                              deduplicated_edges=reduced_edges - new_edges,
+                              lower_case_edges=lc_edges,
+                              skipped_lower_case_edges=skipped_lc_edges)
+
+    def solve(self, network, time_budget=None, iteration_budget=None, checkpoint=None):
+        """Implementation of pseudocode from end of section 3
+
+        Returns whether network is DC, or None if time_budget (seconds) or
+        iteration_budget (outer iterations) runs out before that is
+        decided. Then self.checkpoint is the state of the check (a dict
+        which can be serialized as JSON, see _checkpoint), and solve of
+        the same network given it as checkpoint carries on from there,
+        in this process or another one, with budgets counted from then.
+
+        Time is checked before every outer iteration and, unless lower
+        case edges are reduced by a pool of processes, between them, so
+        checks are interrupted within a single search. Every call searches
+        at least one lower case edge, so calls with small budgets still
+        make progress."""
+        return self._solve(network, time_budget, iteration_budget, checkpoint)
+
+    def _checkpoint(self, network, all_edges, new_edges, potentials, iterations,
+                    pending=None, reduced=None):
+        """State of an interrupted check, as a dict:
+            network - network_key of the network being checked
+            iterations - outer iterations completed
+            derived_edges - edges derived by them
+            edges - all the edges of the graph, packed (see Edge.pack)
+            new_edges - edges added since potentials were found
+            potentials - potentials found by the last allmax, or None
+            pending - lower case edges which the current iteration has
+                      yet to reduce, or None between iterations
+            reduced - edges derived by the current iteration so far
+        Regions of semi-naive evaluation are left out, so the first
+        iteration after resuming reduces all the lower case edges."""
+        return {
+            'network': network_key(network),
+            'iterations': iterations,
+            'derived_edges': self.derived_edges,
+            'edges': [e.pack() for e in all_edges],
+            'new_edges': [e.pack() for e in new_edges],
+            'potentials': potentials,
+            'pending': None if pending is None else [e.pack() for e in pending],
+            'reduced': None if reduced is None else [e.pack() for e in reduced],
+        }
+
+    def _solve(self, network, time_budget=None, iteration_budget=None, checkpoint=None):
+        deadline = None if time_budget is None else time() + time_budget
         K = len(network.uncontrollable_edges)
-        num_nodes, new_edges = self.generate_graph(network)
+        num_nodes, base_edges = self.generate_graph(network)
         #print 'start graph (%d nodes):' % num_nodes
-        #for edge in new_edges:
+        #for edge in base_edges:
         #    print '    %s' % (edge,)
         completed_iterations = 0
-        all_edges = []
-        while len(new_edges) > 0 and completed_iterations <= K:
-            #print 'iteration %d' % (completed_iterations,)
-            all_edges.extend(new_edges)
-            new_edges = []
-            consistent, potentials = self.allmax(num_nodes, all_edges)
-            #print '   allmax check %s' % ('succeeded' if consistent else 'failed')
-            if not consistent:
-                return False
+        self.iterations = self.derived_edges = 0
+        self.edges = None
+        self.checkpoint = None
+        if self.stats is not None:
+            self.stats.set('K', K)
+        graph = AllmaxGraph(num_nodes)
+        potentials = None
+        # lower case edges the current iteration has yet to reduce and the
+        # edges it derived so far, if it was interrupted
+        pending = reduced = None
+        if checkpoint is None:
+            all_edges = EdgeStore()
+            new_edges = [e for e in base_edges if all_edges.add(e)]
+        else:
+            if checkpoint['network'] != network_key(network):
+                raise ValueError('checkpoint is not of this network')
+            all_edges = EdgeStore(Edge(*e) for e in checkpoint['edges'])
+            new_edges = [Edge(*e) for e in checkpoint['new_edges']]
+            # potentials are valid for the rest of the edges
+            new_keys = set(e.key() for e in new_edges)
             for e in all_edges:
-                if e.type == EdgeType.LOWER_CASE:
-                    reduced_edges = self.reduce_lower_case(num_nodes,
-                                                           all_edges,
-                                                           potentials,
-                                                           e)
-                    new_edges.extend(reduced_edges)
+                if e.key() not in new_keys:
+                    graph.add_edge(e)
+            potentials = checkpoint['potentials']
+            if checkpoint['pending'] is not None:
+                pending = [Edge(*e) for e in checkpoint['pending']]
+                reduced = [Edge(*e) for e in checkpoint['reduced']]
+            completed_iterations = self.iterations = checkpoint['iterations']
+            self.derived_edges = checkpoint['derived_edges']
+        first_iteration = completed_iterations
+        # lower case edge key -> nodes visited by its last propagation
+        regions = {}
+        # Edges which are already there or dominated by ones that are do
+        # not count as new, so the loop stops as soon as nothing changes.
+        while (len(new_edges) > 0 or pending is not None) and completed_iterations <= K:
+            #print 'iteration %d' % (completed_iterations,)
+            start = time()
+            skipped = 0
+            if pending is None:
+                if completed_iterations > first_iteration and (
+                        (deadline is not None and start >= deadline) or
+                        (iteration_budget is not None and
+                         completed_iterations - first_iteration >= iteration_budget)):
+                    self.checkpoint = self._checkpoint(network, all_edges, new_edges,
+                                                       potentials, completed_iterations)
+                    return None
+                changed_nodes = set(e.fro for e in new_edges if graph.add_edge(e))
+                consistent, potentials = self.allmax(graph, potentials, changed_nodes)
+                #print '   allmax check %s' % ('succeeded' if consistent else 'failed')
+                if not consistent:
+                    return False
+                pending, skipped = self._affected_lower_cases(all_edges, new_edges, regions)
+                reduced = []
+            lc_edges = pending
+            new_regions = []
+            reduced.extend(self.reduce_lower_cases(num_nodes,
+                                                   all_edges,
+                                                   potentials,
+                                                   lc_edges,
+                                                   new_regions,
+                                                   deadline))
+            for e, region in zip(lc_edges, new_regions):
+                regions[e.key()] = region
+            if len(new_regions) < len(lc_edges):
+                self.checkpoint = self._checkpoint(network, all_edges, [], potentials,
+                                                   completed_iterations,
+                                                   lc_edges[len(new_regions):], reduced)
+                return None
+            new_edges = [e for e in reduced if all_edges.add(e)]
             #for e in new_edges:
-            #    print '    adding edge: %s (hash: %d)' % (e, hash(e))
+            #    print '    adding edge: %s' % (e,)
             completed_iterations += 1
+            self.iterations += 1
+            self.derived_edges += len(new_edges)
+            self._record_iteration(start, len(reduced), len(new_edges),
+                                   len(lc_edges), skipped)
+            pending = reduced = None
         # Assuming the theory from the paper checks out. We need one extra
         # iteration to verify that no edge was actually added.
         assert completed_iterations <= K+1
-        return True
\ No newline at end of file
+        if self.keep_edges:
+            self.edges = list(all_edges)
+        return True
+
+
+class IncrementalDc(FastDc):
+    """FastDc which keeps the distance graph of the last check, so that
+    after the network is edited DC can be established again without
+    solving from scratch.
+
+    Adding or tightening requirement edges only adds constraints, so all
+    the edges derived so far stay valid and only lower case edges whose
+    propagation could reach one of the changed edges are processed again.
+    Any other edit (loosening, removal, changes to contingent links) may
+    invalidate derived edges, so those are dropped and derived again -
+    potentials of the previous run are still used as a starting point
+    for allmax. The graph is always kept, so self.edges is set whenever
+    the network is DC."""
+
+    def __init__(self, processes=1):
+        super(IncrementalDc, self).__init__(processes, keep_edges=True)
+        self.network = None
+        self.potentials = None
+
+    def solve(self, network):
+        self.network = network
+        self.potentials = None
+        return self.rebuild()
+
+    def rebuild(self):
+        """Derives all the edges again from the current network."""
+        self.num_nodes, base_edges = self.generate_graph(self.network)
+        # normalization nodes are numbered after the nodes of the network,
+        # so adding a node to the network renumbers them.
+        self._network_nodes = self.network.num_nodes
+        self._edges = EdgeStore()
+        self._graph = AllmaxGraph(self.num_nodes)
+        # nodes visited by last propagation of every lower case edge
+        self._regions = {}
+        # All the edges are marked as changed, so potentials may be
+        # arbitrary - they only speed up allmax if they are close.
+        changed = [e for e in base_edges if self._edges.add(e)]
+        self._is_dc = self._propagate(changed)
+        return self._is_dc
+
+    def tighten(self, stnu_edges):
+        """Adds requirement edges (new ones or tighter versions of existing
+        ones) to the graph."""
+        if not self._is_dc:
+            # adding constraints never makes network DC
+            return False
+        if any(max(e.fro, e.to) > self._network_nodes for e in stnu_edges):
+            return self.rebuild()
+        changed = []
+        for e in stnu_edges:
+            for edge in [Edge(e.fro, e.to, e.upper_bound, EdgeType.SIMPLE),
+                         Edge(e.to, e.fro, -e.lower_bound, EdgeType.SIMPLE)]:
+                if self._edges.add(edge):
+                    changed.append(edge)
+        changed.extend(self._not_propagated)
+        self._is_dc = self._propagate(changed)
+        return self._is_dc
+
+    def _propagate(self, changed):
+        """Main loop of FastDc.solve, except only the lower case edges
+        which can reach one of the changed edges are processed."""
+        K = len(self.network.uncontrollable_edges)
+        completed_iterations = 0
+        self.iterations = self.derived_edges = 0
+        if self.stats is not None:
+            self.stats.set('K', K)
+        while len(changed) > 0 and completed_iterations <= K:
+            start = time()
+            changed_nodes = set(e.fro for e in changed if self._graph.add_edge(e))
+            consistent, self.potentials = self.allmax(self._graph,
+                                                      self.potentials,
+                                                      changed_nodes)
+            if not consistent:
+                self._not_propagated = []
+                self.edges = None
+                return False
+            lc_edges, skipped = self._affected_lower_cases(self._edges, changed,
+                                                           self._regions)
+            regions = []
+            new_edges = self.reduce_lower_cases(self.num_nodes,
+                                                self._edges,
+                                                self.potentials,
+                                                lc_edges,
+                                                regions)
+            for e, region in zip(lc_edges, regions):
+                self._regions[e.key()] = region
+            changed = [e for e in new_edges if self._edges.add(e)]
+            completed_iterations += 1
+            self.iterations += 1
+            self.derived_edges += len(changed)
+            self._record_iteration(start, len(new_edges), len(changed),
+                                   len(lc_edges), skipped)
+        self._not_propagated = changed
+        self.edges = self._edges
+        return True
+
+    def copy(self):
+        """Returns IncrementalDc in the same state, which can be edited
+        without changing this one (it shares the pool of processes)."""
+        other = copy(self)
+        if self._is_dc:
+            other._edges = self._edges.copy()
+            other._graph = self._graph.copy()
+            other._regions = dict(self._regions)
+            other._not_propagated = list(self._not_propagated)
+            other.edges = other._edges
+            other.potentials = list(self.potentials)
+        return other
+
+
+class CubicDc(FastDc):
+    """Implementation based on paper "Dynamic Controllability and
+    Dispatchability Relationships" by Paul Morris (2014).
+
+    Every negative node (one with negative incoming edges) is processed
+    once, by propagating backwards from it Dijkstra-style until distances
+    become non-negative, which only ever adds non-negative edges. Negative
+    nodes met on the way are processed first; meeting one that is still
+    being processed means there is a negative cycle, whose edges are left
+    in self.negative_cycle. This is O(N^3) no matter how many contingent
+    links there are.
+
+    Has the same interface as IncrementalDc, but checks from scratch."""
+
+    NEW, IN_PROGRESS, DONE = range(3)
+
+    def __init__(self, processes=1):
+        super(CubicDc, self).__init__(processes)
+        self.network = None
+        self._is_dc = None
+
+    def solve(self, network):
+        self.network = network
+        return self.rebuild()
+
+    def rebuild(self):
+        num_nodes, edge_list = self.generate_graph(self.network)
+        self.negative_cycle = None
+        self.iterations = self.derived_edges = 0
+        self._is_dc = self.determine_dc(num_nodes, edge_list)
+        return self._is_dc
+
+    def tighten(self, stnu_edges):
+        if not self._is_dc:
+            # adding constraints never makes network DC
+            return False
+        return self.rebuild()
+
+    def determine_dc(self, num_nodes, edge_list):
+        incoming = [[] for _ in xrange(num_nodes + 1)]
+        for edge in edge_list:
+            incoming[edge.to].append(edge)
+        negative = [any(e.value < 0 for e in edges) for edges in incoming]
+        status = [CubicDc.NEW] * (num_nodes + 1)
+        for node in xrange(1, num_nodes + 1):
+            if negative[node] and status[node] == CubicDc.NEW:
+                if not self._process(node, incoming, negative, status):
+                    return False
+        return True
+
+    def _process(self, source, incoming, negative, status):
+        """Runs backpropagation from source and from the negative nodes it
+        needs. Recursion can be as deep as the number of nodes, so it is
+        kept on an explicit stack of generators."""
+        status[source] = CubicDc.IN_PROGRESS
+        self.iterations += 1
+        # entries are [source, propagation, path from needed node to source,
+        #              work done by propagation, time spent in it]
+        work = [0, 0]
+        stack = [[source, self._backprop(source, incoming, negative, work), None, work, 0.0]]
+        while stack:
+            entry = stack[-1]
+            start = time()
+            try:
+                needed, entry[2] = next(entry[1])
+            except StopIteration:
+                status[entry[0]] = CubicDc.DONE
+                stack.pop()
+                if self.stats is not None:
+                    pops, derived_edges = entry[3]
+                    self.stats.record('backprop', entry[4] + time() - start,
+                                      dijkstra_pops=pops, derived_edges=derived_edges)
+                continue
+            entry[4] += time() - start
+            if status[needed] == CubicDc.IN_PROGRESS:
+                # negative cycle: needed node reaches sources of all the
+                # propagations above its own, and then itself
+                cycle = []
+                for entry in reversed(stack):
+                    cycle.extend(self._path(*entry[2]))
+                    if entry[0] == needed:
+                        break
+                self.negative_cycle = cycle
+                return False
+            if status[needed] == CubicDc.NEW:
+                status[needed] = CubicDc.IN_PROGRESS
+                self.iterations += 1
+                work = [0, 0]
+                stack.append([needed, self._backprop(needed, incoming, negative, work),
+                              None, work, 0.0])
+        return True
+
+    def _path(self, previous, state):
+        """Edges of the path found by _backprop from state to its source."""
+        path = []
+        while state is not None:
+            edge, state = previous[state]
+            path.append(edge)
+        return path
+
+    def _backprop(self, source, incoming, negative, work):
+        """Propagates backwards from source, adding a non-negative edge to
+        source from every node where distance stops being negative.
+        Yields negative nodes which have to be processed before their
+        incoming edges can be used, together with the path which led
+        there (see _path). When done, numbers of states popped and edges
+        added are left in work."""
+        # Search states are (node, letter): letter is set if the path
+        # starts with an upper case edge, in which case the lower case
+        # edge of the same contingent link cannot precede it.
+        distance = {}
+        # state -> (first edge of the path, next state)
+        previous = {}
+        q = []
+        for edge in incoming[source]:
+            if edge.value < 0:
+                letter = edge.maybe_letter if edge.type == EdgeType.UPPER_CASE else None
+                state = (edge.fro, letter)
+                if state not in distance or distance[state] > edge.value:
+                    distance[state] = edge.value
+                    previous[state] = (edge, None)
+                    heappush(q, (edge.value, edge.fro, letter))
+        done = set()
+        reached = set()
+        pops = 0
+        while q:
+            node_distance, node, letter = heappop(q)
+            if (node, letter) in done:
+                continue
+            done.add((node, letter))
+            pops += 1
+            if node_distance >= 0:
+                # Edge is non-negative, so even if path starts with an
+                # upper case edge label removal applies.
+                if node != source and node not in reached:
+                    reached.add(node)
+                    self.derived_edges += 1
+                    incoming[source].append(Edge(node, source, node_distance,
+                                                 EdgeType.SIMPLE,
+                                                 contingent=letter,
+                                                 derived=True))
+                continue
+            if negative[node]:
+                # afterwards negative incoming edges of node are bypassed
+                # by the non-negative ones added while processing it
+                yield node, (previous, (node, letter))
+            for edge in incoming[node]:
+                if edge.value < 0:
+                    continue
+                if edge.type == EdgeType.LOWER_CASE and edge.maybe_letter == letter:
+                    continue
+                state = (edge.fro, letter)
+                new_distance = node_distance + edge.value
+                if state not in distance or distance[state] > new_distance:
+                    distance[state] = new_distance
+                    previous[state] = (edge, (node, letter))
+                    heappush(q, (new_distance, edge.fro, letter))
+        work[0] = pops
+        work[1] = len(reached)
+
+
+def _compact_dc(processes=1, **options):
+    """CompactDc, which is imported only when it is used, as it needs
+    numpy."""
+    from compact_dc import CompactDc
+    return CompactDc(processes, **options)
+
+ENGINES = {
+    'incremental': IncrementalDc,
+    'cubic': CubicDc,
+    'compact': _compact_dc,
+}
@@ -0,0 +1,128 @@
+import gflags
+import random
+import sys
+
+from stnu import NamedStnu, StnuEdge
+
+gflags.DEFINE_integer('nodes', 1000, 'Number of nodes')
+gflags.DEFINE_float('edges_per_node', 2.0, 'Number of requirement edges per node')
+gflags.DEFINE_float('contingent_ratio', 0.2,
+                    'Fraction of nodes which are ends of contingent links (at most 0.5)')
+gflags.DEFINE_enum('bounds', 'uniform', ['uniform', 'exponential'],
+                   'Distribution of gaps between consecutive nodes of the schedule')
+gflags.DEFINE_float('mean_gap', 10.0, 'Mean gap between consecutive nodes of the schedule')
+gflags.DEFINE_float('dc_bias', 0.9,
+                    'Probability that an edge tolerates uncertainty of contingent links '
+                    'at its ends; the higher, the more likely the network is DC')
+gflags.DEFINE_integer('seed', 0, 'Random seed')
+gflags.DEFINE_enum('format', 'parsable', ['parsable', 'xml'], 'Output format')
+gflags.DEFINE_string('network_output', '-', 'File to write the network to (- for stdout)')
+
+FLAGS = gflags.FLAGS
+
+def generate(num_nodes, edges_per_node=2.0, contingent_ratio=0.2,
+             bounds='uniform', mean_gap=10.0, dc_bias=0.9, seed=0):
+    """Generates random NamedStnu satisfying Stnu.verify_contraints, with
+    nodes named by their numbers. Same arguments give the same network.
+
+    Nodes are first scheduled one after another, with gaps drawn from
+    bounds distribution. Contingent links connect disjoint pairs of nodes,
+    with bounds around the scheduled duration. Requirement edges join
+    nodes i, i+1 and then random pairs of close nodes, with intervals
+    containing the scheduled distance, so the network is always
+    consistent. With probability dc_bias an interval is wide enough to
+    absorb the uncertainty of contingent links ending at its nodes, and
+    otherwise it is narrower, which makes the network less likely to be
+    DC.
+    """
+    assert num_nodes >= 2 and 0 <= contingent_ratio <= 0.5
+    rng = random.Random(seed)
+    rand = rng.random
+
+    # schedule
+    time = [0] * (num_nodes + 1)
+    for node in xrange(2, num_nodes + 1):
+        if bounds == 'uniform':
+            gap = int(rand() * 2 * mean_gap) + 1
+        else:
+            gap = int(rng.expovariate(1.0 / mean_gap)) + 1
+        time[node] = time[node - 1] + gap
+
+    network = NamedStnu()
+    network.num_nodes = num_nodes
+    names = [str(node) for node in xrange(num_nodes + 1)]
+    network._renaming = dict((names[node], node) for node in xrange(1, num_nodes + 1))
+    network._inverse_renaming = dict((node, names[node]) for node in xrange(1, num_nodes + 1))
+
+    # Contingent links: every node is in at most one of them, so that they
+    # are neither chained nor share ends.
+    uncertainty = [0] * (num_nodes + 1)
+    num_contingent = int(num_nodes * contingent_ratio)
+    paired = rng.sample(xrange(1, num_nodes + 1), 2 * num_contingent)
+    for i in xrange(num_contingent):
+        fro, to = sorted(paired[2 * i: 2 * i + 2])
+        duration = time[to] - time[fro]
+        spread = int(rand() * duration)
+        lower_bound = duration - spread // 2
+        upper_bound = lower_bound + spread
+        uncertainty[to] = spread
+        network.uncontrollable_edges.append(StnuEdge(fro, to, float(lower_bound),
+                                                     float(upper_bound)))
+
+    # Requirement edges. Ones which tolerate uncertainty are like
+    # precedence constraints: their upper bounds are past the end of the
+    # schedule, so nodes can wait for contingent links which end late.
+    horizon = time[num_nodes] + sum(uncertainty)
+    num_edges = max(num_nodes - 1, int(num_nodes * edges_per_node))
+    num_edges = min(num_edges, num_nodes * (num_nodes - 1) // 2)
+    reach = max(2, int(2 * edges_per_node))
+    pairs = set()
+    controllable_edges = network.controllable_edges
+    while len(controllable_edges) < num_edges:
+        if len(controllable_edges) < num_nodes - 1:
+            fro = len(controllable_edges) + 1
+            to = fro + 1
+        else:
+            fro = int(rand() * (num_nodes - 1)) + 1
+            to = min(num_nodes, fro + 1 + int(rng.expovariate(1.0 / reach)))
+        if (fro, to) in pairs:
+            continue
+        pairs.add((fro, to))
+        distance = time[to] - time[fro]
+        needed = uncertainty[fro] + uncertainty[to]
+        if rand() < dc_bias:
+            lower_bound = distance - needed - int(rand() * mean_gap)
+            upper_bound = distance + horizon
+        else:
+            lower_bound = distance - int(rand() * (needed + 1))
+            upper_bound = distance + int(rand() * (needed + 1))
+        controllable_edges.append(StnuEdge(fro, to, float(lower_bound), float(upper_bound)))
+    return network
+
+def main():
+    FLAGS.UseGnuGetOpt()
+    try:
+        FLAGS(sys.argv)
+    except gflags.FlagsError as e:
+        print >> sys.stderr, '%s\nUsage: %s [flags]\n%s' % (e, sys.argv[0], FLAGS)
+        sys.exit(1)
+
+    network = generate(FLAGS.nodes,
+                       edges_per_node=FLAGS.edges_per_node,
+                       contingent_ratio=FLAGS.contingent_ratio,
+                       bounds=FLAGS.bounds,
+                       mean_gap=FLAGS.mean_gap,
+                       dc_bias=FLAGS.dc_bias,
+                       seed=FLAGS.seed)
+    output = sys.stdout if FLAGS.network_output == '-' else open(FLAGS.network_output, 'w')
+    try:
+        if FLAGS.format == 'xml':
+            network.write_xml(output)
+        else:
+            network.write_parsable(output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == '__main__':
+    main()
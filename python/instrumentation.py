@@ -0,0 +1,66 @@
+class Instrumentation(object):
+    """Timers and counters of solver phases.
+
+    Solvers with instrumentation set call record once at the end of every
+    phase (generate_graph, allmax, reduce_lower_case, ...), with the time
+    it took and the counts of work done in it. Totals are kept for
+    summary and every record is passed to the observers, which are called
+    as observer(phase, seconds, counters). Solvers without
+    instrumentation (the default) only skip the calls, so it costs next
+    to nothing when disabled.
+    """
+
+    def __init__(self, observers=()):
+        self.observers = list(observers)
+        self.reset()
+
+    def reset(self):
+        # phase -> [calls, total time]
+        self._phases = {}
+        self._counters = {}
+        self._values = {}
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def record(self, phase, seconds, **counters):
+        """Records one run of phase, adding counters to the totals."""
+        totals = self._phases.get(phase)
+        if totals is None:
+            totals = self._phases[phase] = [0, 0.0]
+        totals[0] += 1
+        totals[1] += seconds
+        for name, value in counters.iteritems():
+            self._counters[name] = self._counters.get(name, 0) + value
+        for observer in self.observers:
+            observer(phase, seconds, counters)
+
+    def set(self, name, value):
+        """Records a value which is not summed up, like iteration limit."""
+        self._values[name] = value
+
+    def merge(self, summary):
+        """Adds totals from summary of another Instrumentation (e.g. of
+        a worker process) without calling observers."""
+        for phase, totals in summary['phases'].iteritems():
+            mine = self._phases.setdefault(phase, [0, 0.0])
+            mine[0] += totals['calls']
+            mine[1] += totals['time']
+        for name, value in summary['counters'].iteritems():
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def summary(self):
+        """Returns totals as a dict (JSON serializable):
+            phases - phase -> {'calls': ..., 'time': ...}
+            counters - counter -> total over all records
+            values - last values passed to set
+        """
+        return {
+            'phases': dict((phase, {'calls': calls, 'time': seconds})
+                           for phase, (calls, seconds) in self._phases.iteritems()),
+            'counters': dict(self._counters),
+            'values': dict(self._values),
+        }
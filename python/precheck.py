@@ -0,0 +1,118 @@
+from collections import defaultdict
+
+from dispatch import EPSILON, potentials, shortest_paths
+
+
+# tiers in the order they are tried, cheapest first
+TIERS = ['stn', 'allmax', 'pseudo', 'strong']
+
+def precheck(stnu):
+    """Tries to decide dynamic controllability of stnu by tests which are
+    much cheaper than solving. Returns (verdict, tier) where tier (one of
+    TIERS) is the test that decided it, or (None, None) if none did:
+        stn - network without contingent links is DC iff it is consistent
+        allmax - network whose AllMax projection (requirement edges and
+                 contingent links taking the longest, as the first
+                 round of FastDc sees them) is inconsistent is not DC
+        pseudo - network is not DC if it is not pseudo-controllable, i.e.
+                 if its requirement edges squeeze a contingent link
+                 ("Dynamic Control of Plans with Temporal Uncertainty" by
+                 Morris, Muscettola and Vidal, section 4)
+        strong - network which is strongly controllable (has a fixed
+                 schedule of controllable timepoints which works for all
+                 durations of contingent links) is DC
+    The first two take a single Bellman-Ford, pseudo a pair of Dijkstras
+    for every activation timepoint and strong another Bellman-Ford.
+    """
+    inf = float('inf')
+    num_nodes = stnu.num_nodes
+    links = stnu.uncontrollable_edges
+    # distance graph of the network with contingent links as requirement
+    # edges, as adjacency lists of (to, value)
+    outgoing = [[] for _ in xrange(num_nodes + 1)]
+    for e in stnu.controllable_edges + links:
+        if e.upper_bound != inf:
+            outgoing[e.fro].append((e.to, e.upper_bound))
+        if e.lower_bound != -inf:
+            outgoing[e.to].append((e.fro, -e.lower_bound))
+
+    # AllMax projection: contingent timepoints as late as they can be
+    allmax = [list(neighbors) for neighbors in outgoing]
+    for e in links:
+        allmax[e.to].append((e.fro, -e.upper_bound))
+    try:
+        potential = potentials(num_nodes, allmax)
+    except ValueError:
+        return False, 'stn' if not links else 'allmax'
+    if not links:
+        return True, 'stn'
+
+    # Removing edges keeps potentials valid, so these work for the network
+    # itself as well.
+    incoming = [[] for _ in xrange(num_nodes + 1)]
+    for fro, neighbors in enumerate(outgoing):
+        for to, value in neighbors:
+            incoming[to].append((fro, value))
+    reverse_potential = [-p for p in potential]
+    by_activation = defaultdict(list)
+    for e in links:
+        by_activation[e.fro].append(e)
+    for activation, activation_links in by_activation.iteritems():
+        after = shortest_paths(activation, outgoing, potential)
+        before = shortest_paths(activation, incoming, reverse_potential)
+        for e in activation_links:
+            if (after[e.to] < e.upper_bound - EPSILON * (1 + abs(e.upper_bound)) or
+                    before[e.to] < -e.lower_bound - EPSILON * (1 + abs(e.lower_bound))):
+                return False, 'pseudo'
+
+    if _strongly_controllable(stnu):
+        return True, 'strong'
+    return None, None
+
+def _strongly_controllable(stnu):
+    """Whether there is a schedule of controllable timepoints satisfying
+    all the requirement edges no matter how long contingent links take
+    (sufficient, but not necessary for DC). Every contingent timepoint is
+    its controllable ancestor plus an interval of durations, so requirement
+    edges become edges between controllable timepoints which must hold for
+    all of them ("Handling contingency in temporal constraint networks"
+    by Vidal and Fargier). Durations of links shared by both ends are
+    taken to be independent, which is only stricter."""
+    inf = float('inf')
+    num_nodes = stnu.num_nodes
+    link_of = dict((e.to, e) for e in stnu.uncontrollable_edges)
+    # node -> (controllable ancestor, earliest and latest offset from it)
+    ancestor = {}
+    def resolve(node):
+        chain = []
+        while node in link_of and node not in ancestor:
+            chain.append(node)
+            node = link_of[node].fro
+        root, lower, upper = ancestor.get(node, (node, 0, 0))
+        for member in reversed(chain):
+            e = link_of[member]
+            lower, upper = lower + e.lower_bound, upper + e.upper_bound
+            ancestor[member] = (root, lower, upper)
+        return root, lower, upper
+
+    outgoing = [[] for _ in xrange(num_nodes + 1)]
+    for e in stnu.controllable_edges:
+        fro, fro_lower, fro_upper = resolve(e.fro)
+        to, to_lower, to_upper = resolve(e.to)
+        # to - fro + (offset of e.to - offset of e.fro) within bounds for
+        # all the offsets
+        upper = e.upper_bound - (to_upper - fro_lower)
+        lower = e.lower_bound - (to_lower - fro_upper)
+        if fro == to:
+            if not lower <= 0 <= upper:
+                return False
+            continue
+        if upper != inf:
+            outgoing[fro].append((to, upper))
+        if lower != -inf:
+            outgoing[to].append((fro, -lower))
+    try:
+        potentials(num_nodes, outgoing)
+    except ValueError:
+        return False
+    return True
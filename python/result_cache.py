@@ -0,0 +1,166 @@
+import hashlib
+import json
+import os
+
+from collections import OrderedDict
+
+from stnu import gc_paused
+
+
+# rounds of color refinement done by fingerprint
+REFINEMENT_ROUNDS = 8
+
+def fingerprint(stnu, rounds=REFINEMENT_ROUNDS):
+    """Returns canonical fingerprint (hex string) of stnu: the same for
+    networks which differ only in order of edges and, as long as nodes
+    can be told apart by their neighbourhoods, in naming of nodes.
+
+    Nodes are colored by color refinement (every round a node's color
+    becomes the rank of its color together with colors and bounds of its
+    edges) and numbered by color, ties broken by name. The fingerprint is
+    a hash of the edges renumbered this way, so networks with the same
+    fingerprint are the same up to renaming of nodes and thus have the
+    same verdict. Symmetric nodes which refinement cannot tell apart only
+    make renamed copies of a network miss the cache.
+    """
+    with gc_paused():
+        return _fingerprint(stnu, rounds)
+
+def _fingerprint(stnu, rounds):
+    num_nodes = stnu.num_nodes
+    edges = [(e.fro, e.to, e.lower_bound, e.upper_bound, False)
+             for e in stnu.controllable_edges]
+    edges.extend((e.fro, e.to, e.lower_bound, e.upper_bound, True)
+                 for e in stnu.uncontrollable_edges)
+
+    # Edges of every node, as (label, neighbor). Labels number
+    # (direction, contingent, bounds) of edges, so that signatures in
+    # refinement are tuples of integers.
+    labels = sorted(set((contingent, lower_bound, upper_bound)
+                        for _, _, lower_bound, upper_bound, contingent in edges))
+    labels = dict((label, i) for i, label in enumerate(labels))
+    adjacency = [[] for _ in xrange(num_nodes + 1)]
+    for fro, to, lower_bound, upper_bound, contingent in edges:
+        label = 2 * labels[(contingent, lower_bound, upper_bound)]
+        adjacency[fro].append((label, to))
+        adjacency[to].append((label + 1, fro))
+
+    color = [0] * (num_nodes + 1)
+    num_colors = 1
+    for _ in xrange(rounds):
+        signature = [(color[node],) + tuple(sorted([label * num_colors + color[neighbor]
+                                                    for label, neighbor in adjacency[node]]))
+                     for node in xrange(num_nodes + 1)]
+        rank = dict((s, i) for i, s in enumerate(sorted(set(signature))))
+        if len(rank) == num_colors:
+            break
+        color = [rank[s] for s in signature]
+        num_colors = len(rank)
+
+    names = getattr(stnu, '_inverse_renaming', {})
+    order = sorted(xrange(1, num_nodes + 1),
+                   key=lambda node: (color[node], names.get(node, node)))
+    number = [0] * (num_nodes + 1)
+    for i, node in enumerate(order):
+        number[node] = i + 1
+    canonical = sorted((number[fro], number[to], lower_bound, upper_bound, contingent)
+                       for fro, to, lower_bound, upper_bound, contingent in edges)
+    return hashlib.sha1(repr((num_nodes, canonical))).hexdigest()
+
+def file_fingerprint(filename):
+    """Returns hash of contents of a network file, for looking up results
+    without parsing it."""
+    digest = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), ''):
+            digest.update(block)
+    return 'file-' + digest.hexdigest()
+
+class ResultCache(object):
+    """Results of checks (any JSON serializable values) by fingerprint.
+
+    Recently used results are kept in memory, at most max_entries of them
+    taking at most max_bytes (size of key and JSON of result). If
+    directory is given, results are also stored there, one file per
+    fingerprint, so that they survive the process and are shared with
+    other processes using the same directory. Files are written under
+    temporary names and renamed, so readers never see partial results.
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=16 << 20, directory=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        if directory is not None and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[-2:], key)
+
+    def get(self, key, default=None):
+        """Returns result for key, or default if there is none."""
+        if key in self._entries:
+            value, size = self._entries.pop(key)
+            self._entries[key] = (value, size)
+            self.hits += 1
+            return value
+        if self.directory is not None:
+            try:
+                with open(self._path(key), 'r') as f:
+                    value = json.load(f)
+            except (IOError, ValueError):
+                pass
+            else:
+                self._remember(key, value)
+                self.hits += 1
+                return value
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._remember(key, value)
+        if self.directory is not None:
+            path = self._path(key)
+            temporary_path = '%s.%d.tmp' % (path, os.getpid())
+            try:
+                if not os.path.isdir(os.path.dirname(path)):
+                    try:
+                        os.mkdir(os.path.dirname(path))
+                    except OSError:
+                        pass
+                with open(temporary_path, 'w') as f:
+                    json.dump(value, f)
+                os.rename(temporary_path, path)
+            except (IOError, OSError):
+                # results are still cached in memory
+                if os.path.exists(temporary_path):
+                    os.remove(temporary_path)
+
+    def _remember(self, key, value):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    def clear(self):
+        """Forgets results kept in memory (not the ones on disk)."""
+        self._entries.clear()
+        self._bytes = 0
@@ -0,0 +1,324 @@
+import gflags
+import json
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import time
+import traceback
+
+from multiprocessing import Process, Pipe
+
+from stnu import NamedStnu
+from fast_dc import DcTester, ENGINES
+
+gflags.DEFINE_string('socket', None, 'Unix socket to listen on')
+gflags.DEFINE_integer('port', 0, 'Port to listen on at localhost, if there is no --socket')
+gflags.DEFINE_enum('default_engine', 'incremental', ENGINES.keys(),
+                   'DC checking engine of sessions which do not choose one')
+
+FLAGS = gflags.FLAGS
+
+MAXFD = os.sysconf('SC_OPEN_MAX')
+
+USAGE = '''Usage: %s [flags]
+
+Serves DC checks of resident networks, so that clients do not start an
+interpreter and parse the network for every check. Requests and responses
+are JSON objects, one per line. Every request has 'op' and may have 'id',
+which is copied to the response. Failed requests get 'error'.
+
+    open (network in parsable format or file, optional engine)
+        -> session, nodes, edges
+    add_controllable_edge, add_uncontrollable_edge, update_controllable_edge,
+    update_uncontrollable_edge (session, fro, to, lower_bound, upper_bound)
+    remove_controllable_edge, remove_uncontrollable_edge (session, fro, to)
+    check (session) -> verdict ('dc' or 'notdc'), check_time
+    negative_cycle (session) -> negative_cycle (list of edges, or null)
+    close (session)
+
+Nodes are given by name; added edges can introduce new ones. Sessions are
+closed when the connection which opened them is. Every session has its own
+process, so a long check only delays further requests of its session.'''
+
+# ops which edit the network, with their arguments after session
+EDITS = {
+    'add_controllable_edge': ('fro', 'to', 'lower_bound', 'upper_bound'),
+    'add_uncontrollable_edge': ('fro', 'to', 'lower_bound', 'upper_bound'),
+    'update_controllable_edge': ('fro', 'to', 'lower_bound', 'upper_bound'),
+    'update_uncontrollable_edge': ('fro', 'to', 'lower_bound', 'upper_bound'),
+    'remove_controllable_edge': ('fro', 'to'),
+    'remove_uncontrollable_edge': ('fro', 'to'),
+}
+
+def _error(e):
+    return {'error': traceback.format_exception_only(type(e), e)[-1].strip()}
+
+class Session(object):
+    """Network of a client with DcTester checking it."""
+
+    def __init__(self, network, engine):
+        self.network = network
+        self.dc_tester = DcTester(network, engine=engine)
+
+    def node(self, name, add=False):
+        """Returns number of node with a given name. Unknown nodes are
+        added if add is set and are an error otherwise."""
+        if add:
+            return self.network.add_node(name)
+        if name not in self.network._renaming:
+            raise KeyError('no node %s' % (name,))
+        return self.network._renaming[name]
+
+    def edit(self, op, request):
+        args = [request[arg] for arg in EDITS[op]]
+        args[0] = self.node(args[0], op.startswith('add'))
+        args[1] = self.node(args[1], op.startswith('add'))
+        getattr(self.dc_tester, op)(*args)
+        return {}
+
+    def check(self):
+        start = time.time()
+        is_dc = self.dc_tester.is_dynamically_controllable()
+        return {'verdict': 'dc' if is_dc else 'notdc',
+                'check_time': time.time() - start}
+
+    def negative_cycle(self):
+        cycle = self.dc_tester.negative_cycle()
+        if cycle is not None:
+            cycle = [e._asdict() for e in cycle]
+        return {'negative_cycle': cycle}
+
+def open_session(request, default_engine):
+    network = NamedStnu()
+    if 'file' in request:
+        network.read_from_file(request['file'])
+    else:
+        network.read_from_buffer(request['network'])
+    return Session(network, request.get('engine', default_engine))
+
+def _worker_loop(connection, default_engine):
+    """Serves (session id, request) pairs sent by the server, until it
+    sends None. Sessions live here, so all their work is done by this
+    process."""
+    # descriptors inherited from the server, like its listening socket and
+    # connections of other clients, which would otherwise stay open
+    # as long as this process
+    fileno = connection.fileno()
+    os.closerange(3, fileno)
+    os.closerange(fileno + 1, MAXFD)
+    sessions = {}
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        session_id, request = message
+        op = request['op']
+        try:
+            if op == 'open':
+                session = sessions[session_id] = open_session(request, default_engine)
+                response = {'session': session_id,
+                            'nodes': session.network.num_nodes,
+                            'edges': session.network.num_edges}
+            elif op == 'close':
+                sessions.pop(session_id).dc_tester.close()
+                response = {}
+            elif op in EDITS:
+                response = sessions[session_id].edit(op, request)
+            elif op == 'check':
+                response = sessions[session_id].check()
+            elif op == 'negative_cycle':
+                response = sessions[session_id].negative_cycle()
+            else:
+                raise ValueError('unknown op %s' % (op,))
+        except Exception as e:
+            response = _error(e)
+        connection.send(response)
+
+class Worker(object):
+    """Process holding a session. Its requests are served one at a time,
+    so threads of the server take turns."""
+
+    def __init__(self, default_engine):
+        self._connection, worker_connection = Pipe()
+        self._lock = threading.Lock()
+        self.process = Process(target=_worker_loop, args=(worker_connection, default_engine))
+        self.process.daemon = True
+        self.process.start()
+        worker_connection.close()
+
+    def call(self, session_id, request):
+        with self._lock:
+            self._connection.send((session_id, request))
+            return self._connection.recv()
+
+    def stop(self):
+        with self._lock:
+            self._connection.send(None)
+        self.process.join()
+        self._connection.close()
+
+class Handler(SocketServer.StreamRequestHandler):
+    """Serves requests of one connection, in its own thread."""
+
+    def handle(self):
+        opened = set()
+        try:
+            for line in iter(self.rfile.readline, ''):
+                if not line.strip():
+                    continue
+                request = None
+                try:
+                    request = json.loads(line)
+                    response = self.server.serve(request, opened)
+                except Exception as e:
+                    response = _error(e)
+                if isinstance(request, dict) and 'id' in request:
+                    response['id'] = request['id']
+                self.wfile.write(json.dumps(response) + '\n')
+                self.wfile.flush()
+        except socket.error:
+            # client went away
+            pass
+        finally:
+            for session_id in opened:
+                self.server.close_session(session_id)
+
+# old style class, like the SocketServer classes it is mixed into
+class Service:
+    """Mixin of a threading server running every session in its own
+    worker, so that requests of different sessions do not wait for each
+    other."""
+
+    daemon_threads = True
+
+    def start_sessions(self, default_engine):
+        self._default_engine = default_engine
+        # session id -> worker
+        self._sessions = {}
+        self._next_session = 0
+        self._lock = threading.Lock()
+
+    def serve(self, request, opened):
+        """Returns response to request. Ids of sessions opened are added
+        to opened."""
+        op = request['op']
+        if op == 'open':
+            with self._lock:
+                session_id = self._next_session
+                self._next_session += 1
+            worker = Worker(self._default_engine)
+            with self._lock:
+                self._sessions[session_id] = worker
+            response = worker.call(session_id, request)
+            if 'error' in response:
+                self._forget(session_id)
+            else:
+                opened.add(session_id)
+            return response
+        session_id = request['session']
+        with self._lock:
+            worker = self._sessions.get(session_id)
+        if worker is None:
+            raise KeyError('no session %s' % (session_id,))
+        response = worker.call(session_id, request)
+        if op == 'close':
+            self._forget(session_id)
+            opened.discard(session_id)
+        return response
+
+    def close_session(self, session_id):
+        with self._lock:
+            worker = self._sessions.get(session_id)
+        if worker is not None:
+            worker.call(session_id, {'op': 'close'})
+            self._forget(session_id)
+
+    def _forget(self, session_id):
+        with self._lock:
+            worker = self._sessions.pop(session_id, None)
+        if worker is not None:
+            worker.stop()
+
+    def stop_workers(self):
+        with self._lock:
+            workers = self._sessions.values()
+            self._sessions.clear()
+        for worker in workers:
+            worker.stop()
+
+class UnixService(Service, SocketServer.ThreadingUnixStreamServer):
+    pass
+
+class TcpService(Service, SocketServer.ThreadingTCPServer):
+    allow_reuse_address = True
+
+def make_service(socket_path=None, port=0, default_engine='incremental'):
+    """Returns service listening on Unix socket_path or, if it is None, on
+    port at localhost (any free port if it is 0; see server_address)."""
+    service_class = TcpService if socket_path is None else UnixService
+    address = ('127.0.0.1', port) if socket_path is None else socket_path
+    service = service_class(address, Handler)
+    service.start_sessions(default_engine)
+    return service
+
+class Client(object):
+    """Client of the service, for Python callers. request sends one request
+    and returns the response, raising RuntimeError if it failed."""
+
+    def __init__(self, socket_path=None, port=0):
+        if socket_path is not None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.connect(socket_path)
+        else:
+            self._socket = socket.create_connection(('127.0.0.1', port))
+        self._file = self._socket.makefile('r+')
+
+    def request(self, op, **arguments):
+        arguments['op'] = op
+        self._file.write(json.dumps(arguments) + '\n')
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise RuntimeError('service closed the connection')
+        response = json.loads(line)
+        if 'error' in response:
+            raise RuntimeError(response['error'])
+        return response
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+def main():
+    FLAGS.UseGnuGetOpt()
+    try:
+        argv = FLAGS(sys.argv)
+    except gflags.FlagsError as e:
+        print >> sys.stderr, '%s\n%s\n%s' % (e, USAGE % sys.argv[0], FLAGS)
+        sys.exit(1)
+    if len(argv) > 1:
+        print >> sys.stderr, '%s\n%s' % (USAGE % argv[0], FLAGS)
+        sys.exit(1)
+
+    if FLAGS.socket is not None and os.path.exists(FLAGS.socket):
+        # left by a previous run
+        os.remove(FLAGS.socket)
+    service = make_service(FLAGS.socket, FLAGS.port, FLAGS.default_engine)
+    print >> sys.stderr, 'listening on %s' % (service.server_address,)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.server_close()
+        service.stop_workers()
+        if FLAGS.socket is not None:
+            os.remove(FLAGS.socket)
+
+if __name__ == '__main__':
+    main()
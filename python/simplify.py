@@ -0,0 +1,276 @@
+from collections import defaultdict
+from fractions import Fraction
+
+from stnu import NamedStnu, StnuEdge, gc_paused
+
+
+class Simplification(object):
+    """Result of simplify:
+        network - the simplified NamedStnu, DC if and only if the original
+                  network is
+        mapping - name of a node of the original network -> (name of node
+                  of network, offset): the node is executed offset after
+                  that node
+        implied_bounds - number of bounds of requirement edges dropped,
+                  because paths of other edges imply them (edges with
+                  both bounds dropped are removed)
+    Names of nodes added for shared normalization of contingent links end
+    with "'" and the lower bound, like normalization nodes of FastDc.
+    """
+
+    def __init__(self, network, mapping, implied_bounds=0):
+        self.network = network
+        self.mapping = mapping
+        self.implied_bounds = implied_bounds
+
+    @property
+    def changed(self):
+        return (self.implied_bounds > 0 or
+                any(offset != 0 or name != node
+                    for node, (name, offset) in self.mapping.iteritems()) or
+                len(self.mapping) != self.network.num_nodes)
+
+    def original_times(self, times):
+        """Returns times of nodes of the original network, given times of
+        nodes of the simplified one (both as dicts by name)."""
+        return dict((node, times[name] + offset)
+                    for node, (name, offset) in self.mapping.iteritems())
+
+def simplify(stnu):
+    """Returns Simplification of stnu. Takes O(M * D) time for M edges and
+    nodes of degree at most D.
+
+    Rigid components (nodes joined by requirement edges with equal
+    bounds, or contingent links without uncertainty) become a single
+    node: the earliest one, with the rest executed at fixed offsets
+    after it, so no decision is made earlier than in the original
+    network. A component keeps its contingent timepoint only if that is
+    its earliest node, otherwise it is not collapsed.
+
+    Then bounds of requirement edges implied by paths of two other edges
+    are dropped, one edge at a time, so that a bound is never dropped
+    because of one that is dropped later. Finally contingent links from
+    the same node with the same lower bound share one normalization node.
+
+    Inconsistencies found on the way (rigid cycles of nonzero length,
+    requirement edges with empty intersection) are left to the solver,
+    by returning the network unchanged.
+    """
+    with gc_paused():
+        return _simplify(stnu)
+
+def _unchanged(stnu, names):
+    network = NamedStnu()
+    network.num_nodes = stnu.num_nodes
+    network._renaming = dict((names[node], node) for node in xrange(1, stnu.num_nodes + 1))
+    network._inverse_renaming = dict((node, names[node]) for node in xrange(1, stnu.num_nodes + 1))
+    network.controllable_edges = list(stnu.controllable_edges)
+    network.uncontrollable_edges = list(stnu.uncontrollable_edges)
+    return Simplification(network, dict((names[node], (names[node], 0))
+                                         for node in xrange(1, stnu.num_nodes + 1)))
+
+def _simplify(stnu):
+    num_nodes = stnu.num_nodes
+    inverse_renaming = getattr(stnu, '_inverse_renaming', {})
+    names = [None] + [inverse_renaming.get(node, str(node)) for node in xrange(1, num_nodes + 1)]
+
+    requirements = list(stnu.controllable_edges)
+    links = []
+    for e in stnu.uncontrollable_edges:
+        if e.lower_bound == e.upper_bound:
+            # no uncertainty, so it is a requirement
+            requirements.append(e)
+        else:
+            links.append(e)
+
+    root, offset = _rigid_components(num_nodes, requirements, links)
+    if root is None:
+        return _unchanged(stnu, names)
+
+    # requirement edges between roots, as (fro, to) -> [lower, upper]
+    # with fro < to
+    bounds = {}
+    for e in requirements:
+        fro, to = root[e.fro], root[e.to]
+        lower = e.lower_bound + offset[e.fro] - offset[e.to]
+        upper = e.upper_bound + offset[e.fro] - offset[e.to]
+        if fro == to:
+            if not lower <= 0 <= upper:
+                return _unchanged(stnu, names)
+            continue
+        if fro > to:
+            fro, to, lower, upper = to, fro, -upper, -lower
+        if (fro, to) in bounds:
+            old_lower, old_upper = bounds[(fro, to)]
+            lower, upper = max(lower, old_lower), min(upper, old_upper)
+            if lower > upper:
+                return _unchanged(stnu, names)
+        bounds[(fro, to)] = [lower, upper]
+    links = [StnuEdge(root[e.fro], e.to, e.lower_bound + offset[e.fro],
+                      e.upper_bound + offset[e.fro])
+             for e in links]
+
+    implied_bounds = _drop_implied(bounds, links)
+
+    # number nodes of the simplified network
+    renaming = {}
+    network = NamedStnu()
+    def node(name):
+        if name not in renaming:
+            renaming[name] = network.add_node(name)
+        return renaming[name]
+    mapping = {}
+    for original in xrange(1, num_nodes + 1):
+        mapping[names[original]] = (names[root[original]], offset[original])
+        node(names[root[original]])
+    inf = float('inf')
+    for (fro, to), (lower, upper) in sorted(bounds.iteritems()):
+        if lower == -inf and upper == inf:
+            continue
+        network.controllable_edges.append(StnuEdge(node(names[fro]), node(names[to]),
+                                                   lower, upper))
+
+    # contingent links with positive lower bound sharing start and lower
+    # bound get one normalization node
+    shared = defaultdict(int)
+    for e in links:
+        if e.lower_bound > 0:
+            shared[(e.fro, e.lower_bound)] += 1
+    for e in links:
+        if shared[(e.fro, e.lower_bound)] > 1:
+            name = "%s'%r" % (names[e.fro], e.lower_bound)
+            if name not in renaming:
+                network.controllable_edges.append(StnuEdge(node(names[e.fro]), node(name),
+                                                           e.lower_bound, e.lower_bound))
+            network.uncontrollable_edges.append(StnuEdge(node(name), node(names[e.to]), 0.0,
+                                                         e.upper_bound - e.lower_bound))
+        else:
+            network.uncontrollable_edges.append(StnuEdge(node(names[e.fro]), node(names[e.to]),
+                                                         e.lower_bound, e.upper_bound))
+    return Simplification(network, mapping, implied_bounds)
+
+def _rigid_components(num_nodes, requirements, links):
+    """Returns root and offset of every node (it is executed offset after
+    root), or (None, None) if a rigid cycle has nonzero length."""
+    parent = range(num_nodes + 1)
+    # offset from parent
+    offset = [0] * (num_nodes + 1)
+
+    def find(node):
+        path = []
+        while parent[node] != node:
+            path.append(node)
+            node = parent[node]
+        # compress, from the one closest to the root
+        for member in reversed(path):
+            if parent[member] != node:
+                offset[member] += offset[parent[member]]
+                parent[member] = node
+        return node
+
+    for e in requirements:
+        if e.lower_bound != e.upper_bound:
+            continue
+        fro, to = find(e.fro), find(e.to)
+        # to_node = fro_node + bound, so root of to is this far from root of fro
+        distance = offset[e.fro] + e.lower_bound - offset[e.to]
+        if fro == to:
+            if distance != 0:
+                return None, None
+            continue
+        parent[to] = fro
+        offset[to] = distance
+    for node in xrange(1, num_nodes + 1):
+        find(node)
+
+    members = defaultdict(list)
+    for node in xrange(1, num_nodes + 1):
+        members[parent[node]].append(node)
+    contingent = set(e.to for e in links)
+    activations = set(e.fro for e in links)
+    root = range(num_nodes + 1)
+    result_offset = [0] * (num_nodes + 1)
+    for group in members.itervalues():
+        if len(group) == 1:
+            continue
+        earliest = min(group, key=lambda node: (offset[node], node not in contingent, node))
+        ends = [node for node in group if node in contingent]
+        if ends and (len(ends) > 1 or ends[0] != earliest or
+                     any(node in activations for node in group)):
+            # contingent timepoint which has to wait for others, or which
+            # would start a contingent link
+            continue
+        for node in group:
+            root[node] = earliest
+            result_offset[node] = offset[node] - offset[earliest]
+    return root, result_offset
+
+def _at_most(a, b, bound):
+    """Whether a + b <= bound, exactly."""
+    total = a + b
+    # if the rounded sum is less than bound, the exact one is as well
+    return total < bound or (total == bound and Fraction(a) + Fraction(b) <= Fraction(bound))
+
+def _drop_implied(bounds, links):
+    """Sets bounds implied by paths of two other edges to infinity, in
+    place, and returns how many were."""
+    inf = float('inf')
+    # distance graph: node -> neighbor -> length of shortest edge
+    outgoing = defaultdict(dict)
+    def add(fro, to, value):
+        if value < outgoing[fro].get(to, inf):
+            outgoing[fro][to] = value
+    for (fro, to), (lower, upper) in bounds.iteritems():
+        add(fro, to, upper)
+        add(to, fro, -lower)
+    # contingent links are guaranteed, so they imply bounds as well
+    for e in links:
+        add(e.fro, e.to, e.upper_bound)
+        add(e.to, e.fro, -e.lower_bound)
+    incoming = defaultdict(dict)
+    for fro, neighbors in outgoing.iteritems():
+        for to, value in neighbors.iteritems():
+            incoming[to][fro] = value
+    link_value = {}
+    for e in links:
+        link_value[(e.fro, e.to)] = e.upper_bound
+        link_value[(e.to, e.fro)] = -e.lower_bound
+
+    def implied(fro, to, value):
+        """Whether fro -> to of length value is implied by a path of two
+        edges."""
+        after, before = outgoing[fro], incoming[to]
+        if len(after) > len(before):
+            return any(middle in after and _at_most(after[middle], length, value)
+                       for middle, length in before.iteritems() if middle != fro)
+        return any(middle in before and _at_most(length, before[middle], value)
+                   for middle, length in after.iteritems() if middle != to)
+
+    def drop(fro, to, value):
+        """Removes edge fro -> to of length value from the graph if it is
+        implied, returning whether it was."""
+        link = link_value.get((fro, to), inf)
+        if link <= value:
+            # the contingent link parallel to it is at least as tight
+            return True
+        if not implied(fro, to, value):
+            return False
+        if link == inf:
+            del outgoing[fro][to]
+            del incoming[to][fro]
+        else:
+            outgoing[fro][to] = incoming[to][fro] = link
+        return True
+
+    dropped = 0
+    # widest edges first, they are the most likely to be implied
+    for (fro, to), interval in sorted(bounds.iteritems(),
+                                      key=lambda item: item[1][0] - item[1][1]):
+        lower, upper = interval
+        if upper != inf and drop(fro, to, upper):
+            interval[1] = inf
+            dropped += 1
+        if lower != -inf and drop(to, fro, -lower):
+            interval[0] = -inf
+            dropped += 1
+    return dropped
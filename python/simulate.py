@@ -0,0 +1,311 @@
+import gflags
+import json
+import sys
+import time
+
+import numpy as np
+
+from stnu import NamedStnu
+from fast_dc import DcTester
+
+gflags.DEFINE_integer('scenarios', 100000, 'Number of scenarios to simulate')
+gflags.DEFINE_integer('simulation_batch_size', 10000, 'Number of scenarios simulated at once')
+gflags.DEFINE_integer('simulation_seed', None, 'Seed of the random number generator of scenarios')
+gflags.DEFINE_enum('distribution', 'uniform', ['uniform', 'triangular', 'normal'],
+                   'Distribution of durations of all the contingent links (see '
+                   'simulate.distribution)')
+
+FLAGS = gflags.FLAGS
+
+USAGE = '''Usage: %s [flags] network
+
+Simulates execution of a DC network (file or parsable format on stdin) for
+many scenarios of durations of its contingent links and prints a summary
+of how it went as JSON (see SimulationResult.summary).'''
+
+# Times are sums of floats, so constraints are checked with this
+# tolerance, like in dispatch.Dispatcher.
+TOLERANCE = 1e-9
+
+def distribution(kind, lower, upper):
+    """Returns sampler of durations of a contingent link with given
+    bounds, as sample(random_state, size):
+        uniform - uniform within the bounds
+        triangular - triangular within the bounds, with mode in the middle
+        normal - normal with mean in the middle and standard deviation a
+                 sixth of the width, so durations are out of bounds in
+                 about 0.3% of the scenarios (never below 0 though)
+    """
+    middle = (lower + upper) / 2.0
+    if kind == 'uniform':
+        return lambda random_state, size: random_state.uniform(lower, upper, size)
+    if kind == 'triangular':
+        if lower == upper:
+            return lambda random_state, size: np.full(size, float(lower))
+        return lambda random_state, size: random_state.triangular(lower, middle, upper, size)
+    if kind == 'normal':
+        return lambda random_state, size: np.maximum(
+                0, random_state.normal(middle, (upper - lower) / 6.0, size))
+    raise ValueError('unknown distribution %s' % (kind,))
+
+def _percentiles(values):
+    if len(values) == 0:
+        return None
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {'mean': float(values.mean()), 'min': float(values.min()),
+            'p5': float(p5), 'p50': float(p50), 'p95': float(p95),
+            'max': float(values.max())}
+
+class SimulationResult(object):
+    """Outcome of simulate, one entry per scenario:
+        success - all requirement edges were satisfied
+        in_bounds - all durations were within bounds of their contingent
+                  links (DC guarantees success only for those)
+        slack - how far the tightest upper bound of a requirement edge
+                was from being exceeded (negative if it was); timepoints
+                are executed as early as they can, so lower bounds are
+                met with no slack to speak of
+        makespan - time from the first to the last timepoint
+        times - (scenario, node) times of timepoints, numbered as in the
+                network, if they were kept
+    and violations - number of scenarios in which every requirement edge
+    (in order of controllable_edges of the network) was violated.
+    """
+
+    def __init__(self, network, success, in_bounds, slack, makespan, violations,
+                 times=None):
+        self.network = network
+        self.success = success
+        self.in_bounds = in_bounds
+        self.slack = slack
+        self.makespan = makespan
+        self.violations = violations
+        self.times = times
+
+    @property
+    def scenarios(self):
+        return len(self.success)
+
+    def summary(self, most_violated=5):
+        """Returns statistics of the scenarios as a dict (JSON
+        serializable), with up to most_violated requirement edges which
+        were violated the most, by name."""
+        names = getattr(self.network, '_inverse_renaming', {})
+        violated = []
+        for i in np.argsort(-self.violations, kind='mergesort')[:most_violated]:
+            if self.violations[i] == 0:
+                break
+            e = self.network.controllable_edges[i]
+            violated.append({'fro': names.get(e.fro, e.fro), 'to': names.get(e.to, e.to),
+                             'scenarios': int(self.violations[i])})
+        in_bounds = self.in_bounds.sum()
+        return {
+            'scenarios': self.scenarios,
+            'success_rate': float(self.success.mean()) if self.scenarios else None,
+            'in_bounds_rate': float(self.in_bounds.mean()) if self.scenarios else None,
+            'success_rate_in_bounds': (float(self.success[self.in_bounds].mean())
+                                       if in_bounds else None),
+            'slack': _percentiles(self.slack[np.isfinite(self.slack)]),
+            'makespan': _percentiles(self.makespan),
+            'most_violated': violated,
+        }
+
+class Simulator(object):
+    """Executes the dispatchable form of a DC network (see
+    dispatch.DispatchableNetwork) for many scenarios at once.
+
+    The strategy is the one of dispatch.Dispatcher with every controllable
+    timepoint executed as soon as it is enabled and its window (including
+    waits for contingent timepoints) opens, starting at time 0. Events
+    then happen in order of time, so an edge from a timepoint executed
+    earlier which does not make it a predecessor (its lower bound is at
+    most the time of that timepoint) never delays anything. Time of
+    a controllable timepoint is therefore the largest of:
+        - 0, if it has no predecessors
+        - time of p minus value of edge to p, for every predecessor p
+          (end of a negative edge)
+        - for every wait, its end or the time its contingent timepoint
+          is observed (which lifts the wait), whichever is earlier
+    and timepoints can be timed one after another, in order of these
+    dependencies, each for all the scenarios at once with numpy. That
+    takes O(E + W) per scenario, for E edges and W waits.
+    """
+
+    def __init__(self, network, dispatchable):
+        self.network = network
+        size = dispatchable.num_nodes + 1
+        self.size = size
+        # node -> (timepoints it depends on, values subtracted from their
+        # times) for predecessors, and (activations, values, contingent
+        # timepoints) for waits
+        predecessors = [([], []) for _ in xrange(size)]
+        waits = [([], [], []) for _ in xrange(size)]
+        depends_on = [set() for _ in xrange(size)]
+        for fro, neighbors in dispatchable.edges.iteritems():
+            for to, value in neighbors:
+                if value < 0:
+                    predecessors[fro][0].append(to)
+                    predecessors[fro][1].append(value)
+                    depends_on[fro].add(to)
+        for node, activation, letter, value in dispatchable.waits:
+            for column, item in zip(waits[node], (activation, value, letter)):
+                column.append(item)
+            depends_on[node].update([activation, letter])
+
+        # timepoints executed by nature or automatically: contingent ones
+        # and normalization nodes, offset after activation
+        self.contingent = sorted(dispatchable.contingent)
+        self.links = [dispatchable.contingent[c] for c in self.contingent]
+        # node -> (activation, index of link or offset)
+        automatic = {}
+        for k, c in enumerate(self.contingent):
+            automatic[c] = (dispatchable.contingent[c][0], k)
+        for node, (activation, offset) in dispatchable.normalization.iteritems():
+            automatic[node] = (activation, float(offset))
+        for node, (activation, _) in automatic.iteritems():
+            depends_on[node] = set([activation])
+
+        # steps in order of dependencies (Kahn)
+        dependents = [[] for _ in xrange(size)]
+        remaining = [len(depends_on[node]) for node in xrange(size)]
+        for node in xrange(1, size):
+            for dependency in depends_on[node]:
+                dependents[dependency].append(node)
+        ready = [node for node in xrange(1, size) if remaining[node] == 0]
+        self.steps = []
+        while ready:
+            node = ready.pop()
+            if node in automatic:
+                self.steps.append((node, automatic[node]))
+            else:
+                nodes, values = predecessors[node]
+                activations, wait_values, letters = waits[node]
+                self.steps.append((node, (np.array(nodes, dtype=int),
+                                          np.array(values, dtype=float)[:, None],
+                                          np.array(activations, dtype=int),
+                                          np.array(wait_values, dtype=float)[:, None],
+                                          np.array(letters, dtype=int))))
+            for dependent in dependents[node]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+        if len(self.steps) != size - 1:
+            raise ValueError('timepoints wait for each other in a cycle')
+
+    def run(self, durations):
+        """Returns (scenario, node) times of execution for durations,
+        a (scenario, link) array in order of self.contingent. Node 0 is
+        not a timepoint, its time is nan."""
+        batch = durations.shape[0]
+        # (node, scenario), so that gathering nodes copies whole rows
+        times = np.empty((self.size, batch))
+        times[0] = np.nan
+        durations = durations.T
+        for node, step in self.steps:
+            if len(step) == 2:
+                activation, delay = step
+                if isinstance(delay, int):
+                    delay = durations[delay]
+                times[node] = times[activation] + delay
+                continue
+            nodes, values, activations, wait_values, letters = step
+            if len(nodes) == 0 and len(activations) == 0:
+                times[node] = 0
+                continue
+            node_time = np.full(batch, -np.inf)
+            if len(nodes):
+                node_time = (times[nodes] - values).max(axis=0)
+            if len(activations):
+                waits = np.minimum(times[activations] - wait_values, times[letters])
+                node_time = np.maximum(node_time, waits.max(axis=0))
+            times[node] = node_time
+        return times.T
+
+def simulate(network, distributions=None, scenarios=100000, batch_size=10000,
+             seed=None, keep_times=False):
+    """Simulates execution of a DC network (Stnu) in scenarios sampled
+    from distributions of durations of its contingent links and returns
+    SimulationResult. distributions maps contingent timepoints to
+    samplers (see distribution); links which are not there take uniform
+    durations within their bounds. Raises ValueError if the network is
+    not DC."""
+    start = time.time()
+    dispatchable = DcTester(network).dispatchable()
+    if dispatchable is None:
+        raise ValueError('network is not DC')
+    simulator = Simulator(network, dispatchable)
+    distributions = distributions or {}
+    random_state = np.random.RandomState(seed)
+    links = simulator.links
+    samplers = [distributions.get(c) or distribution('uniform', lower, upper)
+                for c, (_, lower, upper) in zip(simulator.contingent, links)]
+    lower_bounds = np.array([lower for _, lower, _ in links], dtype=float)
+    upper_bounds = np.array([upper for _, _, upper in links], dtype=float)
+
+    edges = network.controllable_edges
+    fro = np.array([e.fro for e in edges], dtype=int)
+    to = np.array([e.to for e in edges], dtype=int)
+    edge_lower = np.array([e.lower_bound for e in edges], dtype=float)
+    edge_upper = np.array([e.upper_bound for e in edges], dtype=float)
+    nodes = np.arange(1, network.num_nodes + 1)
+
+    success, in_bounds, slack, makespan, all_times = [], [], [], [], []
+    violations = np.zeros(len(edges), dtype=int)
+    for begin in xrange(0, scenarios, batch_size):
+        batch = min(batch_size, scenarios - begin)
+        durations = np.empty((batch, len(links)))
+        for k, sample in enumerate(samplers):
+            durations[:, k] = sample(random_state, batch)
+        times = simulator.run(durations)
+        difference = times[:, to] - times[:, fro]
+        violated = ((difference < edge_lower - TOLERANCE) |
+                    (difference > edge_upper + TOLERANCE))
+        violations += violated.sum(axis=0)
+        success.append(~violated.any(axis=1))
+        in_bounds.append(((durations >= lower_bounds) & (durations <= upper_bounds)).all(axis=1))
+        slack.append((edge_upper - difference).min(axis=1) if len(edges) else
+                     np.full(batch, np.inf))
+        network_times = times[:, nodes]
+        makespan.append(network_times.max(axis=1) - network_times.min(axis=1))
+        if keep_times:
+            all_times.append(times[:, :network.num_nodes + 1])
+    result = SimulationResult(network,
+                              np.concatenate(success) if success else np.zeros(0, dtype=bool),
+                              np.concatenate(in_bounds) if in_bounds else np.zeros(0, dtype=bool),
+                              np.concatenate(slack) if slack else np.zeros(0),
+                              np.concatenate(makespan) if makespan else np.zeros(0),
+                              violations,
+                              np.concatenate(all_times) if all_times else None)
+    result.simulation_time = time.time() - start
+    return result
+
+def main():
+    FLAGS.UseGnuGetOpt()
+    try:
+        argv = FLAGS(sys.argv)
+    except gflags.FlagsError as e:
+        print >> sys.stderr, '%s\n%s\n%s' % (e, USAGE % sys.argv[0], FLAGS)
+        sys.exit(1)
+    if len(argv) > 2:
+        print >> sys.stderr, '%s\n%s' % (USAGE % argv[0], FLAGS)
+        sys.exit(1)
+
+    network = NamedStnu()
+    if len(argv) == 2:
+        network.read_from_file(argv[1])
+    else:
+        network.read_from_buffer(sys.stdin.read())
+    distributions = dict((e.to, distribution(FLAGS.distribution, e.lower_bound, e.upper_bound))
+                         for e in network.uncontrollable_edges)
+    try:
+        result = simulate(network, distributions, FLAGS.scenarios, FLAGS.simulation_batch_size,
+                          FLAGS.simulation_seed)
+    except ValueError as e:
+        print >> sys.stderr, e
+        sys.exit(1)
+    summary = result.summary()
+    summary['simulation_time'] = result.simulation_time
+    print json.dumps(summary, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,78 @@
+import gc
+import glob
+import mmap
+import os
+import struct
+import sys
+import xml.etree.cElementTree as ET
+
+from array import array
 from collections import namedtuple, defaultdict
+from contextlib import contextmanager
+from itertools import izip
 
 
 StnuEdge = namedtuple('StnuEdge', ['fro', 'to', 'lower_bound', 'upper_bound'])
 
+NETWORK_EXTENSIONS = ('.xml', '.in', '.stnu')
+
+# Binary format: header, then names of nodes 1..num_nodes separated by NUL
+# and then, for controllable and for uncontrollable edges, arrays of all
+# the fros, tos (int32), lower bounds and upper bounds (float64). Numbers
+# are little endian.
+BINARY_MAGIC = 'STNU'
+BINARY_VERSION = 1
+# magic, version, num_nodes, number of controllable and uncontrollable
+# edges, length of name table
+BINARY_HEADER = struct.Struct('<4sIIIIQ')
+
+@contextmanager
+def gc_paused():
+    """Disables cyclic garbage collector, which otherwise runs over and over
+    while a large network is created, although edges never form cycles."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def xml_cache_file(filename):
+    """Returns path of binary copy of XML network cached next to it."""
+    return filename + '.cache'
+
+def network_files(inputs):
+    """Yields paths of network files named by inputs. Every input is
+    a directory (all .xml, .in and .stnu files in it), a glob pattern, a network
+    file or a manifest (any other file) listing one input per line,
+    relative to the manifest."""
+    for path in inputs:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(NETWORK_EXTENSIONS):
+                    yield os.path.join(path, name)
+        elif path.endswith(NETWORK_EXTENSIONS):
+            for filename in sorted(glob.glob(path)) or [path]:
+                yield filename
+        elif os.path.isfile(path):
+            base = os.path.dirname(path)
+            with open(path, 'r') as manifest:
+                entries = [line.strip() for line in manifest]
+            entries = [os.path.join(base, entry) for entry in entries
+                       if entry and not entry.startswith('#')]
+            for filename in network_files(entries):
+                yield filename
+        else:
+            # glob pattern for directories or manifests
+            matches = [match for match in sorted(glob.glob(path))
+                       if os.path.isdir(match) or os.path.isfile(match)]
+            if not matches:
+                # missing file, reported when it is read
+                yield path
+            for filename in network_files(matches):
+                yield filename
+
 class Stnu(object):
     def __init__(self):
         self.reset()
@@ -33,11 +103,13 @@ class Stnu(object):
         uncontrollable_ends = set()
         for edge in self.uncontrollable_edges:
             # Check bounds on edges. Notice that below 0 is disallowed in
-            # contrast to controllable edges
+            # contrast to controllable edges, and so is an infinite upper
+            # bound, as the engines assume contingent links always end.
             uncontrollable_starts.add(edge.fro)
             uncontrollable_ends.add(edge.to)
             input_degree[edge.to] += 1
             assert 0 <= edge.lower_bound and edge.lower_bound <= edge.upper_bound            
+            assert edge.upper_bound != float('inf')
             pairs.append((edge.fro, edge.to))
 
         # no two uncontrollable edges are one after another in the network.
@@ -64,30 +136,227 @@ class NamedStnu(Stnu):
         self._renaming = {}
         self._inverse_renaming = {}
 
+    def add_node(self, name):
+        """Returns number of node with a given name, adding it to the network
+        if it is not there yet."""
+        if name not in self._renaming:
+            self.num_nodes += 1
+            self._renaming[name] = self.num_nodes
+            self._inverse_renaming[self.num_nodes] = name
+        return self._renaming[name]
+
     def read_from_stdin(self):
+        self.read_from_buffer(sys.stdin.read())
+
+    def read_from_file(self, filename, cache=False):
+        """Reads network in XML (CCTP) format if filename ends with .xml,
+        in binary format if it ends with .stnu and in parsable format
+        otherwise. If cache is set, XML networks are cached (see
+        read_from_xml)."""
+        if filename.endswith('.xml'):
+            self.read_from_xml(filename, cache)
+        elif filename.endswith('.stnu'):
+            self.read_from_binary(filename)
+        else:
+            with open(filename, 'r') as f:
+                self.read_from_buffer(f.read())
+
+    def read_from_xml(self, filename, cache=False):
+        """Reads network in XML (CCTP) format. Constraints are parsed one
+        by one and discarded as soon as they are read, so memory used is
+        that of the network only.
+
+        If cache is set, the network is also written in binary format
+        next to the file (see xml_cache_file) and later read from there,
+        unless the XML file is modified since. Failure to write the cache
+        is not an error.
+        """
+        cache_file = xml_cache_file(filename)
+        if cache and os.path.exists(cache_file) and \
+                os.path.getmtime(cache_file) > os.path.getmtime(filename):
+            try:
+                self.read_from_binary(cache_file)
+                return
+            except (ValueError, AssertionError, struct.error, EnvironmentError):
+                # broken cache, parse XML again
+                pass
+        with gc_paused():
+            self._read_from_xml(filename)
+        self.verify_contraints()
+        if cache:
+            temporary_file = '%s.%d.tmp' % (cache_file, os.getpid())
+            try:
+                with open(temporary_file, 'wb') as f:
+                    self.write_binary(f)
+                os.rename(temporary_file, cache_file)
+            except (IOError, OSError):
+                if os.path.exists(temporary_file):
+                    os.remove(temporary_file)
+
+    def _read_from_xml(self, filename):
         self.reset()
-        next_number = [1]
-        def read_edges(how_many, where_to):
-            for _ in range(how_many):
-                start_name, end_name, lower_bound, upper_bound = raw_input().split(' ')
-                lower_bound = float(lower_bound)
-                upper_bound = float(upper_bound)
-                for name in [start_name, end_name]:
-                    if name not in self._renaming:
-                        self._renaming[name] = next_number[0]
-                        self._inverse_renaming[next_number[0]] = name
-                        next_number[0] += 1
-                where_to.append(StnuEdge(self._renaming[start_name],
-                                          self._renaming[end_name],
-                                          lower_bound,
-                                          upper_bound))
-        num_controllable = int(raw_input())
-        read_edges(num_controllable, self.controllable_edges)
-        num_uncontrollable = int(raw_input())
-        read_edges(num_uncontrollable, self.uncontrollable_edges)
-        self.num_nodes = len(self._renaming)
+        # Only constraints directly under the root are edges, like for
+        # root.findall('CONSTRAINT').
+        depth = 0
+        for event, element in ET.iterparse(filename, events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+                if depth == 1:
+                    root = element
+                continue
+            depth -= 1
+            if depth != 1:
+                continue
+            if element.tag == 'CONSTRAINT':
+                type = element.find('TYPE').text.split(';')[0]
+                edge = StnuEdge(self.add_node(element.find('START').text),
+                                self.add_node(element.find('END').text),
+                                float(element.find('LOWERBOUND').text),
+                                float(element.find('UPPERBOUND').text))
+                if type == 'Uncontrollable':
+                    self.uncontrollable_edges.append(edge)
+                else:
+                    self.controllable_edges.append(edge)
+            # drop everything parsed so far
+            root.clear()
+
+    def read_from_buffer(self, buffer):
+        """Reads network in parsable format from a string, all at once."""
+        with gc_paused():
+            self._read_from_buffer(buffer)
+
+    def _read_from_buffer(self, buffer):
+        self.reset()
+        tokens = buffer.split()
+        sections = []
+        names = []
+        position = 0
+        for where_to in [self.controllable_edges, self.uncontrollable_edges]:
+            how_many = int(tokens[position])
+            start = position + 1
+            position = start + 4 * how_many
+            assert len(tokens) >= position
+            sections.append((where_to, start, position))
+            edge_names = [None] * (2 * how_many)
+            edge_names[0::2] = tokens[start:position:4]
+            edge_names[1::2] = tokens[start + 1:position:4]
+            names.extend(edge_names)
+        # Nodes are numbered in order of first appearance, like when they
+        # are added one edge after another.
+        first_appearance = dict(izip(reversed(names), reversed(xrange(len(names)))))
+        ordered_names = sorted(first_appearance, key=first_appearance.__getitem__)
+        self.num_nodes = len(ordered_names)
+        self._renaming = dict(izip(ordered_names, xrange(1, self.num_nodes + 1)))
+        self._inverse_renaming = dict(izip(xrange(1, self.num_nodes + 1), ordered_names))
+        nodes = map(self._renaming.__getitem__, names)
+        nodes_position = 0
+        for where_to, start, end in sections:
+            how_many = (end - start) // 4
+            where_to.extend(map(StnuEdge._make,
+                                izip(nodes[nodes_position:nodes_position + 2 * how_many:2],
+                                     nodes[nodes_position + 1:nodes_position + 2 * how_many:2],
+                                     map(float, tokens[start + 2:end:4]),
+                                     map(float, tokens[start + 3:end:4]))))
+            nodes_position += 2 * how_many
         self.verify_contraints()
 
+    def read_from_binary(self, filename):
+        """Reads network written by write_binary. File is memory mapped and
+        arrays are copied out of it as they are. Networks are verified
+        before they are written, so they are not verified again."""
+        self.reset()
+        with open(filename, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with gc_paused():
+            try:
+                magic, version, num_nodes, num_controllable, num_uncontrollable, names_length = \
+                        BINARY_HEADER.unpack_from(mapped)
+                if magic != BINARY_MAGIC or version != BINARY_VERSION:
+                    raise ValueError('%s is not a binary network (version %d)' %
+                                     (filename, BINARY_VERSION))
+                position = BINARY_HEADER.size
+                names = mapped[position:position + names_length].split('\0') if num_nodes else []
+                position += names_length
+                assert len(names) == num_nodes
+                self.num_nodes = num_nodes
+                self._inverse_renaming = dict(izip(xrange(1, num_nodes + 1), names))
+                self._renaming = dict(izip(names, xrange(1, num_nodes + 1)))
+
+                for where_to, how_many in [(self.controllable_edges, num_controllable),
+                                           (self.uncontrollable_edges, num_uncontrollable)]:
+                    columns = []
+                    for typecode in 'iidd':
+                        column = array(typecode)
+                        size = column.itemsize * how_many
+                        column.fromstring(mapped[position:position + size])
+                        if sys.byteorder != 'little':
+                            column.byteswap()
+                        position += size
+                        columns.append(column)
+                    where_to.extend(map(StnuEdge._make, izip(*columns)))
+            finally:
+                mapped.close()
+
+    def write_binary(self, f):
+        """Writes network in binary format (see BINARY_HEADER) to file
+        opened in binary mode."""
+        names = [self._inverse_renaming[node] for node in xrange(1, self.num_nodes + 1)]
+        assert not any('\0' in name for name in names)
+        names = '\0'.join(names)
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC,
+                                   BINARY_VERSION,
+                                   self.num_nodes,
+                                   len(self.controllable_edges),
+                                   len(self.uncontrollable_edges),
+                                   len(names)))
+        f.write(names)
+        for edges in [self.controllable_edges, self.uncontrollable_edges]:
+            for column, typecode in enumerate('iidd'):
+                values = array(typecode, [edge[column] for edge in edges])
+                if sys.byteorder != 'little':
+                    values.byteswap()
+                values.tofile(f)
+
+    def write_parsable(self, f):
+        """Writes network in the format read by read_from_stdin."""
+        for edges in [self.controllable_edges, self.uncontrollable_edges]:
+            f.write('%d\n' % len(edges))
+            for fro, to, lb, ub in edges:
+                f.write('%s %s %r %r\n' % (self._inverse_renaming[fro],
+                                           self._inverse_renaming[to],
+                                           lb,
+                                           ub))
+
+    def write_xml(self, f, start=None, end=None):
+        """Writes network in XML (CCTP) format. start and end are the first
+        and last node of the network, if not given nodes 1 and num_nodes."""
+        names = self._inverse_renaming
+        f.write('<CCTP>\n')
+        f.write('\t<NAME>main</NAME>\n')
+        f.write('\t<START>%s</START>\n' % (names[start or 1],))
+        f.write('\t<END>%s</END>\n' % (names[end or self.num_nodes],))
+        f.write('\t<EVENT-UNIT>millisecond</EVENT-UNIT>\n')
+        f.write('\t<DURATION-UNIT>minute</DURATION-UNIT>\n')
+        for type, edges in [('Controllable;Constraint', self.controllable_edges),
+                            ('Uncontrollable;Activity', self.uncontrollable_edges)]:
+            for i, (fro, to, lb, ub) in enumerate(edges):
+                f.write('\t<CONSTRAINT>\n'
+                        '\t\t<START>%s</START>\n'
+                        '\t\t<END>%s</END>\n'
+                        '\t\t<ID>%s-%d</ID>\n'
+                        '\t\t<NAME>%s -> %s</NAME>\n'
+                        '\t\t<LOWERBOUND>%r</LOWERBOUND>\n'
+                        '\t\t<UPPERBOUND>%r</UPPERBOUND>\n'
+                        '\t\t<TYPE>%s</TYPE>\n'
+                        '\t</CONSTRAINT>\n' % (names[fro], names[to], type.split(';')[0], i,
+                                                names[fro], names[to], lb, ub, type))
+        for node in xrange(1, self.num_nodes + 1):
+            f.write('\t<EVENT>\n'
+                    '\t\t<ID>%s</ID>\n'
+                    '\t\t<NAME>%s</NAME>\n'
+                    '\t</EVENT>\n' % (names[node], names[node]))
+        f.write('</CCTP>\n')
+
     def pretty_print(self):
         print 'Number of nodes: %d' % self.num_nodes
         print 'Number of edges: %d' % self.num_edges
@@ -0,0 +1,70 @@
+import glob
+import os
+import shutil
+import tempfile
+import unittest
+
+import batched_dc
+from batch import check_batch, check_file, check_files
+
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests')
+
+class CheckBatchTest(unittest.TestCase):
+    def setUp(self):
+        # some of new_xml are not DC
+        self.filenames = (sorted(glob.glob(os.path.join(TESTS_DIR, 'J10', '*.xml')))[:10] +
+                          sorted(glob.glob(os.path.join(TESTS_DIR, 'new_xml', '*.xml')))[:10])
+        self._dir = tempfile.mkdtemp()
+        self.broken = os.path.join(self._dir, 'broken.xml')
+        with open(self.broken, 'w') as f:
+            f.write('<not a network')
+        self._solve_many = batched_dc.BatchedDc.solve_many
+
+    def tearDown(self):
+        batched_dc.BatchedDc.solve_many = self._solve_many
+        shutil.rmtree(self._dir)
+
+    def verdicts(self, results):
+        return [result['verdict'] for result in results]
+
+    def test_same_as_check_file(self):
+        filenames = self.filenames[:10] + [self.broken] + self.filenames[10:]
+        results = check_batch(filenames)
+        self.assertEqual([result['file'] for result in results], filenames)
+        self.assertEqual(self.verdicts(results),
+                         [check_file(filename)['verdict'] for filename in filenames])
+        self.assertIn('error', results[10])
+
+    def test_failing_network(self):
+        # the third network cannot be checked, which fails its batch
+        solve_many = self._solve_many
+        failing = check_file(self.filenames[2])['edges']
+        def failing_solve_many(solver, networks):
+            if any(network.num_edges == failing for network in networks):
+                raise ValueError('cannot check')
+            return solve_many(solver, networks)
+        batched_dc.BatchedDc.solve_many = failing_solve_many
+        results = check_batch(self.filenames)
+        expected = [check_file(filename)['verdict'] for filename in self.filenames]
+        for i, result in enumerate(results):
+            if result['edges'] == failing:
+                self.assertEqual(result['error'], 'ValueError: cannot check')
+            else:
+                self.assertEqual(result['verdict'], expected[i])
+        self.assertIn('error', results[2])
+
+    def test_memory_budget(self):
+        filenames = self.filenames[:3]
+        verdicts = self.verdicts(check_batch(filenames))
+        for batch_size in (0, 2):
+            results = check_files(filenames, engine='compact', batch_size=batch_size,
+                                  memory_budget=1 << 20)
+            self.assertEqual(self.verdicts(results), verdicts)
+            # other engines do not have a budget
+            self.assertRaises(ValueError, list,
+                              check_files(filenames, batch_size=batch_size, memory_budget=1 << 20))
+
+
+if __name__ == '__main__':
+    unittest.main()
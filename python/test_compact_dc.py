@@ -0,0 +1,57 @@
+import random
+import unittest
+
+import numpy as np
+
+from compact_dc import ArrayPool, CompactDc
+from fast_dc import DcTester, FastDc
+from instrumentation import Instrumentation
+from test_batched_dc import corpora, random_network
+
+
+class ArrayPoolTest(unittest.TestCase):
+    def test_budget(self):
+        pool = ArrayPool(100)
+        kept = pool.empty(10, np.float64)
+        self.assertNotIsInstance(kept, np.memmap)
+        self.assertEqual(pool.resident, 80)
+        # does not fit any more
+        spilled = pool.empty(10, np.float64)
+        self.assertIsInstance(spilled, np.memmap)
+        self.assertEqual((pool.resident, pool.spilled), (80, 80))
+        spilled[:] = 1
+        self.assertEqual(spilled.sum(), 10)
+        # freed arrays give their room back
+        del kept
+        self.assertEqual(pool.resident, 0)
+        self.assertNotIsInstance(pool.empty(10, np.float64), np.memmap)
+
+class CompactDcTest(unittest.TestCase):
+    def assertSameVerdict(self, stnu, message=None):
+        verdict = FastDc().solve(stnu)
+        self.assertEqual(CompactDc().solve(stnu), verdict, message)
+        # everything spilled
+        self.assertEqual(CompactDc(memory_budget=0).solve(stnu), verdict, message)
+
+    def test_random_networks(self):
+        rng = random.Random(0)
+        for i in xrange(200):
+            self.assertSameVerdict(random_network(rng), 'network %d' % i)
+
+    def test_corpora(self):
+        for filename, stnu in corpora(limit=10):
+            self.assertSameVerdict(stnu, filename)
+
+    def test_memory_budget(self):
+        stnu = next(stnu for filename, stnu in corpora() if 'J10' in filename)
+        stats = Instrumentation()
+        tester = DcTester(stnu, engine='compact', memory_budget=1 << 10, instrumentation=stats)
+        self.assertEqual(tester.is_dynamically_controllable(), FastDc().solve(stnu))
+        values = stats.summary()['values']
+        self.assertGreater(values['spilled_bytes'], 0)
+        self.assertGreater(values['peak_memory_kb'], 0)
+        self.assertRaises(ValueError, DcTester, stnu, memory_budget=1 << 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import random
+import unittest
+
+from decompose import components
+from fast_dc import DcTester
+from stnu import NamedStnu
+from test_batched_dc import network, random_network
+
+
+class ComponentsTest(unittest.TestCase):
+    def test_link_without_upper_bound(self):
+        # only the lower case edge leads from 1 to 2
+        stnu = network(3, [(1, 3, 0.0, 10.0)], [(1, 2, 1.0, float('inf'))])
+        [component] = components(stnu)
+        self.assertEqual(len(component.controllable_edges), 1)
+        self.assertEqual(len(component.uncontrollable_edges), 1)
+
+    def test_disjoint_plans(self):
+        stnu = NamedStnu()
+        stnu.read_from_buffer('2 a b 0 10 c d 1 5 1 b e 1 2')
+        self.assertEqual(sorted(n.num_edges for n in components(stnu)), [1, 2])
+
+    def test_same_verdicts(self):
+        rng = random.Random(0)
+        for _ in xrange(200):
+            stnu = random_network(rng)
+            self.assertEqual(DcTester(stnu, decompose=True).is_dynamically_controllable(),
+                             DcTester(stnu).is_dynamically_controllable())
+
+class PoolTest(unittest.TestCase):
+    def test_kept(self):
+        stnu = NamedStnu()
+        stnu.read_from_buffer('2 a b 0 10 c d 1 5 2 b e 1 2 d f 0 3')
+        tester = DcTester(stnu, processes=2, decompose=True)
+        try:
+            self.assertTrue(tester.is_dynamically_controllable())
+            pool = tester._pool
+            self.assertIsNotNone(pool)
+            tester.update_controllable_edge(1, 2, 0, 20)
+            self.assertTrue(tester.is_dynamically_controllable())
+            self.assertIs(tester._pool, pool)
+            # f comes 0 to 3 after d, so it cannot be exactly 4 after c
+            tester.add_controllable_edge(3, 6, 4, 4)
+            self.assertFalse(tester.is_dynamically_controllable())
+        finally:
+            tester.close()
+        self.assertIsNone(tester._pool)
+
+
+if __name__ == '__main__':
+    unittest.main()
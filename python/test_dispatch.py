@@ -0,0 +1,83 @@
+import glob
+import os
+import random
+import unittest
+
+from dispatch import Dispatcher
+from fast_dc import DcTester
+from stnu import NamedStnu
+from test_batched_dc import TESTS_DIR, network, random_network
+
+
+def dispatch(dispatchable, rng):
+    """Executes every controllable timepoint as early as its window
+    allows, with contingent durations drawn uniformly from their links.
+    Observations come first at the same time. Returns times of nodes."""
+    dispatcher = Dispatcher(dispatchable)
+    inf = float('inf')
+    durations = dict((node, rng.uniform(lower, upper))
+                     for node, (_, lower, upper) in dispatchable.contingent.iteritems())
+    now = 0.0
+    while not dispatcher.finished:
+        observed = [(dispatcher.time[activation] + durations[node], node)
+                    for node, (activation, _, _) in dispatchable.contingent.iteritems()
+                    if dispatcher.time[node] is None and dispatcher.time[activation] is not None]
+        executed = [(max(now, dispatcher.window(node)[0]), node) for node in dispatcher.enabled]
+        next_observation = min(observed) if observed else (inf, None)
+        next_execution = min(executed) if executed else (inf, None)
+        if next_observation[1] is None and next_execution[1] is None:
+            raise AssertionError('dispatch is stuck at %r' % (now,))
+        if next_observation[0] <= next_execution[0]:
+            now, node = next_observation
+            dispatcher.observe(node, now)
+        else:
+            now, node = next_execution
+            dispatcher.execute(node, now)
+    return dispatcher.time
+
+class DispatcherTest(unittest.TestCase):
+    def check(self, stnu, rng, runs=10):
+        dispatchable = DcTester(stnu).dispatchable()
+        self.assertIsNotNone(dispatchable)
+        for _ in xrange(runs):
+            times = dispatch(dispatchable, rng)
+            for edge in stnu.controllable_edges:
+                self.assertTrue(edge.lower_bound - 1e-6 <=
+                                times[edge.to] - times[edge.fro] <=
+                                edge.upper_bound + 1e-6, edge)
+
+    def test_simple(self):
+        # c must come 2 to 7 after a and at most 4 after b, which takes 1 to 3
+        stnu = network(3, [(1, 3, 2.0, 7.0), (2, 3, 0.0, 4.0)], [(1, 2, 1.0, 3.0)])
+        self.check(stnu, random.Random(0))
+
+    def test_not_dc(self):
+        stnu = network(3, [(1, 3, 3.0, 3.0)], [(1, 2, 0.0, 5.0), (2, 3, 0.0, 0.0)])
+        self.assertIsNone(DcTester(stnu).dispatchable())
+
+    def test_random_networks(self):
+        rng = random.Random(0)
+        checked = 0
+        while checked < 100:
+            stnu = random_network(rng)
+            if DcTester(stnu).is_dynamically_controllable():
+                self.check(stnu, rng)
+                checked += 1
+
+    def test_corpus(self):
+        rng = random.Random(0)
+        # some of new_xml are not DC
+        filenames = (sorted(glob.glob(os.path.join(TESTS_DIR, 'J10', '*.xml')))[:10] +
+                     sorted(glob.glob(os.path.join(TESTS_DIR, 'new_xml', '*.xml')))[:10])
+        checked = 0
+        for filename in filenames:
+            stnu = NamedStnu()
+            stnu.read_from_file(filename)
+            if DcTester(stnu).is_dynamically_controllable():
+                self.check(stnu, rng, runs=3)
+                checked += 1
+        self.assertGreater(checked, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
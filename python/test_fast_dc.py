@@ -0,0 +1,199 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import unittest
+
+import fast_dc
+from fast_dc import DcTester, FastDc
+from generator import generate
+from stnu import NamedStnu
+
+
+def edges(solver):
+    return sorted((e.fro, e.to, e.value, e.type, e.maybe_letter) for e in solver.edges)
+
+class ParallelTest(unittest.TestCase):
+    def setUp(self):
+        # every iteration goes to the workers, however small
+        self._min_work = fast_dc.PARALLEL_MIN_WORK
+        fast_dc.PARALLEL_MIN_WORK = 0
+
+    def tearDown(self):
+        fast_dc.PARALLEL_MIN_WORK = self._min_work
+
+    def test_same_as_serial(self):
+        parallel = FastDc(processes=2, keep_edges=True)
+        try:
+            for seed in xrange(6):
+                network = generate(40, seed=seed, dc_bias=0.97, contingent_ratio=0.3)
+                serial = FastDc(keep_edges=True)
+                verdict = serial.solve(network)
+                self.assertEqual(parallel.solve(network), verdict)
+                if verdict:
+                    self.assertEqual(edges(parallel), edges(serial))
+                # the pool is kept for the next check
+                self.assertIsNotNone(parallel._pool)
+        finally:
+            parallel.close()
+        self.assertIsNone(parallel._pool)
+
+class DeterminismTest(unittest.TestCase):
+    def test_other_process(self):
+        # a new interpreter, where hash(None) differs, derives the same
+        # edges in the same order
+        script = ('import json; from fast_dc import FastDc; from generator import generate\n'
+                  'solver = FastDc(keep_edges=True)\n'
+                  'solver.solve(generate(40, seed=2, dc_bias=0.97, contingent_ratio=0.3))\n'
+                  'print json.dumps([(e.fro, e.to, e.value, e.type, e.maybe_letter)'
+                  ' for e in solver.edges])')
+        output = subprocess.check_output([sys.executable, '-c', script],
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+        solver = FastDc(keep_edges=True)
+        solver.solve(generate(40, seed=2, dc_bias=0.97, contingent_ratio=0.3))
+        self.assertEqual([tuple(e) for e in json.loads(output)],
+                         [(e.fro, e.to, e.value, e.type, e.maybe_letter) for e in solver.edges])
+
+class CheckpointTest(unittest.TestCase):
+    def resume(self, network, **budget):
+        """Checks network in slices of budget, passing checkpoints between
+        them through JSON. Returns the verdict and the number of
+        slices."""
+        checkpoint = None
+        slices = 0
+        while True:
+            solver = FastDc()
+            slices += 1
+            verdict = solver.solve(network, checkpoint=checkpoint, **budget)
+            if verdict is not None:
+                return verdict, slices
+            checkpoint = json.loads(json.dumps(solver.checkpoint))
+
+    def assertSameAsFull(self, **budget):
+        # Only verdicts are compared: edges of a check are kept in a dict,
+        # which is rebuilt in another order from a checkpoint, and the
+        # edges derived depend on the order.
+        for seed in xrange(6):
+            network = generate(40, seed=seed, dc_bias=0.97, contingent_ratio=0.3)
+            verdict, slices = self.resume(network, **budget)
+            self.assertGreater(slices, 1)
+            self.assertEqual(verdict, FastDc().solve(network))
+
+    def test_iteration_budget(self):
+        self.assertSameAsFull(iteration_budget=1)
+
+    def test_time_budget(self):
+        # every slice still searches a lower case edge
+        self.assertSameAsFull(time_budget=0)
+
+    def test_other_network(self):
+        solver = FastDc()
+        network = generate(40, seed=1, dc_bias=0.97, contingent_ratio=0.3)
+        self.assertIsNone(solver.solve(network, iteration_budget=1))
+        other = generate(40, seed=2, dc_bias=0.97, contingent_ratio=0.3)
+        self.assertRaises(ValueError, FastDc().solve, other, checkpoint=solver.checkpoint)
+
+class EditTest(unittest.TestCase):
+    def test_same_as_from_scratch(self):
+        rng = random.Random(0)
+        for seed in xrange(4):
+            network = generate(25, seed=seed, dc_bias=1.0, contingent_ratio=0.2)
+            tester = DcTester(network)
+            for _ in xrange(40):
+                edges = network.controllable_edges
+                e = rng.choice(edges)
+                edit = rng.random()
+                if edit < 0.35:
+                    # tighten
+                    tester.update_controllable_edge(e.fro, e.to, e.lower_bound + rng.randint(0, 1),
+                                                    max(e.lower_bound + 1, e.upper_bound - rng.randint(0, 2)))
+                elif edit < 0.7:
+                    tester.update_controllable_edge(e.fro, e.to, e.lower_bound - rng.randint(0, 20),
+                                                    e.upper_bound + rng.randint(0, 20))
+                elif edit < 0.85:
+                    fro, to = rng.sample(xrange(1, network.num_nodes + 1), 2)
+                    if any((e.fro, e.to) == (fro, to) for e in edges):
+                        continue
+                    lower = rng.randint(-100, 0)
+                    tester.add_controllable_edge(fro, to, lower, lower + rng.randint(100, 200))
+                elif len(edges) > network.num_nodes:
+                    tester.remove_controllable_edge(e.fro, e.to)
+                self.assertEqual(tester.is_dynamically_controllable(), FastDc().solve(network))
+
+    def test_failed_edits(self):
+        network = generate(20, seed=0, dc_bias=1.0, contingent_ratio=0.2)
+        tester = DcTester(network)
+        verdict = tester.is_dynamically_controllable()
+        controllable = list(network.controllable_edges)
+        uncontrollable = list(network.uncontrollable_edges)
+        e, link = controllable[0], uncontrollable[0]
+        # bounds the wrong way, a second edge between the same nodes, an
+        # infinite contingent link and edges which are not there
+        self.assertRaises(AssertionError, tester.add_controllable_edge, 1, 2, 5, 0)
+        self.assertRaises(AssertionError, tester.add_controllable_edge, e.fro, e.to, 0, 1)
+        self.assertRaises(AssertionError, tester.update_controllable_edge, e.fro, e.to, 5, 0)
+        self.assertRaises(AssertionError, tester.update_uncontrollable_edge,
+                          link.fro, link.to, 1, float('inf'))
+        self.assertRaises(AssertionError, tester.add_uncontrollable_edge,
+                          link.fro, link.to, 1, 2)
+        self.assertRaises(KeyError, tester.remove_controllable_edge, e.to, e.fro)
+        self.assertEqual(network.controllable_edges, controllable)
+        self.assertEqual(network.uncontrollable_edges, uncontrollable)
+        self.assertEqual(tester.is_dynamically_controllable(), verdict)
+        # the tester still follows edits
+        tester.update_controllable_edge(e.fro, e.to, e.lower_bound, e.lower_bound)
+        self.assertEqual(tester.is_dynamically_controllable(), FastDc().solve(network))
+
+class DcPreservingBoundsTest(unittest.TestCase):
+    def dc_tester(self, network):
+        stnu = NamedStnu()
+        stnu.read_from_buffer(network)
+        return DcTester(stnu)
+
+    def test_infinite_bounds(self):
+        # c comes 2 to 10 after a, b after a and at most 50 before c
+        tester = self.dc_tester('3 a b 0 inf a c 2 10 b c -inf 50 1 c d 1 5')
+        inf = float('inf')
+        (ab_lower, ab_upper), ac, (bc_lower, bc_upper), cd = tester.dc_preserving_bounds(
+            [(1, 2), (1, 3), (2, 3), (3, 4)])
+        self.assertEqual((ab_lower, ab_upper), (inf, 0))
+        self.assertEqual(ac, (10, 2))
+        self.assertAlmostEqual(bc_lower, 10, places=2)
+        self.assertEqual(bc_upper, -inf)
+        self.assertEqual(cd, (0, inf))
+
+    def test_limit_at_sum_of_bounds(self):
+        # b is at c, which is at most 62 after a
+        tester = self.dc_tester('3 a b 0 inf a c 0 62 c b 0 0 0')
+        [(lower, upper)] = tester.dc_preserving_bounds([(1, 2)])
+        self.assertAlmostEqual(lower, 62, places=2)
+        self.assertEqual(upper, 0)
+
+    def test_limits(self):
+        precision = 1e-3
+        for seed in xrange(3):
+            network = generate(15, seed=seed, dc_bias=1.0, contingent_ratio=0.2)
+            tester = DcTester(network)
+            if not tester.is_dynamically_controllable():
+                continue
+            edges = network.controllable_edges[:5]
+            limits = tester.dc_preserving_bounds([(e.fro, e.to) for e in edges], precision)
+            for e, (lower, upper) in zip(edges, limits):
+                for bounds, is_dc in [((lower, e.upper_bound), True),
+                                      ((lower + 2 * precision, e.upper_bound), False),
+                                      ((e.lower_bound, upper), True),
+                                      ((e.lower_bound, upper - 2 * precision), False)]:
+                    if bounds[0] > bounds[1] or float('inf') in map(abs, bounds):
+                        continue
+                    tester.update_controllable_edge(e.fro, e.to, *bounds)
+                    self.assertEqual(tester.is_dynamically_controllable(), is_dc)
+                    tester.update_controllable_edge(e.fro, e.to, e.lower_bound, e.upper_bound)
+
+    def test_ambiguous(self):
+        tester = self.dc_tester('1 a b 0 10 1 a b 1 5')
+        self.assertRaises(ValueError, tester.dc_preserving_bounds, [(1, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import random
+import unittest
+
+from fast_dc import DcTester, FastDc
+from precheck import TIERS, precheck
+from stnu import NamedStnu
+from test_batched_dc import corpora, random_network
+
+
+class PrecheckTest(unittest.TestCase):
+    def precheck(self, buffer):
+        stnu = NamedStnu()
+        stnu.read_from_buffer(buffer)
+        return precheck(stnu)
+
+    def test_tiers(self):
+        self.assertEqual(self.precheck('1 a b 0 5 0'), (True, 'stn'))
+        self.assertEqual(self.precheck('2 a b 5 6 b a 0 1 0'), (False, 'stn'))
+        # c is 1 after b, which can be 5 after a
+        self.assertEqual(self.precheck('2 a c 0 3 b c 1 1 1 a b 0 5'), (False, 'allmax'))
+        # a and b take 1 to 8 and 1 to 10 after c, but must be 1 to 2 apart
+        self.assertEqual(self.precheck('1 A B 1 2 2 C B 1 10 C A 1 8'), (False, 'pseudo'))
+        # c at 3 works whenever b comes
+        self.assertEqual(self.precheck('2 a c 3 4 b c 0 5 1 a b 1 2'), (True, 'strong'))
+        # DC, but c has to wait for b
+        self.assertEqual(self.precheck('2 b c 1 1 a c 0 20 1 a b 0 10'), (None, None))
+
+    def assertSameVerdict(self, stnu, message=None):
+        verdict = FastDc().solve(stnu)
+        is_dc, tier = precheck(stnu)
+        if is_dc is not None:
+            self.assertEqual(is_dc, verdict, message)
+        tester = DcTester(stnu, precheck=True)
+        self.assertEqual(tester.is_dynamically_controllable(), verdict, message)
+        if is_dc is not None:
+            self.assertEqual(tester.decided_by, 'precheck:' + tier, message)
+        else:
+            self.assertFalse(tester.decided_by.startswith('precheck:'), message)
+        return tier
+
+    def test_random_networks(self):
+        rng = random.Random(0)
+        tiers = set()
+        for i in xrange(300):
+            tiers.add(self.assertSameVerdict(random_network(rng), 'network %d' % i))
+        # all of them are tried
+        self.assertEqual(tiers, set(TIERS + [None]))
+
+    def test_corpora(self):
+        for filename, stnu in corpora():
+            self.assertSameVerdict(stnu, filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import glob
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from fast_dc import DcTester
+from result_cache import ResultCache, file_fingerprint, fingerprint
+from stnu import NamedStnu, StnuEdge
+from test_batched_dc import TESTS_DIR
+
+
+def renamed(stnu, rng):
+    """Copy of stnu with nodes renamed and renumbered and edges in
+    another order."""
+    result = NamedStnu()
+    nodes = range(1, stnu.num_nodes + 1)
+    rng.shuffle(nodes)
+    number = {}
+    for node in nodes:
+        number[node] = result.add_node('node%d' % rng.randint(0, 1 << 30))
+    for edges, copies in [(stnu.controllable_edges, result.controllable_edges),
+                          (stnu.uncontrollable_edges, result.uncontrollable_edges)]:
+        copies.extend(StnuEdge(number[e.fro], number[e.to], e.lower_bound, e.upper_bound)
+                      for e in edges)
+        rng.shuffle(copies)
+    return result
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self):
+        # some of new_xml are not DC
+        self.filenames = (sorted(glob.glob(os.path.join(TESTS_DIR, 'J10', '*.xml')))[:10] +
+                          sorted(glob.glob(os.path.join(TESTS_DIR, 'new_xml', '*.xml')))[:10])
+
+    def test_renamed_nodes(self):
+        rng = random.Random(0)
+        cache = ResultCache()
+        for filename in self.filenames:
+            stnu = NamedStnu()
+            stnu.read_from_file(filename)
+            verdict = DcTester(stnu, result_cache=cache).is_dynamically_controllable()
+            copy = renamed(stnu, rng)
+            self.assertEqual(fingerprint(copy), fingerprint(stnu), filename)
+            tester = DcTester(copy, result_cache=cache)
+            self.assertEqual(tester.is_dynamically_controllable(), verdict, filename)
+            self.assertTrue(tester.from_cache)
+            self.assertEqual(tester.decided_by, 'cache')
+        self.assertEqual((cache.hits, cache.misses), (len(self.filenames), len(self.filenames)))
+
+    def test_other_bounds(self):
+        stnu = NamedStnu()
+        stnu.read_from_buffer('1 a b 0 5 1 b c 1 2')
+        other = NamedStnu()
+        other.read_from_buffer('1 a b 0 6 1 b c 1 2')
+        self.assertNotEqual(fingerprint(other), fingerprint(stnu))
+        # requirement edge and contingent link with the same bounds
+        other = NamedStnu()
+        other.read_from_buffer('2 a b 0 5 b c 1 2 0')
+        self.assertNotEqual(fingerprint(other), fingerprint(stnu))
+
+    def test_file_fingerprint(self):
+        directory = tempfile.mkdtemp()
+        try:
+            copy = os.path.join(directory, 'copy.xml')
+            shutil.copy(self.filenames[0], copy)
+            self.assertEqual(file_fingerprint(copy), file_fingerprint(self.filenames[0]))
+            self.assertNotEqual(file_fingerprint(copy), file_fingerprint(self.filenames[1]))
+        finally:
+            shutil.rmtree(directory)
+
+class ResultCacheTest(unittest.TestCase):
+    def test_least_recently_used(self):
+        cache = ResultCache(max_entries=2)
+        cache.put('a', True)
+        cache.put('b', False)
+        self.assertEqual(cache.get('a'), True)
+        cache.put('c', True)
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (True, True))
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
+
+    def test_max_bytes(self):
+        cache = ResultCache(max_bytes=20)
+        cache.put('a', 'x' * 100)
+        self.assertEqual(len(cache), 0)
+        cache.put('a', True)
+        cache.put('b', True)
+        cache.put('c', True)
+        # 5 bytes each
+        self.assertEqual(len(cache), 3)
+        # 7 bytes, which leaves no room for the oldest one
+        cache.put('d', [1, 2])
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), True)
+
+    def test_directory(self):
+        directory = tempfile.mkdtemp()
+        try:
+            cache = ResultCache(directory=os.path.join(directory, 'results'))
+            cache.put('abcdef', {'verdict': 'dc'})
+            # other caches of the directory see it, and it survives clear
+            other = ResultCache(directory=os.path.join(directory, 'results'))
+            self.assertEqual(other.get('abcdef'), {'verdict': 'dc'})
+            cache.clear()
+            self.assertEqual(len(cache), 0)
+            self.assertEqual(cache.get('abcdef'), {'verdict': 'dc'})
+            self.assertIsNone(cache.get('abcdeg'))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
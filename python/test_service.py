@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from service import Client, make_service
+
+
+class ServiceTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        self._socket = os.path.join(self._dir, 'service.sock')
+        self.service = make_service(self._socket)
+        self._thread = threading.Thread(target=self.service.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self.client = Client(self._socket)
+
+    def tearDown(self):
+        self.client.close()
+        self.service.shutdown()
+        self.service.server_close()
+        self.service.stop_workers()
+        shutil.rmtree(self._dir)
+
+    def test_session(self):
+        response = self.client.request('open', network='1 a b 1 2 1 b c 0 5', id=3)
+        self.assertEqual(response['id'], 3)
+        self.assertEqual((response['nodes'], response['edges']), (3, 2))
+        session = response['session']
+        self.assertEqual(self.client.request('check', session=session)['verdict'], 'dc')
+        self.assertIsNone(self.client.request('negative_cycle', session=session)['negative_cycle'])
+        # c comes 0 to 5 after b, out of our control, so not exactly 3 after a
+        self.client.request('add_controllable_edge', session=session,
+                            fro='a', to='c', lower_bound=3, upper_bound=3)
+        self.assertEqual(self.client.request('check', session=session)['verdict'], 'notdc')
+        self.client.request('remove_controllable_edge', session=session, fro='a', to='c')
+        self.assertEqual(self.client.request('check', session=session)['verdict'], 'dc')
+        self.assertRaises(RuntimeError, self.client.request, 'check', session=session + 1)
+        self.client.request('close', session=session)
+        self.assertRaises(RuntimeError, self.client.request, 'check', session=session)
+
+    def test_processes(self):
+        sessions = [self.client.request('open', network='1 a b 1 2 0')['session']
+                    for _ in xrange(3)]
+        workers = [self.service._sessions[session] for session in sessions]
+        # one process per session, so they do not wait for each other
+        self.assertEqual(len(set(worker.process.pid for worker in workers)), 3)
+        self.client.request('close', session=sessions[0])
+        self.assertFalse(workers[0].process.is_alive())
+        # the others are closed with the connection
+        self.client.close()
+        deadline = time.time() + 5
+        while any(worker.process.is_alive() for worker in workers) and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(any(worker.process.is_alive() for worker in workers))
+        self.assertEqual(self.service._sessions, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import random
+import unittest
+
+from fast_dc import DcTester, FastDc
+from simplify import simplify
+from stnu import NamedStnu
+from test_batched_dc import corpora, random_network
+
+
+def edges(stnu):
+    return sorted((e.fro, e.to, e.lower_bound, e.upper_bound)
+                  for e in stnu.controllable_edges + stnu.uncontrollable_edges)
+
+class SimplifyTest(unittest.TestCase):
+    def test_rigid(self):
+        # b is exactly 3 after a, so it goes and c is 3 to 8 after a
+        stnu = NamedStnu()
+        stnu.read_from_buffer('2 a b 3 3 b c 0 5 1 c d 1 4')
+        simplification = simplify(stnu)
+        self.assertTrue(simplification.changed)
+        self.assertEqual(simplification.mapping['b'], ('a', 3.0))
+        network = simplification.network
+        self.assertEqual(network.num_nodes, 3)
+        self.assertEqual(edges(network), [(1, 2, 3.0, 8.0), (2, 3, 1.0, 4.0)])
+        self.assertEqual(simplification.original_times({'a': 1.0, 'c': 5.0, 'd': 7.0}),
+                         {'a': 1.0, 'b': 4.0, 'c': 5.0, 'd': 7.0})
+
+    def test_implied_bounds(self):
+        # a -> b -> c is 0 to 5, inside a -> c
+        stnu = NamedStnu()
+        stnu.read_from_buffer('3 a b 0 2 b c 0 3 a c -1 10 0')
+        simplification = simplify(stnu)
+        self.assertEqual(simplification.implied_bounds, 2)
+        self.assertEqual(edges(simplification.network), [(1, 2, 0.0, 2.0), (2, 3, 0.0, 3.0)])
+
+    def test_shared_normalization(self):
+        stnu = NamedStnu()
+        stnu.read_from_buffer('0 2 a b 1 3 a c 1 5')
+        network = simplify(stnu).network
+        self.assertEqual(network.num_nodes, 4)
+        self.assertEqual(network._inverse_renaming[4], "a'1.0")
+        self.assertEqual(edges(network), [(1, 4, 1.0, 1.0), (4, 2, 0.0, 2.0), (4, 3, 0.0, 4.0)])
+
+    def test_unchanged(self):
+        stnu = NamedStnu()
+        stnu.read_from_buffer('1 a b 0 5 1 b c 1 2')
+        simplification = simplify(stnu)
+        self.assertFalse(simplification.changed)
+        self.assertEqual(edges(simplification.network), edges(stnu))
+
+    def assertSameVerdict(self, stnu, message=None):
+        verdict = FastDc().solve(stnu)
+        self.assertEqual(FastDc().solve(simplify(stnu).network), verdict, message)
+        self.assertEqual(DcTester(stnu, simplify=True).is_dynamically_controllable(),
+                         verdict, message)
+
+    def test_random_networks(self):
+        rng = random.Random(0)
+        for i in xrange(300):
+            self.assertSameVerdict(random_network(rng), 'network %d' % i)
+
+    def test_corpora(self):
+        for filename, stnu in corpora():
+            self.assertSameVerdict(stnu, filename)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import glob
+import os
+import random
+import unittest
+
+from fast_dc import DcTester
+from simulate import distribution, simulate
+from stnu import NamedStnu
+from test_batched_dc import TESTS_DIR, network, random_network
+
+
+class SimulateTest(unittest.TestCase):
+    def test_simple(self):
+        # c must come 2 to 7 after a and at most 4 after b, which takes 1 to 3
+        stnu = network(3, [(1, 3, 2.0, 7.0), (2, 3, 0.0, 4.0)], [(1, 2, 1.0, 3.0)])
+        result = simulate(stnu, scenarios=1000, batch_size=300, seed=0, keep_times=True)
+        self.assertEqual(result.scenarios, 1000)
+        self.assertTrue(result.success.all())
+        self.assertTrue(result.in_bounds.all())
+        self.assertEqual(result.violations.tolist(), [0, 0])
+        times = result.times
+        durations = times[:, 2] - times[:, 1]
+        self.assertTrue(((1.0 <= durations) & (durations <= 3.0)).all())
+        # c as early as it can be
+        self.assertTrue((abs(times[:, 3] - times[:, 1] - durations.clip(2.0)) < 1e-9).all())
+        self.assertEqual(result.summary()['scenarios'], 1000)
+
+    def test_not_dc(self):
+        stnu = network(3, [(1, 3, 3.0, 3.0)], [(1, 2, 0.0, 5.0), (2, 3, 0.0, 0.0)])
+        self.assertRaises(ValueError, simulate, stnu, scenarios=10)
+
+    def test_random_networks(self):
+        rng = random.Random(0)
+        checked = 0
+        while checked < 100:
+            stnu = random_network(rng)
+            if DcTester(stnu).is_dynamically_controllable():
+                result = simulate(stnu, scenarios=100, seed=checked)
+                self.assertTrue(result.success.all())
+                checked += 1
+
+    def test_distributions(self):
+        stnu = NamedStnu()
+        stnu.read_from_file(sorted(glob.glob(os.path.join(TESTS_DIR, 'J10', '*.xml')))[0])
+        links = stnu.uncontrollable_edges
+        for kind in ('uniform', 'triangular', 'normal'):
+            distributions = dict((e.to, distribution(kind, e.lower_bound, e.upper_bound))
+                                 for e in links)
+            result = simulate(stnu, distributions, scenarios=2000, seed=0)
+            # DC guarantees success when durations are within bounds
+            self.assertTrue(result.success[result.in_bounds].all())
+            if kind != 'normal':
+                self.assertTrue(result.in_bounds.all())
+        self.assertRaises(ValueError, distribution, 'exponential', 0, 1)
+
+    def test_corpus(self):
+        # some of new_xml are not DC
+        filenames = (sorted(glob.glob(os.path.join(TESTS_DIR, 'J10', '*.xml')))[:10] +
+                     sorted(glob.glob(os.path.join(TESTS_DIR, 'new_xml', '*.xml')))[:10])
+        checked = 0
+        for filename in filenames:
+            stnu = NamedStnu()
+            stnu.read_from_file(filename)
+            if DcTester(stnu).is_dynamically_controllable():
+                self.assertTrue(simulate(stnu, scenarios=1000, seed=0).success.all())
+                checked += 1
+            else:
+                self.assertRaises(ValueError, simulate, stnu, scenarios=10)
+        self.assertGreater(checked, 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+import xml.etree.cElementTree as ET
+
+from stnu import NamedStnu, StnuEdge, xml_cache_file
+from test_batched_dc import corpora, random_network
+
+
+def networks():
+    """Networks of the corpora and random ones, some with infinite
+    bounds."""
+    rng = random.Random(0)
+    for i in xrange(50):
+        yield 'network %d' % i, random_network(rng)
+    for filename, stnu in corpora():
+        yield filename, stnu
+
+def read_whole_xml(filename):
+    """Reads XML network by parsing the whole tree first."""
+    stnu = NamedStnu()
+    for constraint in ET.parse(filename).getroot().findall('CONSTRAINT'):
+        edge = StnuEdge(stnu.add_node(constraint.find('START').text),
+                        stnu.add_node(constraint.find('END').text),
+                        float(constraint.find('LOWERBOUND').text),
+                        float(constraint.find('UPPERBOUND').text))
+        if constraint.find('TYPE').text.split(';')[0] == 'Uncontrollable':
+            stnu.uncontrollable_edges.append(edge)
+        else:
+            stnu.controllable_edges.append(edge)
+    return stnu
+
+def named_edges(stnu):
+    names = stnu._inverse_renaming
+    return [sorted((names[e.fro], names[e.to], e.lower_bound, e.upper_bound) for e in edges)
+            for edges in (stnu.controllable_edges, stnu.uncontrollable_edges)]
+
+class FormatTest(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def round_trip(self, stnu, suffix, write):
+        path = os.path.join(self._dir, 'network' + suffix)
+        with open(path, 'wb') as f:
+            write(stnu, f)
+        result = NamedStnu()
+        result.read_from_file(path)
+        return result
+
+    def assertSameNetwork(self, stnu, other, message=None):
+        self.assertEqual(other.num_nodes, stnu.num_nodes, message)
+        self.assertEqual(other._inverse_renaming, stnu._inverse_renaming, message)
+        self.assertEqual(other.controllable_edges, stnu.controllable_edges, message)
+        self.assertEqual(other.uncontrollable_edges, stnu.uncontrollable_edges, message)
+
+    def assertSameEdges(self, stnu, other, message=None):
+        # text formats have no isolated nodes and number nodes in order
+        # of appearance
+        self.assertEqual(named_edges(other), named_edges(stnu), message)
+
+    def test_binary(self):
+        for name, stnu in networks():
+            self.assertSameNetwork(stnu, self.round_trip(stnu, '.stnu', NamedStnu.write_binary),
+                                   name)
+
+    def test_parsable(self):
+        for name, stnu in networks():
+            self.assertSameEdges(stnu, self.round_trip(stnu, '.in', NamedStnu.write_parsable),
+                                 name)
+
+    def test_xml(self):
+        for name, stnu in networks():
+            self.assertSameEdges(stnu, self.round_trip(stnu, '.xml', NamedStnu.write_xml),
+                                 name)
+
+    def test_streamed_xml(self):
+        for filename, stnu in corpora():
+            if filename.endswith('.xml'):
+                self.assertSameNetwork(read_whole_xml(filename), stnu, filename)
+
+    def test_xml_cache(self):
+        filename = [f for f, _ in corpora() if f.endswith('.xml')][0]
+        path = os.path.join(self._dir, 'network.xml')
+        shutil.copy(filename, path)
+        stnu = NamedStnu()
+        stnu.read_from_file(path, cache=True)
+        self.assertTrue(os.path.exists(xml_cache_file(path)))
+        cached = NamedStnu()
+        cached.read_from_file(path, cache=True)
+        self.assertSameNetwork(stnu, cached)
+        # a broken cache is ignored and written again
+        with open(xml_cache_file(path), 'wb') as f:
+            f.write('broken')
+        cached = NamedStnu()
+        cached.read_from_file(path, cache=True)
+        self.assertSameNetwork(stnu, cached)
+        cached = NamedStnu()
+        cached.read_from_binary(xml_cache_file(path))
+        self.assertSameNetwork(stnu, cached)
+        # so is one older than the network
+        with open(path, 'w') as f:
+            f.write('<CCTP></CCTP>')
+        past = os.path.getmtime(path) - 10
+        os.utime(xml_cache_file(path), (past, past))
+        cached = NamedStnu()
+        cached.read_from_file(path, cache=True)
+        self.assertEqual(cached.num_nodes, 0)
+
+    def test_numbering(self):
+        # in order of first appearance, controllable edges first
+        stnu = NamedStnu()
+        stnu.read_from_buffer('2 c a 0 5 b c 1 2 1 d b 0 1')
+        self.assertEqual(stnu._inverse_renaming, {1: 'c', 2: 'a', 3: 'b', 4: 'd'})
+        self.assertEqual([tuple(e) for e in stnu.controllable_edges + stnu.uncontrollable_edges],
+                         [(1, 2, 0.0, 5.0), (3, 1, 1.0, 2.0), (4, 3, 0.0, 1.0)])
+
+    def test_not_binary(self):
+        path = os.path.join(self._dir, 'network.stnu')
+        with open(path, 'wb') as f:
+            f.write('1 a b 0 5 0' + ' ' * 100)
+        self.assertRaises(ValueError, NamedStnu().read_from_file, path)
+
+    def test_invalid(self):
+        # infinite contingent link
+        self.assertRaises(AssertionError, NamedStnu().read_from_buffer, '0 1 a b 1 inf')
+        # two edges from a to b
+        self.assertRaises(AssertionError, NamedStnu().read_from_buffer, '2 a b 1 2 a b 0 5 0')
+        stnu = NamedStnu()
+        stnu.read_from_buffer('0 1 a b 1 2')
+        stnu.uncontrollable_edges = [StnuEdge(1, 2, 1.0, float('inf'))]
+        path = os.path.join(self._dir, 'network.xml')
+        with open(path, 'w') as f:
+            stnu.write_xml(f)
+        self.assertRaises(AssertionError, NamedStnu().read_from_file, path)
+
+
+if __name__ == '__main__':
+    unittest.main()
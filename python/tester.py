@@ -1,9 +1,15 @@
+import sys
+
 from stnu import NamedStnu
 from fast_dc import DcTester
 
 def main():
+    """Checks network given as a file or in parsable format on stdin."""
     network = NamedStnu()
-    network.read_from_stdin()
+    if len(sys.argv) > 1:
+        network.read_from_file(sys.argv[1])
+    else:
+        network.read_from_stdin()
     dc_tester = DcTester(network)
     print 'dc' if dc_tester.is_dynamically_controllable() else 'notdc'
 
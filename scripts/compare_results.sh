@@ -28,13 +28,13 @@ do
                                            --output_type=xml \
                                             > $DIR/xml_input.tmp
         cp $filepath parsable_input.tmp
+        PYTHON_INPUT=parsable_input.tmp
     elif [[ $extension == "xml" ]]
     then
         cp $DIR/$filepath xml_input.tmp
-        python scripts/parser.py --input_file=$filepath \
-                                           --input_type=xml \
-                                           --output_type=parsable \
-                                            > $DIR/parsable_input.tmp
+        # python reads XML directly, telling the format by the extension
+        cp xml_input.tmp xml_input.tmp.xml
+        PYTHON_INPUT=xml_input.tmp.xml
     else
         echo "skipping $fullfilename: unsupported extension"
         continue
@@ -49,7 +49,7 @@ do
         continue
     fi
     if !($TIME -f'%e' \
-        python $DIR/python/tester.py < parsable_input.tmp \
+        python $DIR/python/tester.py $PYTHON_INPUT \
         > python_output.tmp \
         2> python_time.tmp)
     then 
@@ -82,7 +82,7 @@ do
     fi
 done
 # clean up
-for file in {tmp.tmp,xml_input.tmp,parsable_input.tmp,java_output.tmp,python_output.tmp,java_time.tmp,python_time.tmp}
+for file in {tmp.tmp,xml_input.tmp,xml_input.tmp.xml,parsable_input.tmp,java_output.tmp,python_output.tmp,java_time.tmp,python_time.tmp}
 do
     [ -f $file ] && rm $file
 done
\ No newline at end of file